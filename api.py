@@ -1,7 +1,17 @@
-from flask import Flask, request, jsonify
+import os
+import json
+import time
+import atexit
+import threading
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from waitress import serve
 from dotenv import load_dotenv
 from elastic_ingest import create_es_client
 from search import SearchEngine
+from cache import SemanticCache, create_cache
+from retrieval import ElasticsearchBackend, LocalVectorIndex, RETRIEVAL_MODES, FUSION_METHODS, DEFAULT_WEIGHTS, normalize_filters
+from rerank import CrossEncoderReranker
+from metrics import REGISTRY, REQUEST_SECONDS, collect_timings
 import logging
 
 # Configure logging
@@ -16,18 +26,150 @@ app = Flask(__name__)
 # Load environment variables
 load_dotenv()
 
-# Create ES client and SearchEngine as global objects
-es_client = create_es_client()
-if es_client:
-    search_engine = SearchEngine(es_client)
-else:
-    raise RuntimeError("Failed to create Elasticsearch client")
+# Serving limits: request threads, concurrent LLM calls and pooled ES connections
+API_THREADS = int(os.getenv("API_THREADS", "16"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+# Requests queued for an LLM slot beyond this get vector results only, so LLM calls and their
+# waiters hold at most half the request threads and vector-only requests always find one free
+LLM_MAX_WAITERS = int(os.getenv("LLM_MAX_WAITERS", str(max(0, API_THREADS // 2 - LLM_CONCURRENCY))))
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "100"))
+
+# LLM answers are cached in memory by default; set LLM_CACHE_BACKEND=sqlite to persist them
+llm_cache = create_cache(
+    backend=os.getenv("LLM_CACHE_BACKEND", "memory"),
+    path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "1024"))
+)
+
+# Paraphrases of a recent query get its cached response when their embeddings are at least
+# SEMANTIC_CACHE_THRESHOLD cosine similar and they share the same numbers and dates.
+# Off by default; set SEMANTIC_CACHE_SIZE (e.g. 512) to enable it
+semantic_cache_size = int(os.getenv("SEMANTIC_CACHE_SIZE", "0"))
+semantic_cache = SemanticCache(
+    maxsize=semantic_cache_size,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "0")) or None
+) if semantic_cache_size > 0 else None
+
+# Default retrieval mode ("vector" or "hybrid") and fusion method ("rrf" or "weighted");
+# requests can override both along with the fusion weights
+retrieval_defaults = {
+    "retrieval_mode": os.getenv("SEARCH_MODE", "vector"),
+    "fusion": os.getenv("SEARCH_FUSION", "rrf")
+}
+
+# Set RERANKER_MODEL (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2) to rerank RERANK_CANDIDATES
+# retrieved chunks locally before answering
+if os.getenv("RERANKER_MODEL"):
+    retrieval_defaults["reranker"] = CrossEncoderReranker(os.getenv("RERANKER_MODEL"))
+    retrieval_defaults["rerank_candidates"] = int(os.getenv("RERANK_CANDIDATES", "50"))
+
+# The SearchEngine is shared by all request threads. It is created on first use,
+# so importing the app stays fast and only a serving process connects and loads models.
+search_engine = None
+_search_engine_lock = threading.Lock()
+
+def get_search_engine() -> SearchEngine:
+    """Return the shared SearchEngine, creating it on first use
+
+    SEARCH_BACKEND=local serves from the local embedding stores without Elasticsearch.
+    VECTOR_RESCORE_OVERSAMPLE sets how many candidates per result quantized
+    vector search rescores with float vectors.
+    """
+    global search_engine
+    if search_engine is not None:
+        return search_engine
+    with _search_engine_lock:
+        if search_engine is None:
+            oversample = float(os.getenv("VECTOR_RESCORE_OVERSAMPLE", "0")) or None
+            if os.getenv("SEARCH_BACKEND", "elasticsearch") == "local":
+                backend = LocalVectorIndex.from_store(
+                    approximate=os.getenv("LOCAL_INDEX_APPROXIMATE") == "1",
+                    quantization=os.getenv("LOCAL_INDEX_QUANTIZATION") or None,
+                    oversample=oversample
+                )
+                search_engine = SearchEngine(None, llm_cache=llm_cache, llm_concurrency=LLM_CONCURRENCY,
+                                             llm_max_waiters=LLM_MAX_WAITERS, backend=backend,
+                                             semantic_cache=semantic_cache, **retrieval_defaults)
+            else:
+                es_client = create_es_client(connections_per_node=API_THREADS)
+                if not es_client:
+                    raise RuntimeError("Failed to create Elasticsearch client")
+                backend = ElasticsearchBackend(es_client, rescore_oversample=oversample)
+                search_engine = SearchEngine(es_client, llm_cache=llm_cache, llm_concurrency=LLM_CONCURRENCY,
+                                             llm_max_waiters=LLM_MAX_WAITERS, backend=backend,
+                                             semantic_cache=semantic_cache, **retrieval_defaults)
+                # Keep one pooled client for the life of the process
+                atexit.register(es_client.close)
+        return search_engine
+
+def warm_up():
+    """Create the SearchEngine and load its models before the first request needs them"""
+    try:
+        seconds = get_search_engine().warm_up()
+        logging.info(f"Warmed up search models in {seconds:.2f}s")
+    except Exception as e:
+        logging.error(f"Warm-up failed: {str(e)}")
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Record request latency by endpoint; streamed responses are timed until their headers are sent"""
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - g.start_time,
+        endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+        status=response.status_code
+    )
+    return response
+
+def retrieval_options(data):
+    """Read and validate the optional mode, fusion, weights, rerank and filters fields of a request body"""
+    mode = data.get('mode')
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise ValueError(f'Unknown mode {mode!r}, expected one of {list(RETRIEVAL_MODES)}')
+    
+    fusion = data.get('fusion')
+    if fusion is not None and fusion not in FUSION_METHODS:
+        raise ValueError(f'Unknown fusion {fusion!r}, expected one of {list(FUSION_METHODS)}')
+    
+    weights = data.get('weights')
+    if weights is not None:
+        if not isinstance(weights, dict) or set(weights) - set(DEFAULT_WEIGHTS):
+            raise ValueError(f'weights must be an object with keys {list(DEFAULT_WEIGHTS)}')
+        try:
+            weights = {name: float(weight) for name, weight in weights.items()}
+        except (TypeError, ValueError):
+            raise ValueError('weights must be numbers')
+    
+    rerank = data.get('rerank')
+    if rerank and get_search_engine().reranker is None:
+        raise ValueError('Reranking is not enabled on this server')
+    
+    filters = normalize_filters(data.get('filters'))
+    
+    return {'mode': mode, 'fusion': fusion, 'weights': weights, 'rerank': rerank, 'filters': filters}
+
+def bool_option(data, name, default=True):
+    """Read an optional true/false field of a request body, e.g. "llm" or "cache" """
+    value = data.get(name, default)
+    if not isinstance(value, bool):
+        raise ValueError(f'{name} must be true or false')
+    return value
 
 @app.route('/search', methods=['POST'])
 def search():
     """
     Search endpoint that accepts JSON queries
-    Request body format: {"query": "your search query"}
+    Request body format: {"query": "your search query", "llm": true}
+    Set "llm" to false for vector results only
+    Optional retrieval fields: "mode" ("vector" or "hybrid"), "fusion" ("rrf" or "weighted"),
+    "weights" ({"bm25": 1.0, "vector": 1.0}), "rerank" (false to skip the reranker) and
+    "filters" ({"form_type": "10-K", "fiscal_year": 2023, "filed_after": "2023-01-01", ...})
+    Set "cache" to false to skip the semantic cache lookup and refresh its entry
+    Set "timings" to true to add the seconds spent in each search stage to the response
     """
     try:
         # Get query from request body
@@ -40,8 +182,19 @@ def search():
             
         query = data['query']
         
+        try:
+            options = retrieval_options(data)
+            use_cache = bool_option(data, 'cache')
+            with_llm = bool_option(data, 'llm')
+        except ValueError as e:
+            return jsonify({
+                'error': str(e)
+            }), 400
+        
         # Perform search
-        search_results = search_engine.search(query)
+        with collect_timings() as timings:
+            search_results = get_search_engine().search(query, with_llm=with_llm,
+                                                        use_cache=use_cache, **options)
         
         # Format response
         response = {
@@ -50,12 +203,27 @@ def search():
                     'score': result['score'],
                     'file_name': result['file_name'],
                     'chunk_index': result['chunk_index'],
-                    'content': result['content']
+                    'page_start': result.get('page_start'),
+                    'page_end': result.get('page_end'),
+                    'form_type': result.get('form_type'),
+                    'fiscal_year': result.get('fiscal_year'),
+                    'fiscal_period': result.get('fiscal_period'),
+                    'filing_date': result.get('filing_date'),
+                    'content': result['content'],
+                    # Present when the results were reranked
+                    **({'retrieval_score': result['retrieval_score']} if 'retrieval_score' in result else {})
                 }
                 for result in search_results['vector_results']
             ],
-            'llm_analysis': search_results['llm_analysis']
+            'llm_analysis': search_results['llm_analysis'],
+            # "ok", "skipped" when the LLM was too busy, "failed", or null when no analysis was made
+            'llm_status': search_results.get('llm_status')
         }
+        # Present when the response was served from the semantic cache
+        if 'semantic_cache' in search_results:
+            response['semantic_cache'] = search_results['semantic_cache']
+        if data.get('timings'):
+            response['timings'] = {stage: round(seconds, 6) for stage, seconds in timings.items()}
         
         return jsonify(response)
         
@@ -66,10 +234,115 @@ def search():
             'message': str(e)
         }), 500
 
-@app.teardown_appcontext
-def cleanup(exc):
-    """Clean up resources when the app context ends"""
-    es_client.close()
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Batch search endpoint
+    Request body format: {"queries": ["query one", "query two"], "k": 5, "llm": true}
+    Accepts the same optional retrieval fields as /search
+    Returns {"results": [...]} in input order; failed queries carry an "error",
+    and each answered query an "llm_status" as in /search
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('queries'), list):
+            return jsonify({
+                'error': 'Missing queries list in request body'
+            }), 400
+        
+        queries = data['queries']
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({
+                'error': f'Too many queries, the limit is {MAX_BATCH_QUERIES}'
+            }), 400
+        
+        try:
+            options = retrieval_options(data)
+            k = data.get('k', 5)
+            if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+                raise ValueError('k must be a positive integer')
+            with_llm = bool_option(data, 'llm')
+        except ValueError as e:
+            return jsonify({
+                'error': str(e)
+            }), 400
+        
+        # Malformed entries fail on their own; the rest of the batch is still searched
+        valid = [i for i, query in enumerate(queries) if isinstance(query, str) and query.strip()]
+        search_results = get_search_engine().search_many(
+            [queries[i] for i in valid],
+            k=k,
+            with_llm=with_llm,
+            **options
+        ) if valid else []
+        results = [{'error': 'Query must be a non-empty string'} for _ in queries]
+        for i, result in zip(valid, search_results):
+            results[i] = result
+        
+        return jsonify({'results': results})
+        
+    except Exception as e:
+        logging.error(f"Batch search error: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """
+    Streaming search endpoint using server-sent events
+    Request body format: {"query": "your search query"}
+    Accepts the same optional retrieval and cache fields as /search
+    Sends a vector_results event first, then token events as the LLM
+    generates its answer, then a done event with the full llm_analysis;
+    an error event before done means the answer was cut short
+    """
+    data = request.get_json(silent=True)
+    
+    if not data or 'query' not in data:
+        return jsonify({
+            'error': 'Missing query in request body'
+        }), 400
+    
+    query = data['query']
+    
+    try:
+        options = retrieval_options(data)
+        use_cache = bool_option(data, 'cache')
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    
+    def generate():
+        try:
+            for event in get_search_engine().search_stream(query, use_cache=use_cache, **options):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            logging.error(f"Search stream error: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Internal server error', 'message': str(e)})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Search stage latencies, cache hits and LLM usage in the Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Load models in the background while the server starts; requests that arrive
+    # first wait for them. Set MODEL_WARMUP=0 to load on the first request instead.
+    if os.getenv("MODEL_WARMUP", "1") == "1":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    serve(
+        app,
+        host=os.getenv("API_HOST", "127.0.0.1"),
+        port=int(os.getenv("API_PORT", "5000")),
+        threads=API_THREADS
+    )
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+import embeddings
+from cache import LRUCache
+from elastic_ingest import ElasticsearchIngestor
+from manifest import Manifest, file_hash
+from models import register_embedding_model
+from retrieval import LocalVectorIndex, QUANTIZATION_METHODS
+from search import SearchEngine
+from stubs import HashingEncoder, StubInferenceClient, create_stub_es_client, write_synthetic_filings, FILING_TERMS
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+# The stub cluster answers thousands of requests; skip the per-request transport logs
+logging.getLogger("elastic_transport").setLevel(logging.WARNING)
+
+def latency_summary(latencies: Sequence[float], elapsed: float) -> Dict:
+    """Summarize request latencies (seconds) into percentiles in milliseconds and throughput"""
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(latencies.mean()), 3) if len(latencies) else 0.0,
+        "max_ms": round(float(latencies.max()), 3) if len(latencies) else 0.0,
+        "qps": round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    }
+
+def bench_extraction(pdf_paths: List[str]) -> tuple:
+    """Measure read_pdf and create_chunks throughput, returning the results and each file's chunks"""
+    start = time.perf_counter()
+    texts = [embeddings.read_pdf(path) for path in pdf_paths]
+    read_seconds = time.perf_counter() - start
+    pdf_mb = sum(os.path.getsize(path) for path in pdf_paths) / 1e6
+    text_mb = sum(len(text.encode('utf-8')) for text in texts) / 1e6
+
+    start = time.perf_counter()
+    chunks = [embeddings.create_chunks(text) for text in texts]
+    chunk_seconds = time.perf_counter() - start
+    num_chunks = sum(len(c) for c in chunks)
+
+    return {
+        "read_pdf": {
+            "files": len(pdf_paths),
+            "seconds": round(read_seconds, 4),
+            "files_per_second": round(len(pdf_paths) / read_seconds, 2),
+            "pdf_mb_per_second": round(pdf_mb / read_seconds, 3)
+        },
+        "create_chunks": {
+            "chunks": num_chunks,
+            "seconds": round(chunk_seconds, 4),
+            "chunks_per_second": round(num_chunks / chunk_seconds, 2) if chunk_seconds else None,
+            "text_mb_per_second": round(text_mb / chunk_seconds, 3) if chunk_seconds else None
+        }
+    }, chunks
+
+def bench_embeddings(chunks: List[str], batch_size: int) -> Dict:
+    """Measure embeddings per second with the registered embedding model"""
+    start = time.perf_counter()
+    embeddings.get_embeddings(chunks, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+    return {
+        "chunks": len(chunks),
+        "batch_size": batch_size,
+        "seconds": round(seconds, 4),
+        "embeddings_per_second": round(len(chunks) / seconds, 2)
+    }
+
+def bench_ingest(pdf_paths: List[str], chunks: List[List[Dict]], es_client, batch_size: int) -> Dict:
+    """Embed the corpus into stores, then measure bulk ingest into Elasticsearch
+
+    Runs in the benchmark workspace, where the embeddings directory is relative.
+    """
+    embeddings_dir = "tesla_sec_filings_embeddings"
+    os.makedirs(embeddings_dir, exist_ok=True)
+    manifest = Manifest(embeddings_dir)
+    filings = [
+        (os.path.basename(path), file_chunks, file_hash(path))
+        for path, file_chunks in zip(pdf_paths, chunks)
+    ]
+    start = time.perf_counter()
+    embeddings.embed_filings(filings, embeddings_dir, batch_size=batch_size, manifest=manifest)
+    embed_seconds = time.perf_counter() - start
+
+    ingestor = ElasticsearchIngestor(es_client)
+    start = time.perf_counter()
+    ingestor.ingest_embeddings(rebuild=True)
+    ingest_seconds = time.perf_counter() - start
+
+    docs = sum(len(file_chunks) for file_chunks in chunks)
+    return {
+        "docs": docs,
+        "embed_and_store_seconds": round(embed_seconds, 4),
+        "ingest_seconds": round(ingest_seconds, 4),
+        "ingest_docs_per_second": round(docs / ingest_seconds, 2)
+    }
+
+def synthetic_queries(count: int, seed: int) -> List[str]:
+    """Generate distinct filing-like queries"""
+    rng = random.Random(seed)
+    return [f"{' '.join(rng.choices(FILING_TERMS, k=rng.randint(3, 6)))} {i}" for i in range(count)]
+
+def bench_search(engine: SearchEngine, queries: List[str], concurrency_levels: Sequence[int],
+                 **search_kwargs) -> Dict:
+    """Measure search latency percentiles and QPS at each concurrency level"""
+    def timed_search(query):
+        start = time.perf_counter()
+        engine.search(query, **search_kwargs)
+        return time.perf_counter() - start
+
+    results = {}
+    for concurrency in concurrency_levels:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Warm up the connection pool and any lazy index structures
+            list(executor.map(timed_search, queries[:concurrency]))
+            start = time.perf_counter()
+            latencies = list(executor.map(timed_search, queries))
+            elapsed = time.perf_counter() - start
+        results[str(concurrency)] = latency_summary(latencies, elapsed)
+    return results
+
+def synthetic_vectors(count: int, dims: int = 384, clusters: int = 100, spread: float = 1.0,
+                      seed: int = 0) -> np.ndarray:
+    """Generate count unit vectors in random Gaussian clusters, a stand-in for a larger embedded corpus"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dims))
+    vectors = centers[rng.integers(0, clusters, count)] + rng.normal(scale=spread, size=(count, dims))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def bench_quantization(segments: List[tuple], query_vectors: np.ndarray, k: int = 10,
+                       oversample: Optional[float] = None) -> Dict:
+    """Compare int8 and binary local search with rescoring against exact float search
+
+    Reports recall@k against the float results, search latency and the
+    bytes of vector data each search scans.
+    """
+    exact = LocalVectorIndex(segments)
+    def keys(results):
+        return {(r['file_name'], r['chunk_index']) for r in results}
+    truth = [keys(exact.search(query_vector, k)) for query_vector in query_vectors]
+
+    results = {}
+    for quantization in (None,) + QUANTIZATION_METHODS:
+        index = exact if quantization is None else LocalVectorIndex(segments, quantization=quantization,
+                                                                    oversample=oversample)
+        latencies = []
+        recalls = []
+        started = time.perf_counter()
+        for query_vector, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            found = index.search(query_vector, k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(keys(found) & expected) / len(expected) if expected else 1.0)
+        elapsed = time.perf_counter() - started
+        results[quantization or "float"] = {
+            "recall_at_k": round(float(np.mean(recalls)), 4),
+            "oversample": index.oversample,
+            "vector_bytes": index.vector_bytes(),
+            "bytes_per_vector": round(index.vector_bytes() / len(index), 2),
+            **latency_summary(latencies, elapsed)
+        }
+    return {"vectors": len(exact), "k": k, "queries": len(query_vectors), "methods": results}
+
+def git_commit() -> Optional[str]:
+    """Return the current git commit, if the benchmark runs from a checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmark(num_filings: int = 20, pages_per_filing: int = 10, concurrency_levels: Sequence[int] = (1, 4, 16),
+                  requests: int = 200, batch_size: int = 64, es_latency: float = 0.002,
+                  llm_latency: float = 0.05, model_name: Optional[str] = None, seed: int = 0,
+                  pdf_dir: Optional[str] = None, quantization_vectors: int = 0) -> Dict:
+    """Run the offline benchmark suite and return its results
+
+    The corpus is synthetic (or the PDFs in pdf_dir), Elasticsearch and the
+    LLM are in-process stubs with the given per-request latencies, and
+    embeddings use a hashing encoder unless model_name names a
+    SentenceTransformer model. Quantized local search is compared with float
+    search on the corpus and, if quantization_vectors is set, on that many
+    clustered synthetic vectors.
+    """
+    params = {
+        "num_filings": num_filings, "pages_per_filing": pages_per_filing,
+        "concurrency_levels": list(concurrency_levels), "requests": requests, "batch_size": batch_size,
+        "es_latency": es_latency, "llm_latency": llm_latency, "model": model_name or "hashing", "seed": seed,
+        "pdf_dir": pdf_dir, "quantization_vectors": quantization_vectors
+    }
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(model_name)
+    else:
+        encoder = HashingEncoder()
+    register_embedding_model(encoder)
+
+    workspace = tempfile.mkdtemp(prefix="rag-benchmark-")
+    original_cwd = os.getcwd()
+    try:
+        os.chdir(workspace)
+        if pdf_dir:
+            pdf_paths = sorted(
+                os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith('.pdf')
+            )[:num_filings]
+        else:
+            os.makedirs("tesla_sec_filings")
+            pdf_paths = write_synthetic_filings("tesla_sec_filings", num_filings, pages_per_filing, seed=seed)
+
+        results = {}
+        logging.info(f"Benchmarking extraction of {len(pdf_paths)} filings")
+        results["extraction"], chunks = bench_extraction(pdf_paths)
+
+        all_chunks = [chunk["content"] for file_chunks in chunks for chunk in file_chunks]
+        logging.info(f"Benchmarking embedding of {len(all_chunks)} chunks")
+        results["embeddings"] = bench_embeddings(all_chunks, batch_size)
+
+        es_client = create_stub_es_client(latency=es_latency, connections_per_node=max(concurrency_levels))
+        logging.info("Benchmarking ingest")
+        results["ingest"] = bench_ingest(pdf_paths, chunks, es_client, batch_size)
+
+        logging.info("Benchmarking quantized vector search")
+        query_vectors = np.asarray(encoder.encode(synthetic_queries(min(requests, 100), seed + 1),
+                                                  normalize_embeddings=True), dtype=np.float32)
+        store = LocalVectorIndex.from_store("tesla_sec_filings_embeddings")
+        results["quantization"] = {"corpus": bench_quantization(store.segments, query_vectors)}
+        if quantization_vectors:
+            # Queries come from the same clusters as the vectors
+            vectors = synthetic_vectors(quantization_vectors + len(query_vectors), seed=seed)
+            vectors, synthetic_query_vectors = vectors[:quantization_vectors], vectors[quantization_vectors:]
+            metadata = [{"content": "", "file_name": "synthetic", "chunk_index": i} for i in range(len(vectors))]
+            results["quantization"]["synthetic"] = bench_quantization([(vectors, metadata)], synthetic_query_vectors)
+
+        # Caches are disabled so every request takes the full path
+        engine = SearchEngine(
+            es_client, model=encoder, llm_client=StubInferenceClient(latency=llm_latency),
+            query_cache_size=0, llm_cache=LRUCache(maxsize=0)
+        )
+        queries = synthetic_queries(requests, seed)
+        results["search"] = {}
+        for scenario, kwargs in {
+            "vector": {"with_llm": False},
+            "hybrid": {"with_llm": False, "mode": "hybrid"},
+            "vector_llm": {"with_llm": True}
+        }.items():
+            logging.info(f"Benchmarking {scenario} search")
+            results["search"][scenario] = bench_search(engine, queries, concurrency_levels, **kwargs)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "params": params
+        },
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingest and search benchmark")
+    parser.add_argument("--filings", type=int, default=20, help="Number of synthetic filings")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic filing")
+    parser.add_argument("--pdf-dir", help="Benchmark these PDFs instead of a synthetic corpus")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated search concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Search requests per concurrency level")
+    parser.add_argument("--batch-size", type=int, default=64, help="Embedding batch size")
+    parser.add_argument("--es-latency", type=float, default=0.002, help="Simulated ES round trip in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Simulated LLM call latency in seconds")
+    parser.add_argument("--model", help="SentenceTransformer model to embed with instead of the hashing encoder")
+    parser.add_argument("--quant-vectors", type=int, default=0,
+                        help="Also compare quantized search on this many synthetic vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        num_filings=args.filings,
+        pages_per_filing=args.pages,
+        concurrency_levels=[int(c) for c in args.concurrency.split(',')],
+        requests=args.requests,
+        batch_size=args.batch_size,
+        es_latency=args.es_latency,
+        llm_latency=args.llm_latency,
+        model_name=args.model,
+        seed=args.seed,
+        pdf_dir=os.path.abspath(args.pdf_dir) if args.pdf_dir else None,
+        quantization_vectors=args.quant_vectors
+    )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        logging.info(f"Wrote benchmark results to {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import json
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+import numpy as np
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with optional TTL and hit/miss counters"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SemanticCache:
+    """Thread-safe in-memory cache of values keyed by query embeddings
+
+    A lookup hits when a stored entry with the same scope has an embedding
+    within threshold cosine similarity of the query's, so paraphrased
+    queries share an entry. Callers put whatever must match exactly, such
+    as query_literals(), in the scope. Embeddings must be normalized. Entries live in
+    a fixed-size matrix scanned on every lookup; when it is full the least
+    recently used entry is replaced.
+    """
+
+    def __init__(self, maxsize: int = 512, threshold: float = 0.95, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None  # allocated on the first put, once the dimension is known
+        self._scopes = [None] * maxsize
+        self._values = [None] * maxsize
+        self._expires_at = [None] * maxsize
+        self._used_at = np.zeros(maxsize, dtype=np.int64)  # 0 marks a free slot
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def _best(self, embedding: np.ndarray, scope: Hashable) -> Tuple[int, float]:
+        """Return the live slot of scope most similar to embedding and their similarity, or (-1, -inf)"""
+        if self._vectors is None or self._vectors.shape[1] != len(embedding):
+            return -1, float("-inf")
+        similarities = self._vectors @ embedding
+        now = time.monotonic()
+        best, best_similarity = -1, float("-inf")
+        for slot in np.flatnonzero(self._used_at):
+            if self._scopes[slot] != scope:
+                continue
+            expires_at = self._expires_at[slot]
+            if expires_at is not None and expires_at <= now:
+                self._free(slot)
+            elif similarities[slot] > best_similarity:
+                best, best_similarity = int(slot), float(similarities[slot])
+        return best, best_similarity
+
+    def _free(self, slot: int) -> None:
+        self._used_at[slot] = 0
+        self._scopes[slot] = None
+        self._values[slot] = None
+
+    def lookup(self, embedding: np.ndarray, scope: Hashable = None) -> Tuple[Optional[Any], float]:
+        """Return the value cached for the closest embedding within threshold, and its similarity
+
+        Returns (None, best similarity) on a miss.
+        """
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            slot, similarity = self._best(embedding, scope)
+            if slot >= 0 and similarity >= self.threshold:
+                self._clock += 1
+                self._used_at[slot] = self._clock
+                self.hits += 1
+                return self._values[slot], similarity
+            self.misses += 1
+            return None, similarity
+
+    def get(self, embedding: np.ndarray, scope: Hashable = None) -> Optional[Any]:
+        """Return the value cached for the closest embedding within threshold, or None on a miss"""
+        return self.lookup(embedding, scope)[0]
+
+    def put(self, embedding: np.ndarray, value: Any, scope: Hashable = None) -> None:
+        """Store value under embedding, replacing an entry within threshold or the least recently used one"""
+        if self.maxsize <= 0:
+            return
+        embedding = np.asarray(embedding, dtype=np.float32)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(embedding):
+                self._vectors = np.zeros((self.maxsize, len(embedding)), dtype=np.float32)
+                self._used_at[:] = 0
+            slot, similarity = self._best(embedding, scope)
+            if slot < 0 or similarity < self.threshold:
+                # A free slot has the smallest used_at, so this fills free slots first
+                slot = int(np.argmin(self._used_at))
+            self._clock += 1
+            self._vectors[slot] = embedding
+            self._scopes[slot] = scope
+            self._values[slot] = value
+            self._expires_at[slot] = expires_at
+            self._used_at[slot] = self._clock
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            for slot in np.flatnonzero(self._used_at):
+                self._free(slot)
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            return {
+                "size": int(np.count_nonzero(self._used_at)), "maxsize": self.maxsize,
+                "threshold": self.threshold, "hits": self.hits, "misses": self.misses
+            }
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._used_at))
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for use in cache keys"""
+    return " ".join(query.lower().split())
+
+# Numbers, quarters and month names: the parts of a query that embeddings barely separate
+# ("revenue 2023" vs "revenue 2024") but that change the answer
+LITERAL_PATTERN = re.compile(
+    r'\d[\d,.]*|\bq[1-4]\b|\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?'
+    r'|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b'
+)
+
+def query_literals(query: str) -> tuple:
+    """Return the sorted numeric and date tokens of a query, e.g. ("2024", "q3")"""
+    tokens = (token[:3] if token.isalpha() else token.replace(',', '').rstrip('.')
+              for token in LITERAL_PATTERN.findall(normalize_query(query)))
+    return tuple(sorted(set(tokens)))
+
+class SQLiteCache:
+    """On-disk LRU cache backed by SQLite, with the same interface as LRUCache
+
+    Values must be JSON serializable. Entries survive process restarts.
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value, expires_at = row
+                if expires_at is None or expires_at > now:
+                    self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return json.loads(value)
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries"""
+        if self.maxsize <= 0:
+            return
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now)
+            )
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)
+            )
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return {"size": size, "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return self.stats()["size"]
+
+def create_cache(backend: str = "memory", path: Optional[str] = None,
+                 maxsize: int = 1024, ttl: Optional[float] = None):
+    """Create a cache backend by name ("memory" or "sqlite")"""
+    if backend == "memory":
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("The sqlite cache backend needs a path")
+        return SQLiteCache(path, maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+def make_key(*parts: Any) -> str:
+    """Build a stable string cache key from JSON-serializable parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
@@ -0,0 +1,188 @@
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+from context import TokenCounter
+
+# Tokenizer of the embedding model, used to size chunks to its input limit
+EMBEDDING_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Section headings of 10-K/10-Q filings, e.g. "Item 7.", "PART II", "Note 12"
+HEADING_PATTERN = re.compile(r'^(item\s+\d+[a-z]?\b|part\s+[ivx]+\b|note\s+\d+\b)', re.IGNORECASE)
+# Sentence ends: terminal punctuation, optional closing quotes or brackets, then whitespace
+# before something that can start a sentence
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?])["\')\]]*\s+(?=[A-Z0-9"(\[$])')
+NUMBER_PATTERN = re.compile(r'^[(\-$]*[\d,.]+%?\)?$')
+
+class _Unit(NamedTuple):
+    """An unsplittable piece of a page: a sentence, a table row or a heading"""
+    text: str
+    page: int
+    start: int
+    end: int
+    kind: str
+    tokens: int
+
+def _is_heading(line: str) -> bool:
+    if HEADING_PATTERN.match(line):
+        return True
+    words = line.split()
+    return 0 < len(words) <= 10 and line.isupper() and any(c.isalpha() for c in line)
+
+def _is_table_row(line: str) -> bool:
+    """Treat lines that are mostly figures as table rows"""
+    words = line.split()
+    numbers = sum(1 for word in words if NUMBER_PATTERN.match(word))
+    return numbers >= 3 and numbers >= len(words) / 3
+
+class Chunker:
+    """Split page texts into chunks sized in embedding model tokens
+
+    Pages are broken into headings, table rows and sentences, which are
+    packed into chunks of at most chunk_tokens tokens without splitting
+    them. Each new chunk repeats up to overlap_tokens of trailing sentences
+    from the previous one, except at a section heading, which always
+    starts a new chunk. A single sentence or row longer than chunk_tokens
+    is split at word boundaries.
+
+    Chunks are dicts with content, page_start, char_start, page_end and
+    char_end. Pages are numbered from 1 and character offsets are into the
+    text of those pages.
+    """
+
+    def __init__(self, chunk_tokens: int = 240, overlap_tokens: int = 40,
+                 token_counter: Optional[TokenCounter] = None):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.token_counter = token_counter or TokenCounter(EMBEDDING_TOKENIZER)
+
+    @property
+    def signature(self) -> str:
+        """Identify the chunking configuration, so filings are re-chunked when it changes"""
+        return f"tokens-v1:{self.token_counter.model_name}:{self.chunk_tokens}:{self.overlap_tokens}"
+
+    def _unit(self, page_text: str, page: int, start: int, end: int, kind: str) -> _Unit:
+        # Trim the span itself so the offsets cover exactly the unit's text
+        while start < end and page_text[start].isspace():
+            start += 1
+        while end > start and page_text[end - 1].isspace():
+            end -= 1
+        text = page_text[start:end].replace('\n', ' ')
+        return _Unit(text, page, start, end, kind, self.token_counter.count(text))
+
+    def _sentences(self, page_text: str, page: int, start: int, end: int) -> Iterator[_Unit]:
+        """Split a paragraph span into sentence units"""
+        paragraph = page_text[start:end].replace('\n', ' ')
+        position = 0
+        for match in SENTENCE_END_PATTERN.finditer(paragraph):
+            yield self._unit(page_text, page, start + position, start + match.start(), "sentence")
+            position = match.end()
+        if paragraph[position:].strip():
+            yield self._unit(page_text, page, start + position, end, "sentence")
+
+    def _page_units(self, page_text: str, page: int) -> Iterator[_Unit]:
+        """Break one page into heading, table row and sentence units"""
+        paragraph = None
+        previous_end = 0
+        for line in re.finditer(r'[^\n]+', page_text):
+            text = line.group().strip()
+            if not text:
+                continue
+            # A blank line between two lines ends the paragraph
+            blank_line = page_text.count('\n', previous_end, line.start()) > 1
+            previous_end = line.end()
+
+            if _is_heading(text) or _is_table_row(text) or blank_line:
+                if paragraph:
+                    yield from self._sentences(page_text, page, *paragraph)
+                    paragraph = None
+            if _is_heading(text):
+                yield self._unit(page_text, page, line.start(), line.end(), "heading")
+            elif _is_table_row(text):
+                yield self._unit(page_text, page, line.start(), line.end(), "table")
+            elif paragraph:
+                paragraph = (paragraph[0], line.end())
+            else:
+                paragraph = (line.start(), line.end())
+        if paragraph:
+            yield from self._sentences(page_text, page, *paragraph)
+
+    def _split_long(self, unit: _Unit, first_budget: int) -> List[_Unit]:
+        """Split a unit longer than chunk_tokens into overlapping word windows
+
+        The first window fits in first_budget tokens, the rest in chunk_tokens.
+        """
+        words = [(m.start(), m.end()) for m in re.finditer(r'\S+', unit.text)]
+        tokens_per_word = unit.tokens / len(words)
+        overlap_words = int(self.overlap_tokens / tokens_per_word)
+        pieces = []
+        first = 0
+        budget = first_budget
+        while first < len(words):
+            size = max(1, int(budget / tokens_per_word))
+            while True:
+                start, end = words[first][0], words[min(first + size, len(words)) - 1][1]
+                text = unit.text[start:end]
+                tokens = self.token_counter.count(text)
+                if tokens <= budget or size == 1:
+                    break
+                size = max(1, min(size - 1, int(size * budget / tokens)))
+            pieces.append(_Unit(text, unit.page, unit.start + start, unit.start + end, unit.kind, tokens))
+            if first + size >= len(words):
+                break
+            first += max(1, size - overlap_words)
+            budget = self.chunk_tokens
+        return pieces
+
+    @staticmethod
+    def _chunk(units: List[_Unit]) -> Dict:
+        return {
+            "content": ' '.join(unit.text for unit in units),
+            "page_start": units[0].page,
+            "char_start": units[0].start,
+            "page_end": units[-1].page,
+            "char_end": units[-1].end
+        }
+
+    def iter_chunks(self, pages: Iterable[str]) -> Iterator[Dict]:
+        """Yield chunks from an iterable of page texts as soon as each one is full"""
+        current: List[_Unit] = []
+        current_tokens = 0
+        fresh = 0  # units in current that are not overlap from the previous chunk
+
+        for page, page_text in enumerate(pages, 1):
+            for unit in self._page_units(page_text or "", page):
+                if not unit.text:
+                    continue
+                if unit.kind == "heading" and fresh and current[-1].kind != "heading":
+                    # A new section starts a new chunk without overlap
+                    yield self._chunk(current)
+                    current, current_tokens, fresh = [], 0, 0
+
+                if unit.tokens > self.chunk_tokens:
+                    # Fill the current chunk with the start of the unit if there is a useful amount of room
+                    room = self.chunk_tokens - current_tokens
+                    pieces = self._split_long(unit, room if room >= self.overlap_tokens else self.chunk_tokens)
+                else:
+                    pieces = [unit]
+
+                for piece in pieces:
+                    if current and current_tokens + piece.tokens > self.chunk_tokens:
+                        if fresh:
+                            yield self._chunk(current)
+                        # Carry trailing units into the next chunk as overlap
+                        overlap = []
+                        overlap_tokens = 0
+                        for previous in reversed(current[1:]):
+                            overlap_tokens += previous.tokens
+                            if overlap_tokens > self.overlap_tokens or overlap_tokens + piece.tokens > self.chunk_tokens:
+                                overlap_tokens -= previous.tokens
+                                break
+                            overlap.insert(0, previous)
+                        current, current_tokens, fresh = overlap, overlap_tokens, 0
+                    current.append(piece)
+                    current_tokens += piece.tokens
+                    fresh += 1
+
+        if fresh:
+            yield self._chunk(current)
@@ -0,0 +1,200 @@
+import re
+import math
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Tokenizers loaded in this process by model name, shared by all TokenCounters
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+class TokenCounter:
+    """Count and truncate text in a model's tokens
+
+    The model's tokenizer is loaded on first use (requires transformers).
+    If it cannot be loaded, tokens are estimated at chars_per_token
+    characters each.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, chars_per_token: float = 4.0):
+        self.model_name = model_name
+        self.chars_per_token = chars_per_token
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                if self.model_name:
+                    with _tokenizers_lock:
+                        if self.model_name not in _tokenizers:
+                            try:
+                                from transformers import AutoTokenizer
+                                _tokenizers[self.model_name] = AutoTokenizer.from_pretrained(self.model_name)
+                            except Exception as e:
+                                logging.warning(f"Could not load tokenizer for {self.model_name}, estimating tokens: {str(e)}")
+                                _tokenizers[self.model_name] = None
+                        self._tokenizer = _tokenizers[self.model_name]
+            return self._tokenizer
+
+    def __getstate__(self):
+        # Send only the configuration to worker processes; each loads the tokenizer once
+        return {"model_name": self.model_name, "chars_per_token": self.chars_per_token}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens in text"""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the longest prefix of text that fits in max_tokens"""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            ids = tokenizer.encode(text, add_special_tokens=False)
+            return text if len(ids) <= max_tokens else tokenizer.decode(ids[:max_tokens])
+        max_chars = int(max_tokens * self.chars_per_token)
+        if len(text) <= max_chars:
+            return text
+        # Cut at the last word boundary that fits
+        cut = text.rfind(' ', 0, max_chars + 1)
+        return text[:cut if cut > 0 else max_chars]
+
+def _shingles(text: str, size: int = 3) -> set:
+    """Return the set of lowercased word n-grams of a text"""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _join_overlapping(first: str, second: str, max_overlap: int = 400) -> str:
+    """Join two adjacent chunks, dropping words the second repeats from the end of the first"""
+    first_words, second_words = first.split(), second.split()
+    for n in range(min(len(first_words), len(second_words), max_overlap), 0, -1):
+        if first_words[-n:] == second_words[:n]:
+            return ' '.join(first_words + second_words[n:])
+    return ' '.join(first_words + second_words)
+
+class ContextBuilder:
+    """Build the document context of an LLM prompt within a token budget
+
+    Retrieved chunks are turned into passages:
+    1. adjacent chunk_index hits from the same filing are merged into one passage,
+    2. passages whose word 3-grams are at least dedup_threshold covered by
+       better ranked passages are dropped as near-duplicates,
+    3. passages are added best ranked first until max_tokens is reached; the
+       first passage that does not fit is truncated if at least
+       min_passage_tokens remain.
+    """
+
+    def __init__(self, token_counter: Optional[TokenCounter] = None, max_tokens: int = 2048,
+                 dedup_threshold: float = 0.8, min_passage_tokens: int = 64):
+        self.token_counter = token_counter or TokenCounter()
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.min_passage_tokens = min_passage_tokens
+
+    def _merge_adjacent(self, results: List[Dict]) -> List[Dict]:
+        """Merge consecutive chunks of the same filing, keeping each passage's best rank and score"""
+        by_file = {}
+        for rank, result in enumerate(results):
+            by_file.setdefault(result['file_name'], []).append((rank, result))
+
+        passages = []
+        for file_name, hits in by_file.items():
+            hits.sort(key=lambda hit: hit[1]['chunk_index'])
+            current = None
+            for rank, result in hits:
+                if current is not None and result['chunk_index'] == current['chunk_indices'][-1] + 1:
+                    current['content'] = _join_overlapping(current['content'], result['content'])
+                    current['chunk_indices'].append(result['chunk_index'])
+                    current['rank'] = min(current['rank'], rank)
+                    current['score'] = max(current['score'], result['score'])
+                elif current is None or result['chunk_index'] != current['chunk_indices'][-1]:
+                    current = {
+                        'file_name': file_name,
+                        'chunk_indices': [result['chunk_index']],
+                        'content': result['content'],
+                        'rank': rank,
+                        'score': result['score']
+                    }
+                    passages.append(current)
+        return sorted(passages, key=lambda passage: passage['rank'])
+
+    def _drop_duplicates(self, passages: List[Dict]) -> List[Dict]:
+        """Drop passages whose content is mostly already in better ranked passages"""
+        kept = []
+        seen = set()
+        for passage in passages:
+            shingles = _shingles(passage['content'])
+            if shingles and len(shingles & seen) / len(shingles) >= self.dedup_threshold:
+                continue
+            kept.append(passage)
+            seen |= shingles
+        return kept
+
+    def build(self, results: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """Return the passages to put in the prompt and token statistics
+
+        Each passage has file_name, chunk_indices, content and tokens. The
+        statistics report tokens_in (all retrieved chunks verbatim),
+        tokens_sent, tokens_saved and how many chunks were merged,
+        deduplicated and truncated or dropped for the budget.
+        """
+        count = self.token_counter.count
+        tokens_in = sum(count(result['content']) for result in results)
+
+        merged = self._merge_adjacent(results)
+        unique = self._drop_duplicates(merged)
+
+        passages = []
+        remaining = self.max_tokens
+        truncated = 0
+        for passage in unique:
+            tokens = count(passage['content'])
+            if tokens > remaining:
+                if remaining < self.min_passage_tokens:
+                    break
+                passage['content'] = self.token_counter.truncate(passage['content'], remaining)
+                tokens = count(passage['content'])
+                truncated += 1
+            passage['tokens'] = tokens
+            passages.append(passage)
+            remaining -= tokens
+            if remaining <= 0:
+                break
+
+        tokens_sent = sum(passage['tokens'] for passage in passages)
+        stats = {
+            'chunks': len(results),
+            'passages': len(passages),
+            'merged': len(results) - len(merged),
+            'duplicates': len(merged) - len(unique),
+            'truncated': truncated,
+            'dropped': len(unique) - len(passages),
+            'tokens_in': tokens_in,
+            'tokens_sent': tokens_sent,
+            'tokens_saved': max(tokens_in - tokens_sent, 0)
+        }
+        return passages, stats
+
+def format_documents(passages: List[Dict]) -> str:
+    """Format passages as numbered documents labelled with their filing and chunks"""
+    documents = []
+    for i, passage in enumerate(passages, 1):
+        indices = passage['chunk_indices']
+        chunks = f"chunk {indices[0]}" if len(indices) == 1 else f"chunks {indices[0]}-{indices[-1]}"
+        documents.append(f"Document {i} ({passage['file_name']}, {chunks}):\n{passage['content']}")
+    return '\n\n'.join(documents)
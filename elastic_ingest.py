@@ -1,11 +1,16 @@
 import os
-import json
+import time
+import datetime
+from contextlib import contextmanager, nullcontext
 from tqdm import tqdm
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, TransportError, helpers
 from tenacity import retry, stop_after_attempt, wait_exponential
 import logging
-from typing import Optional
+from typing import List, Optional, Tuple
+import numpy as np
+from embedding_store import LEGACY_SUFFIX, list_stores, load_store
+from manifest import Manifest, document_id
 
 # Configure logging
 logging.basicConfig(
@@ -13,32 +18,52 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# dense_vector index_options type for each VECTOR_QUANTIZATION value
+INDEX_OPTIONS = {"float": "hnsw", "int8": "int8_hnsw", "binary": "bbq_hnsw"}
+
 class ElasticsearchIngestor:
-    def __init__(self, es_client: Elasticsearch):
+    def __init__(self, es_client: Elasticsearch, quantization: Optional[str] = None):
         self.es = es_client
         self.index_name = "tesla_filings"
+        # How the HNSW graph stores vectors: "float", "int8" or "binary" (bbq_hnsw, Elasticsearch 8.18+).
+        # Unset leaves Elasticsearch's default. Only applies when the index is created.
+        self.quantization = quantization or os.getenv("VECTOR_QUANTIZATION")
+        if self.quantization and self.quantization not in INDEX_OPTIONS:
+            raise ValueError(f"Unknown quantization {self.quantization!r}, expected one of {tuple(INDEX_OPTIONS)}")
 
     def create_index(self) -> bool:
         """Create index with proper mappings"""
         try:
             if not self.es.indices.exists(index=self.index_name):
+                embedding = {
+                    "type": "dense_vector",
+                    "dims": 384,
+                    "similarity": "cosine"
+                }
+                if self.quantization:
+                    embedding["index_options"] = {"type": INDEX_OPTIONS[self.quantization]}
                 self.es.indices.create(
                     index=self.index_name,
                     mappings={
                         "properties": {
                             "content": {"type": "text"},
-                            "embedding": {
-                                "type": "dense_vector",
-                                "dims": 384,
-                                "similarity": "cosine"
-                            },
+                            "embedding": embedding,
                             "file_name": {"type": "keyword"},
                             "chunk_index": {"type": "integer"},
+                            "page_start": {"type": "integer"},
+                            "page_end": {"type": "integer"},
+                            "char_start": {"type": "integer"},
+                            "char_end": {"type": "integer"},
+                            "form_type": {"type": "keyword"},
+                            "fiscal_year": {"type": "integer"},
+                            "fiscal_period": {"type": "keyword"},
+                            "period_end": {"type": "date"},
+                            "filing_date": {"type": "date"},
                             "processed_date": {"type": "date"}
                         }
                     }
                 )
-                logging.info(f"Created index: {self.index_name}")
+                logging.info(f"Created index: {self.index_name} ({self.quantization or 'default'} vectors)")
             return True
         except Exception as e:
             logging.error(f"Error creating index: {str(e)}")
@@ -46,50 +71,270 @@ class ElasticsearchIngestor:
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def index_document(self, document: dict) -> bool:
-        """Index a single document with retry logic"""
+        """Index a single document with retry logic, under its doc_id when it has one"""
         try:
-            self.es.index(index=self.index_name, document=document)
+            source = {key: value for key, value in document.items() if key != "doc_id"}
+            self.es.index(index=self.index_name, id=document.get("doc_id"), document=source)
             return True
         except Exception as e:
             logging.error(f"Error indexing document: {str(e)}")
             raise
 
-    def ingest_embeddings(self) -> None:
-        """Ingest stored embeddings into Elasticsearch"""
+    def _index_action(self, document: dict) -> dict:
+        """Build a bulk index action, using doc_id as the document _id when present"""
+        action = {"_index": self.index_name, "_source": {key: value for key, value in document.items() if key != "doc_id"}}
+        if "doc_id" in document:
+            action["_id"] = document["doc_id"]
+        return action
+
+    def _bulk_with_retry(self, actions: List[dict], chunk_size: int = 500,
+                         thread_count: int = 4, max_retries: int = 3) -> List[dict]:
+        """Send bulk actions, retrying only the items that failed; return the actions that succeeded
+
+        A transport error (e.g. a connection error or timeout) on a chunk ends
+        the attempt; the actions without a result are then retried like failed items.
+        """
+        pending = actions
+        succeeded = []
+        for attempt in range(max_retries + 1):
+            if attempt:
+                # Same backoff bounds as index_document, but paid once per batch
+                time.sleep(min(4 * 2 ** (attempt - 1), 10))
+            
+            results = helpers.parallel_bulk(
+                self.es,
+                pending,
+                chunk_size=chunk_size,
+                thread_count=thread_count,
+                raise_on_error=False,
+                raise_on_exception=False
+            )
+            
+            # parallel_bulk yields results in action order
+            failed = []
+            done = 0
+            try:
+                for action, (ok, info) in zip(pending, results):
+                    done += 1
+                    # Deleting a document that is already gone counts as success
+                    if ok or info.get("delete", {}).get("status") == 404:
+                        succeeded.append(action)
+                    else:
+                        failed.append(action)
+            except TransportError as e:
+                logging.warning(f"Bulk request failed: {str(e)}")
+                failed.extend(pending[done:])
+            
+            if not failed:
+                break
+            logging.warning(f"{len(failed)} bulk actions failed (attempt {attempt + 1}/{max_retries + 1})")
+            pending = failed
+        else:
+            logging.error(f"Giving up on {len(pending)} bulk actions after {max_retries} retries")
+        
+        return succeeded
+
+    def bulk_index_documents(self, documents: List[dict], chunk_size: int = 500,
+                             thread_count: int = 4, max_retries: int = 3) -> List[dict]:
+        """Index documents with the bulk API, retrying only the items that failed
+
+        Returns the documents that were indexed.
+        """
+        actions = [self._index_action(doc) for doc in documents]
+        indexed = {id(action) for action in self._bulk_with_retry(
+            actions,
+            chunk_size=chunk_size,
+            thread_count=thread_count,
+            max_retries=max_retries
+        )}
+        return [doc for doc, action in zip(documents, actions) if id(action) in indexed]
+
+    def bulk_delete_documents(self, doc_ids: List[str], chunk_size: int = 500,
+                              thread_count: int = 4, max_retries: int = 3) -> List[str]:
+        """Delete documents by ID with the bulk API; return the IDs that are gone"""
+        actions = [{"_op_type": "delete", "_index": self.index_name, "_id": doc_id} for doc_id in doc_ids]
+        deleted = self._bulk_with_retry(
+            actions,
+            chunk_size=chunk_size,
+            thread_count=thread_count,
+            max_retries=max_retries
+        )
+        return [action["_id"] for action in deleted]
+
+    @contextmanager
+    def bulk_load_settings(self):
+        """Disable refresh and replicas during a bulk load and restore them afterwards"""
+        original = None
+        try:
+            settings = self.es.indices.get_settings(index=self.index_name)[self.index_name]["settings"]["index"]
+            original = {
+                "refresh_interval": settings.get("refresh_interval"),
+                "number_of_replicas": settings.get("number_of_replicas")
+            }
+            self.es.indices.put_settings(
+                index=self.index_name,
+                settings={"refresh_interval": "-1", "number_of_replicas": 0}
+            )
+            logging.info(f"Disabled refresh and replicas on {self.index_name} for bulk load")
+        except Exception as e:
+            logging.warning(f"Could not update index settings for bulk load: {str(e)}")
+        
+        try:
+            yield
+        finally:
+            if original is not None:
+                try:
+                    self.es.indices.put_settings(index=self.index_name, settings=original)
+                    self.es.indices.refresh(index=self.index_name)
+                    logging.info(f"Restored index settings on {self.index_name}")
+                except Exception as e:
+                    logging.error(f"Error restoring index settings: {str(e)}")
+
+    def mark_index_updated(self) -> None:
+        """Stamp a new index version in the mapping metadata so search caches invalidate"""
+        try:
+            self.es.indices.put_mapping(
+                index=self.index_name,
+                meta={"index_version": datetime.datetime.now().isoformat()}
+            )
+        except Exception as e:
+            logging.error(f"Error updating index version: {str(e)}")
+
+    def ingest_store(self, embeddings_dir: str, stem: str, manifest: Manifest, bulk: bool = True,
+                     chunk_size: int = 500, thread_count: int = 4, max_retries: int = 3) -> Tuple[str, bool]:
+        """Index one filing's store incrementally
+
+        Only documents the manifest does not list as indexed are sent, and
+        indexed documents that are no longer in the store are deleted.
+        Returns the filing's file name and whether the index changed.
+        """
+        bulk_options = {"chunk_size": chunk_size, "thread_count": thread_count, "max_retries": max_retries}
+        vectors, metadata = load_store(embeddings_dir, stem)
+        for row in metadata:
+            if "doc_id" not in row:
+                row["doc_id"] = document_id(row["file_name"], row["chunk_index"], row["content"])
+        file_name = metadata[0]["file_name"] if metadata else f"{stem}.pdf"
+        
+        # Compare the store against what the manifest says is indexed
+        indexed_ids = set(manifest.indexed_ids(file_name))
+        current_ids = {row["doc_id"] for row in metadata}
+        stale_ids = sorted(indexed_ids - current_ids)
+        documents = [
+            {**row, "embedding": vectors[i].astype(np.float32).tolist()}
+            for i, row in enumerate(metadata) if row["doc_id"] not in indexed_ids
+        ]
+        
+        if not documents and not stale_ids:
+            logging.info(f"Skipping {stem} - already indexed")
+            return file_name, False
+        
+        if bulk:
+            indexed = self.bulk_index_documents(documents, **bulk_options)
+        else:
+            indexed = []
+            for doc in documents:
+                try:
+                    if self.index_document(doc):
+                        indexed.append(doc)
+                except Exception:
+                    continue
+        
+        deleted_ids = self.bulk_delete_documents(stale_ids, **bulk_options) if stale_ids else []
+        
+        indexed_ids = (indexed_ids - set(deleted_ids)) | {doc["doc_id"] for doc in indexed}
+        manifest.record_indexed(file_name, indexed_ids)
+        manifest.save()
+                
+        logging.info(f"Successfully indexed {len(indexed)}/{len(documents)} documents from {stem}")
+        if stale_ids:
+            logging.info(f"Deleted {len(deleted_ids)}/{len(stale_ids)} stale documents from {stem}")
+        return file_name, True
+
+    @staticmethod
+    def removed_filings(manifest: Manifest, stems: List[str], pdf_dir: str = "tesla_sec_filings") -> List[str]:
+        """Return the manifest's filings whose embedding store and source PDF are both gone
+
+        A filing with either one still on disk is not removed: a missing store
+        alone may just mean embedding failed or has not run yet.
+        """
+        stems = set(stems)
+        return [
+            file_name for file_name in manifest.filings
+            if os.path.splitext(file_name)[0] not in stems
+            and not os.path.exists(os.path.join(pdf_dir, file_name))
+        ]
+
+    def ingest_embeddings(self, bulk: bool = True, chunk_size: int = 500, thread_count: int = 4,
+                          max_retries: int = 3, disable_refresh: bool = True, rebuild: bool = False) -> None:
+        """Ingest stored embeddings into Elasticsearch
+
+        Ingestion is incremental: documents are indexed under deterministic IDs
+        and the manifest records what is already indexed, so only new or
+        changed chunks are sent and stale ones are deleted. rebuild=True drops
+        and recreates the index first.
+
+        With bulk=True documents are sent through the bulk API in batches of
+        chunk_size over thread_count connections. disable_refresh turns off
+        refresh and replicas while loading.
+        """
         embeddings_dir = "tesla_sec_filings_embeddings"
         
         if not os.path.exists(embeddings_dir):
             logging.error(f"Directory {embeddings_dir} does not exist!")
             return
         
+        manifest = Manifest(embeddings_dir)
+        if rebuild:
+            self.es.indices.delete(index=self.index_name, ignore_unavailable=True)
+            manifest.reset_indexed()
+            manifest.save()
+            logging.info(f"Deleted index {self.index_name} for rebuild")
+        
         if not self.create_index():
             return
         
-        embedding_files = [f for f in os.listdir(embeddings_dir) if f.endswith('_embeddings.json')]
+        stems = list_stores(embeddings_dir)
+        legacy_files = [f for f in os.listdir(embeddings_dir)
+                        if f.endswith(LEGACY_SUFFIX) and f[:-len(LEGACY_SUFFIX)] not in stems]
+        if legacy_files:
+            logging.warning(f"Found {len(legacy_files)} legacy JSON embedding files; run embedding_store.py to convert them")
         
-        for filename in tqdm(embedding_files, desc="Ingesting embeddings"):
-            file_path = os.path.join(embeddings_dir, filename)
+        bulk_options = {"chunk_size": chunk_size, "thread_count": thread_count, "max_retries": max_retries}
+        changed = False
+        failed = 0
+        with self.bulk_load_settings() if bulk and disable_refresh else nullcontext():
+            for filename in tqdm(stems, desc="Ingesting embeddings"):
+                try:
+                    _, store_changed = self.ingest_store(
+                        embeddings_dir, filename, manifest, bulk=bulk, **bulk_options
+                    )
+                    changed = changed or store_changed
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Error processing {filename}: {str(e)}")
+                    continue
             
-            try:
-                with open(file_path, 'r') as f:
-                    documents = json.load(f)
-                
-                successful_docs = 0
-                for doc in documents:
-                    try:
-                        if self.index_document(doc):
-                            successful_docs += 1
-                    except Exception:
-                        continue
-                        
-                logging.info(f"Successfully indexed {successful_docs}/{len(documents)} documents from {filename}")
-                
-            except Exception as e:
-                logging.error(f"Error processing {filename}: {str(e)}")
-                continue
+            # Delete documents of filings that are gone from disk. A store that failed to
+            # ingest says nothing about its filing, so skip the pass after any failure.
+            if failed:
+                logging.warning(f"Skipping removed filing cleanup after {failed} failed stores")
+            else:
+                for file_name in self.removed_filings(manifest, stems):
+                    stale_ids = manifest.indexed_ids(file_name)
+                    deleted_ids = self.bulk_delete_documents(stale_ids, **bulk_options) if stale_ids else []
+                    if len(deleted_ids) == len(stale_ids):
+                        manifest.remove(file_name)
+                    else:
+                        manifest.record_indexed(file_name, set(stale_ids) - set(deleted_ids))
+                    manifest.save()
+                    changed = changed or bool(deleted_ids)
+                    logging.info(f"Deleted {len(deleted_ids)}/{len(stale_ids)} documents of removed filing {file_name}")
+        
+        if changed:
+            self.mark_index_updated()
 
-def create_es_client() -> Optional[Elasticsearch]:
-    """Create Elasticsearch client"""
+def create_es_client(connections_per_node: int = 10) -> Optional[Elasticsearch]:
+    """Create Elasticsearch client with a pool of connections_per_node connections"""
     try:
         es = Elasticsearch(
             os.getenv("ELASTIC_ENDPOINT"),
@@ -97,6 +342,7 @@ def create_es_client() -> Optional[Elasticsearch]:
             request_timeout=120,
             verify_certs=False,
             ssl_show_warn=False,
+            connections_per_node=connections_per_node,
         )
         return es
     except Exception as e:
@@ -0,0 +1,108 @@
+import os
+import json
+import logging
+import numpy as np
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Each filing is stored as a float matrix (one row per chunk) plus a JSON lines
+# sidecar holding doc_id, content, file_name, chunk_index and processed_date per row.
+VECTORS_SUFFIX = "_embeddings.npy"
+METADATA_SUFFIX = "_embeddings.jsonl"
+LEGACY_SUFFIX = "_embeddings.json"
+
+def store_paths(embeddings_dir, stem):
+    """Return the vectors and metadata paths for a filing's store"""
+    return (
+        os.path.join(embeddings_dir, f"{stem}{VECTORS_SUFFIX}"),
+        os.path.join(embeddings_dir, f"{stem}{METADATA_SUFFIX}")
+    )
+
+def store_exists(embeddings_dir, stem):
+    """Check whether a filing has a complete binary store"""
+    return all(os.path.exists(path) for path in store_paths(embeddings_dir, stem))
+
+def list_stores(embeddings_dir):
+    """List the stems of all binary stores in a directory"""
+    if not os.path.exists(embeddings_dir):
+        return []
+    stems = [f[:-len(VECTORS_SUFFIX)] for f in os.listdir(embeddings_dir) if f.endswith(VECTORS_SUFFIX)]
+    return sorted(stem for stem in stems if store_exists(embeddings_dir, stem))
+
+def save_store(embeddings_dir, stem, vectors, metadata, dtype="float32"):
+    """Save a filing's vectors and metadata rows
+
+    The metadata is written first and the vectors file is moved into place
+    last, so a store only counts as existing once both files are complete.
+    """
+    vectors = np.asarray(vectors, dtype=dtype)
+    if len(vectors) != len(metadata):
+        raise ValueError(f"Got {len(vectors)} vectors but {len(metadata)} metadata rows for {stem}")
+
+    vectors_path, metadata_path = store_paths(embeddings_dir, stem)
+    with open(metadata_path + ".tmp", 'w') as f:
+        for row in metadata:
+            f.write(json.dumps(row) + "\n")
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+    with open(vectors_path + ".tmp", 'wb') as f:
+        np.save(f, vectors)
+    os.replace(vectors_path + ".tmp", vectors_path)
+
+def remove_store(embeddings_dir, stem):
+    """Delete a filing's store files"""
+    for path in store_paths(embeddings_dir, stem):
+        if os.path.exists(path):
+            os.remove(path)
+
+def load_metadata(embeddings_dir, stem):
+    """Load a filing's metadata rows"""
+    _, metadata_path = store_paths(embeddings_dir, stem)
+    with open(metadata_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_store(embeddings_dir, stem, mmap=True):
+    """Load a filing's vectors and metadata rows
+
+    With mmap=True the vectors are a read-only memory map of the file, so no
+    copy is made until rows are actually used.
+    """
+    vectors_path, _ = store_paths(embeddings_dir, stem)
+    vectors = np.load(vectors_path, mmap_mode='r' if mmap else None)
+    return vectors, load_metadata(embeddings_dir, stem)
+
+def convert_json_store(embeddings_dir="tesla_sec_filings_embeddings", dtype="float32", remove=False):
+    """Convert legacy *_embeddings.json files into binary stores"""
+    if not os.path.exists(embeddings_dir):
+        logging.error(f"Directory {embeddings_dir} does not exist!")
+        return
+
+    legacy_files = [f for f in os.listdir(embeddings_dir) if f.endswith(LEGACY_SUFFIX)]
+    for filename in legacy_files:
+        stem = filename[:-len(LEGACY_SUFFIX)]
+        file_path = os.path.join(embeddings_dir, filename)
+
+        if store_exists(embeddings_dir, stem):
+            logging.info(f"Skipping {filename} - already converted")
+            continue
+
+        try:
+            with open(file_path, 'r') as f:
+                documents = json.load(f)
+
+            vectors = [doc.pop("embedding") for doc in documents]
+            save_store(embeddings_dir, stem, vectors, documents, dtype=dtype)
+            logging.info(f"Converted {len(documents)} embeddings from {filename}")
+
+            if remove:
+                os.remove(file_path)
+        except Exception as e:
+            logging.error(f"Error converting {filename}: {str(e)}")
+            continue
+
+if __name__ == "__main__":
+    convert_json_store()
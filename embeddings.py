@@ -1,12 +1,20 @@
 import os
+import re
+import queue
+import multiprocessing
 import PyPDF2
-import json
 import logging
 import datetime
 from tqdm import tqdm
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from embedding_store import load_store, remove_store, save_store, store_exists
+from manifest import Manifest, document_id, file_hash
+from chunking import Chunker
+from filing_metadata import FilingMetadataParser, METADATA_VERSION
+from models import get_embedding_model
+
+load_dotenv()
 
 # Configure logging
 logging.basicConfig(
@@ -14,58 +22,260 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-# Initialize the model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+def get_model():
+    """Return the shared embedding model, loading it on first use"""
+    return get_embedding_model()
+
+# The chunker is created on first use from CHUNK_TOKENS and CHUNK_OVERLAP_TOKENS;
+# assign a Chunker here to use a different one
+chunker = None
+
+def get_chunker():
+    """Return the chunker, creating it on first use"""
+    global chunker
+    if chunker is None:
+        chunker = Chunker(
+            chunk_tokens=int(os.getenv("CHUNK_TOKENS", "240")),
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+        )
+    return chunker
 
 def get_embedding(text):
     """Get embedding using SentenceTransformer locally"""
     try:
         # Generate embedding
-        embedding = model.encode(text, normalize_embeddings=True)
+        embedding = get_model().encode(text, normalize_embeddings=True)
         return embedding
     except Exception as e:
         logging.error(f"Error getting embedding: {str(e)}")
         return None
 
+def get_embeddings(texts, batch_size=64):
+    """Get embeddings for a list of texts using batched SentenceTransformer calls
+
+    Returns a list aligned with texts; entries that could not be embedded are None.
+    """
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        try:
+            embeddings.extend(get_model().encode(batch, batch_size=batch_size, normalize_embeddings=True))
+        except Exception as e:
+            # Fall back to one chunk at a time so a single bad chunk does not fail the batch
+            logging.error(f"Error getting batch embeddings, retrying per chunk: {str(e)}")
+            embeddings.extend(get_embedding(text) for text in batch)
+    return embeddings
+
+def iter_pdf_pages(file_path):
+    """Yield the extracted text of each page of a PDF file"""
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            yield page.extract_text()
+
 def read_pdf(file_path):
     """Extract text from PDF file"""
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ''
-            for page in reader.pages:
-                text += page.extract_text() + ' '
-        return text.strip()
+        return ' '.join(iter_pdf_pages(file_path)).strip()
     except Exception as e:
         logging.error(f"Error reading PDF {file_path}: {str(e)}")
         return None
 
-def create_chunks(text, chunk_size=1000):
-    """Split text into chunks of approximately chunk_size characters"""
+def extraction_signature(chunker=None):
+    """Identify how chunks and their metadata are extracted, so filings are re-extracted when it changes"""
+    return f"{(chunker or get_chunker()).signature}+{METADATA_VERSION}"
+
+def iter_chunks(pages, chunker=None):
+    """Yield chunks from an iterable of page texts without holding the whole document in memory
+
+    Chunks are dicts with content, page_start, char_start, page_end and
+    char_end; see chunking.Chunker.
+    """
+    yield from (chunker or get_chunker()).iter_chunks(pages)
+
+def create_chunks(text, chunker=None):
+    """Split text into chunks"""
     if not text:
         return []
     
-    words = text.split()
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for word in words:
-        current_chunk.append(word)
-        current_size += len(word) + 1  # +1 for space
+    return list(iter_chunks([text], chunker=chunker))
+
+def save_documents(filename, embeddings_dir, chunks, embeddings, dtype="float32"):
+    """Build metadata for a filing's chunks and save it with the vectors to a binary store
+
+    Returns the document IDs that were saved, or None if nothing was saved.
+    """
+    vectors = []
+    metadata = []
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        if embedding is None:
+            logging.error(f"Failed to process chunk {i} from {filename}")
+            continue
         
-        if current_size >= chunk_size:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = []
-            current_size = 0
+        # Prepare document
+        vectors.append(embedding)
+        metadata.append({
+            "doc_id": document_id(filename, i, chunk["content"]),
+            "content": chunk["content"],
+            "file_name": filename,
+            "chunk_index": i,
+            # Page and character offsets, plus the filing metadata when extracted from a PDF
+            **{key: value for key, value in chunk.items() if key != "content"},
+            "processed_date": datetime.datetime.now().isoformat()
+        })
+    
+    # Save to the binary store
+    if metadata:
+        try:
+            save_store(embeddings_dir, os.path.splitext(filename)[0], vectors, metadata, dtype=dtype)
+            logging.info(f"Saved {len(metadata)} embeddings for {filename}")
+            return [row["doc_id"] for row in metadata]
+        except Exception as e:
+            logging.error(f"Error saving embeddings for {filename}: {str(e)}")
+    return None
+
+def _stored_vectors(embeddings_dir, filename):
+    """Return {doc_id: vector} for a filing's existing store, if any"""
+    stem = os.path.splitext(filename)[0]
+    if not store_exists(embeddings_dir, stem):
+        return {}
+    try:
+        vectors, metadata = load_store(embeddings_dir, stem)
+        return {
+            row.get("doc_id") or document_id(row["file_name"], row["chunk_index"], row["content"]): np.array(vectors[i])
+            for i, row in enumerate(metadata)
+        }
+    except Exception as e:
+        logging.error(f"Error reading existing embeddings for {filename}: {str(e)}")
+        return {}
+
+def embed_filings(filings, embeddings_dir, batch_size=64, dtype="float32", manifest=None, chunker=None):
+    """Embed the chunks of several filings together and save each filing
+
+    filings is a list of (filename, chunks, file_hash) tuples. Chunks that are
+    unchanged in a filing's existing store reuse their stored vectors, so a
+    changed filing only re-encodes its new or changed chunks. The manifest
+    records how the chunks were extracted (see extraction_signature).
+    """
+    all_chunks = []
+    embeddings = []
+    for filename, chunks, _ in filings:
+        stored = _stored_vectors(embeddings_dir, filename)
+        for i, chunk in enumerate(chunks):
+            all_chunks.append(chunk["content"])
+            embeddings.append(stored.get(document_id(filename, i, chunk["content"])))
+    
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    for i, embedding in zip(missing, get_embeddings([all_chunks[i] for i in missing], batch_size=batch_size)):
+        embeddings[i] = embedding
+    if len(missing) < len(all_chunks):
+        logging.info(f"Reused {len(all_chunks) - len(missing)} stored embeddings for unchanged chunks")
+    
+    offset = 0
+    for filename, chunks, filing_hash in filings:
+        doc_ids = save_documents(filename, embeddings_dir, chunks, embeddings[offset:offset + len(chunks)], dtype=dtype)
+        if doc_ids is not None and manifest is not None:
+            manifest.record_embedded(filename, filing_hash, doc_ids, extraction_signature(chunker))
+        offset += len(chunks)
+    
+    if manifest is not None:
+        manifest.save()
+
+def extract_chunks(file_path, chunker=None):
+    """Extract text from a PDF file and split it into chunks page by page
+
+    Each chunk also carries the filing's form type, fiscal period and dates.
+    """
+    try:
+        parser = FilingMetadataParser(os.path.basename(file_path))
+        chunks = list(iter_chunks((parser.feed(text) for text in iter_pdf_pages(file_path)), chunker=chunker))
+        metadata = parser.result()
+        for chunk in chunks:
+            chunk.update(metadata)
+        return chunks
+    except Exception as e:
+        logging.error(f"Error reading PDF {file_path}: {str(e)}")
+        return []
+
+def _extraction_worker(tasks, results, chunker):
+    """Worker process: extract and chunk filings from tasks until a None sentinel"""
+    for filename, file_path in iter(tasks.get, None):
+        try:
+            chunks = extract_chunks(file_path, chunker)
+        except Exception as e:
+            logging.error(f"Error extracting {filename}: {str(e)}")
+            chunks = []
+        results.put((filename, chunks))
+    results.put(None)
+
+def _extract_serial(filings):
+    """Extract and chunk filings one at a time in this process"""
+    for filename, file_path in filings:
+        yield filename, extract_chunks(file_path)
+
+def _extract_parallel(filings, workers, queue_size):
+    """Extract and chunk filings in worker processes
+
+    Results come back through a queue bounded by queue_size, so workers
+    pause when the embedding stage falls behind.
+    """
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue(maxsize=queue_size)
+    for filing in filings:
+        tasks.put(filing)
+    for _ in range(workers):
+        tasks.put(None)
     
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    processes = [
+        multiprocessing.Process(target=_extraction_worker, args=(tasks, results, get_chunker()), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
     
-    return chunks
+    try:
+        finished = 0
+        while finished < workers:
+            try:
+                item = results.get(timeout=5)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError("PDF extraction workers exited unexpectedly")
+                continue
+            if item is None:
+                finished += 1
+                continue
+            yield item
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+def is_processed(filename, filing_hash, embeddings_dir, manifest, chunker=None):
+    """Check whether a filing's store is up to date with its PDF and the extraction configuration
+
+    Stores without a manifest entry, or extracted with a different chunker
+    or metadata version, are processed again.
+    """
+    stem = os.path.splitext(filename)[0]
+    if not store_exists(embeddings_dir, stem):
+        return False
+    return manifest.is_embedded(filename, filing_hash, extraction_signature(chunker))
 
-def process_and_store_documents():
-    """Process PDFs and store embeddings locally"""
+def process_and_store_documents(batch_size=64, workers=1, queue_size=8, dtype="float32"):
+    """Process PDFs and store embeddings locally
+
+    Chunks are encoded in batches of batch_size. Small filings are grouped
+    until they fill a batch, so they share encode calls across filings.
+    With workers > 1, PDFs are extracted and chunked in a pool of worker
+    processes that feed the embedding stage through a bounded queue.
+    Vectors are stored as dtype ("float32" or "float16") matrices.
+    
+    Processing is incremental: a manifest records each filing's content hash,
+    so only new or changed PDFs are processed, and stores of PDFs that were
+    removed are deleted.
+    """
     pdf_dir = "tesla_sec_filings"
     embeddings_dir = "tesla_sec_filings_embeddings"
     
@@ -76,57 +286,52 @@ def process_and_store_documents():
         
     os.makedirs(embeddings_dir, exist_ok=True)
     
-    # Process each PDF file
+    manifest = Manifest(embeddings_dir)
+    
+    # Collect PDF files that are new or changed since they were processed
     pdf_files = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
-    for filename in tqdm(pdf_files, desc="Processing PDFs"):
+    filings = []
+    file_hashes = {}
+    for filename in pdf_files:
         file_path = os.path.join(pdf_dir, filename)
-        output_path = os.path.join(embeddings_dir, f"{os.path.splitext(filename)[0]}_embeddings.json")
+        file_hashes[filename] = file_hash(file_path)
         
         # Skip if already processed
-        if os.path.exists(output_path):
+        if is_processed(filename, file_hashes[filename], embeddings_dir, manifest):
             logging.info(f"Skipping {filename} - already processed")
             continue
-            
-        # Extract text from PDF
-        text = read_pdf(file_path)
-        if not text:
+        filings.append((filename, file_path))
+    
+    # Remove stores of filings whose PDF is gone; ingestion deletes their documents
+    for filename in list(manifest.filings):
+        if filename not in file_hashes:
+            remove_store(embeddings_dir, os.path.splitext(filename)[0])
+            manifest.record_embedded(filename, None, [])
+            logging.info(f"Removed embeddings for deleted filing {filename}")
+    manifest.save()
+    
+    if workers > 1:
+        extracted = _extract_parallel(filings, workers, queue_size)
+    else:
+        extracted = _extract_serial(filings)
+    
+    pending = []
+    pending_chunks = 0
+    for filename, chunks in tqdm(extracted, total=len(filings), desc="Processing PDFs"):
+        if not chunks:
             continue
-        
-        # Create chunks
-        chunks = create_chunks(text)
         logging.info(f"Created {len(chunks)} chunks from {filename}")
         
-        # Store chunks and their embeddings
-        documents = []
-        for i, chunk in enumerate(chunks):
-            try:
-                # Generate embedding
-                embedding = get_embedding(chunk)
-                if embedding is None:
-                    continue
-                
-                # Prepare document
-                doc = {
-                    "content": chunk,
-                    "embedding": embedding.tolist(),
-                    "file_name": filename,
-                    "chunk_index": i,
-                    "processed_date": datetime.datetime.now().isoformat()
-                }
-                documents.append(doc)
-                
-            except Exception as e:
-                logging.error(f"Failed to process chunk {i} from {filename}: {str(e)}")
-                continue
-        
-        # Save to JSON file
-        if documents:
-            try:
-                with open(output_path, 'w') as f:
-                    json.dump(documents, f)
-                logging.info(f"Saved {len(documents)} embeddings for {filename}")
-            except Exception as e:
-                logging.error(f"Error saving embeddings for {filename}: {str(e)}")
+        # Queue the filing until there are enough chunks for a full batch
+        pending.append((filename, chunks, file_hashes[filename]))
+        pending_chunks += len(chunks)
+        if pending_chunks >= batch_size:
+            embed_filings(pending, embeddings_dir, batch_size=batch_size, dtype=dtype, manifest=manifest)
+            pending = []
+            pending_chunks = 0
+    
+    if pending:
+        embed_filings(pending, embeddings_dir, batch_size=batch_size, dtype=dtype, manifest=manifest)
 
 if __name__ == "__main__":
     process_and_store_documents()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import re
+import datetime
+from typing import Dict, Optional
+
+# Bumped whenever the extracted fields change, so filings are re-extracted
+METADATA_VERSION = "meta-v2"
+
+# Cover page form type, e.g. "FORM 10-K" or "FORM 10-Q/A"
+FORM_PATTERN = re.compile(r'\bFORM\s+(10-K|10-Q|8-K|11-K|S-\d+|DEF\s*14A)(/A)?\b', re.IGNORECASE)
+DATE = r'([A-Z][a-z]+\s+\d{1,2}\s*,\s*\d{4})'
+# 10-K/10-Q cover: "For the fiscal year ended December 31, 2023" / "For the quarterly period ended ..."
+PERIOD_PATTERN = re.compile(r'for\s+the\s+(fiscal\s+year|quarterly\s+period|transition\s+period)\s+ended\s+' + DATE,
+                            re.IGNORECASE)
+# 8-K cover: "Date of Report (Date of earliest event reported): January 24, 2024"
+REPORT_DATE_PATTERN = re.compile(r'Date\s+of\s+Report\s*\(Date\s+of\s+earliest\s+event\s+reported\)\s*:?\s*' + DATE,
+                                 re.IGNORECASE)
+# Signature block: a "SIGNATURES" heading followed by "Date: January 26, 2024". Case sensitive,
+# so the "Signatures" entry of a table of contents does not open a block
+SIGNATURES_PATTERN = re.compile(r'\bSIGNATURES?\b')
+SIGNATURE_DATE_PATTERN = re.compile(r'\bDate:\s*' + DATE)
+# Pages after the heading's page that are searched for the signature date
+SIGNATURE_BLOCK_PAGES = 1
+# Dates in file names such as tsla-20231231.pdf
+FILE_NAME_DATE_PATTERN = re.compile(r'(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)')
+
+def _parse_date(text: str) -> Optional[datetime.date]:
+    """Parse a date like "December 31, 2023", or return None"""
+    try:
+        return datetime.datetime.strptime(re.sub(r'\s*,\s*', ', ', re.sub(r'\s+', ' ', text)), "%B %d, %Y").date()
+    except ValueError:
+        return None
+
+def _file_name_date(file_name: str) -> Optional[datetime.date]:
+    for match in FILE_NAME_DATE_PATTERN.finditer(file_name):
+        try:
+            return datetime.date(*(int(group) for group in match.groups()))
+        except ValueError:
+            continue
+    return None
+
+def _quarter(date: datetime.date) -> str:
+    # Tesla's fiscal year is the calendar year
+    return f"Q{(date.month - 1) // 3 + 1}"
+
+class FilingMetadataParser:
+    """Collect a filing's metadata from its file name and its pages as they stream past
+
+    Fields (None when not found):
+    - form_type: e.g. "10-K", "10-Q", "8-K", "10-K/A", from the cover pages
+    - period_end: end of the reported fiscal period (10-K/10-Q), else the
+      date in the file name
+    - fiscal_year and fiscal_period: "FY" for annual reports, "Q1"-"Q4" for
+      quarterly reports and for 8-Ks by their report date
+    - filing_date: the 8-K report date or the signature date, the first
+      "Date:" after a SIGNATURES heading on its page or the next one; dates
+      on cover letters or exhibits elsewhere are ignored
+    """
+
+    def __init__(self, file_name: str, cover_pages: int = 3):
+        self.file_name = file_name
+        self.cover_pages = cover_pages
+        self.pages = 0
+        self.form_type = None
+        self.period = None
+        self.period_end = None
+        self.report_date = None
+        self.signature_date = None
+        self.signature_page = None
+
+    def feed(self, text: str) -> str:
+        """Scan the next page's text and return it unchanged"""
+        self.pages += 1
+        text = text or ""
+        if self.pages <= self.cover_pages:
+            if self.form_type is None:
+                match = FORM_PATTERN.search(text)
+                if match:
+                    self.form_type = re.sub(r'\s+', ' ', match.group(1).upper()) + (match.group(2) or "").upper()
+            if self.period_end is None:
+                match = PERIOD_PATTERN.search(text)
+                if match:
+                    self.period = re.sub(r'\s+', ' ', match.group(1).lower())
+                    self.period_end = _parse_date(match.group(2))
+            if self.report_date is None:
+                match = REPORT_DATE_PATTERN.search(text)
+                if match:
+                    self.report_date = _parse_date(match.group(1))
+        if self.signature_date is None:
+            heading = SIGNATURES_PATTERN.search(text)
+            if heading:
+                self.signature_page = self.pages
+            if self.signature_page is not None and self.pages - self.signature_page <= SIGNATURE_BLOCK_PAGES:
+                match = SIGNATURE_DATE_PATTERN.search(text, heading.end() if heading else 0)
+                if match:
+                    self.signature_date = _parse_date(match.group(1))
+        return text
+
+    def result(self) -> Dict:
+        """Return the metadata fields, with dates as ISO strings"""
+        period_end = self.period_end or (None if self.report_date else _file_name_date(self.file_name))
+        if self.period_end is not None and self.period == "fiscal year":
+            fiscal_year, fiscal_period = self.period_end.year, "FY"
+        elif self.period_end is not None:
+            fiscal_year, fiscal_period = self.period_end.year, _quarter(self.period_end)
+        elif self.report_date is not None:
+            fiscal_year, fiscal_period = self.report_date.year, _quarter(self.report_date)
+        elif period_end is not None:
+            fiscal_year, fiscal_period = period_end.year, None
+        else:
+            fiscal_year, fiscal_period = None, None
+        filing_date = self.report_date or self.signature_date
+        return {
+            "form_type": self.form_type,
+            "fiscal_year": fiscal_year,
+            "fiscal_period": fiscal_period,
+            "period_end": period_end.isoformat() if period_end else None,
+            "filing_date": filing_date.isoformat() if filing_date else None
+        }
@@ -1,8 +1,14 @@
 import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from scrape import scrape_tesla_sec_filings
-from embeddings import process_and_store_documents
+from scrape import scrape_tesla_sec_filings, iter_tesla_sec_filings
+from embeddings import process_and_store_documents, embed_filings, extract_chunks, get_chunker, is_processed
 from elastic_ingest import ElasticsearchIngestor, create_es_client
+from manifest import Manifest, file_hash
 import logging
 
 # Configure logging
@@ -11,8 +17,227 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def run_ingestion_pipeline():
-    """Run the complete ingestion pipeline"""
+# Marks the end of a stage's output in the queue to the next stage
+_DONE = object()
+
+class StageMetrics:
+    """Item counts and timings for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.started = time.monotonic()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds, items=1):
+        """Record items processed in seconds of work"""
+        with self.lock:
+            self.items += items
+            self.busy += seconds
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def summary(self):
+        """Return items, busy time, wall time and throughput"""
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy, 2),
+            "elapsed_seconds": round(elapsed, 2),
+            "items_per_second": round(self.items / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+def _put(q, item, cancel, timeout=0.5):
+    """Put item on a bounded queue, giving up if cancel is set while it is full; returns whether it was put"""
+    while not cancel.is_set():
+        try:
+            q.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, cancel, timeout=0.5):
+    """Get the next item from a queue, or _DONE once cancel is set"""
+    while not cancel.is_set():
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _report_progress(stages, queues, stop, interval):
+    """Log per-stage throughput and queue depths every interval seconds until stop is set"""
+    while not stop.wait(interval):
+        stage_info = ", ".join(
+            f"{stage.name} {stage.summary()['items']} ({stage.summary()['items_per_second']}/s)" for stage in stages
+        )
+        queue_info = ", ".join(f"{name} {q.qsize()}/{q.maxsize}" for name, q in queues.items())
+        logging.info(f"Pipeline progress: {stage_info} | queues: {queue_info}")
+
+def run_streaming_pipeline(es_client, workers=4, batch_size=64, queue_size=8, download_workers=4,
+                           rate_limit=2.0, dtype="float32", report_interval=10.0,
+                           base_url="https://ir.tesla.com/sec-filings"):
+    """Run scrape, embed and ingest as overlapping stages connected by bounded queues
+
+    A filing is extracted as soon as it finishes downloading, its chunks are
+    embedded as soon as a batch is ready (or the extractors have nothing
+    queued), and each filing's store is bulk-indexed as soon as it is saved.
+    Returns the per-stage metrics.
+
+    If the embedding stage fails, the other stages are cancelled, the
+    filings already embedded are still indexed, and RuntimeError is raised.
+    """
+    pdf_dir = "tesla_sec_filings"
+    embeddings_dir = "tesla_sec_filings_embeddings"
+    os.makedirs(embeddings_dir, exist_ok=True)
+    
+    manifest = Manifest(embeddings_dir)
+    ingestor = ElasticsearchIngestor(es_client)
+    if not ingestor.create_index():
+        return None
+    
+    downloaded = queue.Queue(maxsize=queue_size)
+    extracted = queue.Queue(maxsize=queue_size)
+    embedded = queue.Queue(maxsize=queue_size)
+    
+    # Set when a stage fails, so the stages feeding it stop instead of blocking on full queues
+    cancel = threading.Event()
+    failures = []
+    
+    stages = [StageMetrics(name) for name in ("download", "extract", "embed", "index")]
+    download_metrics, extract_metrics, embed_metrics, index_metrics = stages
+    
+    def download_stage():
+        try:
+            started = time.monotonic()
+            for file_path in iter_tesla_sec_filings(base_url, pdf_dir, workers=download_workers, rate_limit=rate_limit):
+                download_metrics.record(time.monotonic() - started)
+                if not _put(downloaded, file_path, cancel):
+                    break
+                started = time.monotonic()
+        except Exception as e:
+            logging.error(f"Download stage error: {str(e)}")
+        finally:
+            download_metrics.finish()
+            for _ in range(workers):
+                _put(downloaded, _DONE, cancel)
+    
+    def extract_stage(pool):
+        try:
+            for file_path in iter(lambda: _get(downloaded, cancel), _DONE):
+                started = time.monotonic()
+                filename = os.path.basename(file_path)
+                try:
+                    filing_hash = file_hash(file_path)
+                    if is_processed(filename, filing_hash, embeddings_dir, manifest):
+                        # Still pass it on so indexing can catch up on it
+                        item = (filename, None, filing_hash)
+                    else:
+                        item = (filename, pool.submit(extract_chunks, file_path, get_chunker()).result(), filing_hash)
+                    if not _put(extracted, item, cancel):
+                        break
+                except Exception as e:
+                    logging.error(f"Error extracting {filename}: {str(e)}")
+                extract_metrics.record(time.monotonic() - started)
+        finally:
+            extract_metrics.finish()
+            _put(extracted, _DONE, cancel)
+    
+    def embed_stage():
+        def flush(pending):
+            started = time.monotonic()
+            embed_filings(pending, embeddings_dir, batch_size=batch_size, dtype=dtype, manifest=manifest)
+            embed_metrics.record(time.monotonic() - started, items=len(pending))
+            for filename, _, _ in pending:
+                embedded.put(os.path.splitext(filename)[0])
+        
+        try:
+            finished = 0
+            pending = []
+            pending_chunks = 0
+            while finished < workers:
+                item = extracted.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                
+                filename, chunks, filing_hash = item
+                if chunks is None:
+                    embedded.put(os.path.splitext(filename)[0])
+                    continue
+                if not chunks:
+                    continue
+                logging.info(f"Created {len(chunks)} chunks from {filename}")
+                
+                # Embed once a batch is full, or straight away if nothing else is waiting
+                pending.append(item)
+                pending_chunks += len(chunks)
+                if pending_chunks >= batch_size or extracted.empty():
+                    flush(pending)
+                    pending = []
+                    pending_chunks = 0
+            
+            if pending:
+                flush(pending)
+        except Exception as e:
+            logging.error(f"Embedding stage error: {str(e)}")
+            failures.append(f"embed: {str(e)}")
+            cancel.set()
+        finally:
+            embed_metrics.finish()
+            embedded.put(_DONE)
+    
+    stop_reporting = threading.Event()
+    reporter = threading.Thread(
+        target=_report_progress,
+        args=(stages, {"downloaded": downloaded, "extracted": extracted, "embedded": embedded}, stop_reporting, report_interval),
+        daemon=True
+    )
+    reporter.start()
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        threads = [threading.Thread(target=download_stage, daemon=True), threading.Thread(target=embed_stage, daemon=True)]
+        threads += [threading.Thread(target=extract_stage, args=(pool,), daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        
+        # Index in this thread as filings come out of the embedding stage
+        changed = False
+        with ingestor.bulk_load_settings():
+            for stem in iter(embedded.get, _DONE):
+                started = time.monotonic()
+                try:
+                    _, store_changed = ingestor.ingest_store(embeddings_dir, stem, manifest)
+                    changed = changed or store_changed
+                except Exception as e:
+                    logging.error(f"Error indexing {stem}: {str(e)}")
+                index_metrics.record(time.monotonic() - started)
+        index_metrics.finish()
+        
+        for thread in threads:
+            thread.join()
+    
+    if changed:
+        ingestor.mark_index_updated()
+    
+    stop_reporting.set()
+    metrics = {stage.name: stage.summary() for stage in stages}
+    for name, summary in metrics.items():
+        logging.info(f"Stage {name}: {summary}")
+    if failures:
+        raise RuntimeError(f"Streaming pipeline failed ({'; '.join(failures)})")
+    return metrics
+
+def run_ingestion_pipeline(streaming=False):
+    """Run the complete ingestion pipeline
+
+    With streaming=True the scrape, embed and ingest steps overlap, see
+    run_streaming_pipeline.
+    """
     # Load environment variables
     load_dotenv()
     
@@ -31,6 +256,12 @@ def run_ingestion_pipeline():
         return
         
     try:
+        if streaming:
+            logging.info("Starting streaming ingestion pipeline...")
+            run_streaming_pipeline(es_client)
+            logging.info("Streaming ingestion pipeline completed!")
+            return
+        
         # Step 1: Scrape SEC filings
         logging.info("Starting SEC filings scraping...")
         scrape_tesla_sec_filings()
@@ -53,4 +284,7 @@ def run_ingestion_pipeline():
         es_client.close()
 
 if __name__ == "__main__":
-    run_ingestion_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the SEC filings ingestion pipeline")
+    parser.add_argument("--streaming", action="store_true", help="Overlap scrape, embed and ingest stages")
+    args = parser.parse_args()
+    run_ingestion_pipeline(streaming=args.streaming)
\ No newline at end of file
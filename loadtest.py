@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import itertools
+import threading
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+import requests
+from waitress import create_server
+import api
+import embeddings
+from benchmark import latency_summary, synthetic_queries, git_commit
+from elastic_ingest import ElasticsearchIngestor
+from models import register_embedding_model
+from retrieval import ElasticsearchBackend
+from search import SearchEngine
+from stubs import HashingEncoder, StubInferenceClient, create_stub_es_client, write_synthetic_filings
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+# The stub cluster answers thousands of requests; skip the per-request transport logs
+logging.getLogger("elastic_transport").setLevel(logging.WARNING)
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Return the resident set size of a process (this one by default), or None without /proc"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _mb(size: Optional[int]) -> Optional[float]:
+    return round(size / 2 ** 20, 1) if size is not None else None
+
+class LoadRecorder:
+    """Collect request outcomes into per-interval windows and run totals
+
+    Latencies of successful requests are kept for the whole run in a
+    compact array, 8 bytes per request, so long soaks do not skew the RSS
+    they measure.
+    """
+
+    def __init__(self, pid: Optional[int] = None):
+        self.pid = pid
+        self.started = time.perf_counter()
+        self.latencies = array('d')
+        self.errors: Dict[str, int] = {}
+        self.windows: List[Dict] = []
+        self.rss_start = rss_bytes(pid)
+        self.rss_max = self.rss_start
+        self._window_start = self.started
+        self._window_latencies: List[float] = []
+        self._window_errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, error: Optional[str] = None) -> None:
+        """Record one request's latency in seconds, or its error label"""
+        with self._lock:
+            if error is None:
+                self.latencies.append(latency)
+                self._window_latencies.append(latency)
+            else:
+                self.errors[error] = self.errors.get(error, 0) + 1
+                self._window_errors += 1
+
+    def sample(self) -> Dict:
+        """Close the current window and return its summary along with the process RSS"""
+        now = time.perf_counter()
+        rss = rss_bytes(self.pid)
+        with self._lock:
+            latencies, errors = self._window_latencies, self._window_errors
+            self._window_latencies, self._window_errors = [], 0
+            elapsed, self._window_start = now - self._window_start, now
+        if rss is not None:
+            self.rss_max = max(self.rss_max or 0, rss)
+        total = len(latencies) + errors
+        window = {
+            "elapsed_seconds": round(now - self.started, 2),
+            **latency_summary(latencies, elapsed),
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "rss_mb": _mb(rss)
+        }
+        # Throughput counts failed requests too
+        window["qps"] = round(total / elapsed, 2) if elapsed else 0.0
+        self.windows.append(window)
+        return window
+
+    def summary(self) -> Dict:
+        """Return latency percentiles, error counts, throughput and RSS over the whole run"""
+        elapsed = time.perf_counter() - self.started
+        errors = sum(self.errors.values())
+        total = len(self.latencies) + errors
+        rss_end = self.windows[-1]["rss_mb"] if self.windows else _mb(rss_bytes(self.pid))
+        rss_start = _mb(self.rss_start)
+        return {
+            "seconds": round(elapsed, 2),
+            **latency_summary(np.frombuffer(self.latencies, dtype=np.float64), elapsed),
+            "qps": round(total / elapsed, 2) if elapsed else 0.0,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "error_types": dict(sorted(self.errors.items())),
+            "rss_mb": {
+                "start": rss_start,
+                "end": rss_end,
+                "max": _mb(self.rss_max),
+                "growth": round(rss_end - rss_start, 1) if rss_end is not None and rss_start is not None else None
+            }
+        }
+
+def start_stub_server(num_filings: int = 20, pages_per_filing: int = 10, es_latency: float = 0.002,
+                      llm_latency: float = 0.05, threads: int = api.API_THREADS, seed: int = 0) -> tuple:
+    """Serve api.app on a free local port, backed by a stub Elasticsearch and LLM
+
+    A synthetic corpus is embedded with the hashing encoder and ingested
+    into the stub cluster. The SearchEngine is built the way
+    api.get_search_engine() builds it, with the API's caches and limits,
+    and the ES connection pool sized to the server threads. Returns the
+    base URL and the server, whose close() stops it.
+    """
+    register_embedding_model(HashingEncoder())
+    es_client = create_stub_es_client(latency=es_latency, connections_per_node=threads)
+
+    workspace = tempfile.mkdtemp(prefix="rag-loadtest-")
+    original_cwd = os.getcwd()
+    try:
+        os.chdir(workspace)
+        os.makedirs("tesla_sec_filings")
+        write_synthetic_filings("tesla_sec_filings", num_filings, pages_per_filing, seed=seed)
+        embeddings.process_and_store_documents()
+        ElasticsearchIngestor(es_client).ingest_embeddings(rebuild=True)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    api.search_engine = SearchEngine(
+        es_client, llm_cache=api.llm_cache, llm_concurrency=api.LLM_CONCURRENCY,
+        llm_max_waiters=api.LLM_MAX_WAITERS, backend=ElasticsearchBackend(es_client), semantic_cache=api.semantic_cache,
+        llm_client=StubInferenceClient(latency=llm_latency), **api.retrieval_defaults
+    )
+    server = create_server(api.app, host="127.0.0.1", port=0, threads=threads)
+    threading.Thread(target=server.run, name="loadtest-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.effective_port}", server
+
+def run_load(url: str, queries: List[str], duration: float = 60.0, concurrency: int = 8,
+             qps: Optional[float] = None, body: Optional[Dict] = None, timeout: float = 30.0,
+             sample_interval: float = 5.0, warmup: int = 10, pid: Optional[int] = None) -> Dict:
+    """Replay queries against url/search for duration seconds and return the measurements
+
+    Without qps, concurrency clients send requests back to back (closed
+    loop). With qps, requests are started at that fixed rate by up to
+    concurrency clients (open loop), and latency is measured from each
+    request's scheduled start, so time spent queued behind a slow server
+    counts. Queries are cycled through in order and merged into body.
+    RSS is read from pid, or this process when the server runs in it.
+    """
+    endpoint = url.rstrip('/') + "/search"
+    body = body or {}
+    sessions = threading.local()
+    next_query = itertools.count()
+
+    def send(query: str) -> Optional[str]:
+        """Send one search, returning an error label if it failed"""
+        # One pooled connection per client thread, like a keep-alive client
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        try:
+            response = sessions.session.post(endpoint, json={**body, "query": query}, timeout=timeout)
+            return None if response.status_code == 200 else f"http_{response.status_code}"
+        except requests.RequestException as e:
+            return type(e).__name__
+
+    def query_at(i: int) -> str:
+        return queries[i % len(queries)]
+
+    # Warm up models, caches and connection pools without recording
+    for i in range(min(warmup, len(queries))):
+        send(query_at(i))
+
+    recorder = LoadRecorder(pid)
+    deadline = time.perf_counter() + duration
+    stop = threading.Event()
+
+    def sampler():
+        while not stop.wait(sample_interval):
+            window = recorder.sample()
+            logging.info(
+                f"{window['elapsed_seconds']:.0f}s: {window['qps']} req/s, p50 {window['p50_ms']}ms, "
+                f"p99 {window['p99_ms']}ms, {window['errors']} errors, RSS {window['rss_mb']} MB"
+            )
+
+    sampler_thread = threading.Thread(target=sampler, name="loadtest-sampler", daemon=True)
+    sampler_thread.start()
+
+    if qps:
+        def timed_send(query: str, scheduled: float):
+            error = send(query)
+            recorder.record(time.perf_counter() - scheduled, error)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            start = time.perf_counter()
+            for i in itertools.count():
+                scheduled = start + i / qps
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(timed_send, query_at(i), scheduled)
+    else:
+        def client():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                error = send(query_at(next(next_query)))
+                recorder.record(time.perf_counter() - start, error)
+
+        clients = [threading.Thread(target=client, name=f"loadtest-client-{i}") for i in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+
+    stop.set()
+    sampler_thread.join()
+    recorder.sample()
+    return {"summary": recorder.summary(), "windows": recorder.windows}
+
+def load_queries(path: Optional[str], count: int, seed: int) -> List[str]:
+    """Read queries from a JSON list or a text file with one query per line, or generate count of them"""
+    if not path:
+        return synthetic_queries(count, seed)
+    with open(path) as f:
+        text = f.read()
+    if path.endswith('.json'):
+        queries = json.loads(text)
+    else:
+        queries = [line.strip() for line in text.splitlines() if line.strip()]
+    if not queries:
+        raise ValueError(f"No queries in {path}")
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and soak test for the /search API")
+    parser.add_argument("--url", help="Base URL of a running API; by default one is started on local stubs")
+    parser.add_argument("--pid", type=int, help="Process to report the RSS of, with --url")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load for")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--qps", type=float, help="Target request rate; by default clients send back to back")
+    parser.add_argument("--queries", help="Query corpus: a .json list or a file with one query per line")
+    parser.add_argument("--num-queries", type=int, default=500, help="Synthetic queries to generate without --queries")
+    parser.add_argument("--body", default="{}", help='JSON fields added to every request, e.g. \'{"llm": false}\'')
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Seconds per reported window")
+    parser.add_argument("--warmup", type=int, default=10, help="Unrecorded requests sent before the run")
+    parser.add_argument("--threads", type=int, default=api.API_THREADS, help="Stub server request threads")
+    parser.add_argument("--filings", type=int, default=20, help="Synthetic filings in the stub index")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic filing")
+    parser.add_argument("--es-latency", type=float, default=0.002, help="Simulated ES round trip in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Simulated LLM call latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries, args.num_queries, args.seed)
+    server = None
+    if args.url:
+        url, pid = args.url, args.pid
+        if pid is None:
+            logging.warning("Reporting the RSS of this load generator; pass --pid for the server's")
+    else:
+        url, server = start_stub_server(args.filings, args.pages, args.es_latency, args.llm_latency,
+                                        args.threads, args.seed)
+        pid = None
+        logging.info(f"Serving the API on local stubs at {url}")
+
+    try:
+        results = run_load(
+            url, queries,
+            duration=args.duration,
+            concurrency=args.concurrency,
+            qps=args.qps,
+            body=json.loads(args.body),
+            timeout=args.timeout,
+            sample_interval=args.sample_interval,
+            warmup=args.warmup,
+            pid=pid
+        )
+    finally:
+        if server is not None:
+            server.close()
+
+    output = json.dumps({
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "params": {**vars(args), "num_queries": len(queries)}
+        },
+        "results": results
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        logging.info(f"Wrote load test results to {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
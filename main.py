@@ -1,4 +1,5 @@
 import os
+import threading
 from dotenv import load_dotenv
 from elastic_ingest import create_es_client
 from search import SearchEngine
@@ -32,6 +33,8 @@ def run_search_interface():
     try:
         # Initialize search engine
         search_engine = SearchEngine(es_client)
+        # Load the models while the user types the first query
+        threading.Thread(target=search_engine.warm_up, daemon=True).start()
         
         # Interactive search loop
         print("\nTesla SEC Filings Search")
@@ -47,29 +50,39 @@ def run_search_interface():
                 continue
                 
             print("\nSearching...")
-            search_results = search_engine.search(query)
-            
-            if not search_results['vector_results']:
-                print("No results found.")
-                continue
-            
-            # First show initial vector search results
-            print("\nInitial Vector Search Results:")
-            print("=" * 80)
-            for i, result in enumerate(search_results['vector_results'], 1):
-                print(f"\n{i}. Score: {result['score']:.4f}")
-                print(f"File: {result['file_name']}")
-                print(f"Chunk: {result['chunk_index']}")
-                print("-" * 40)
-                print(result['content'])
-                print("-" * 80)
-            
-            # Then display LLM reranked analysis
-            if search_results['llm_analysis']:
-                print("\nLLM Reranked Analysis:")
-                print("=" * 80)
-                print(search_results['llm_analysis'])
-                print("=" * 80)
+            has_analysis = False
+            for event in search_engine.search_stream(query):
+                if event['event'] == 'vector_results':
+                    if not event['data']:
+                        print("No results found.")
+                        break
+                    
+                    # First show initial vector search results
+                    print("\nInitial Vector Search Results:")
+                    print("=" * 80)
+                    for i, result in enumerate(event['data'], 1):
+                        print(f"\n{i}. Score: {result['score']:.4f}")
+                        print(f"File: {result['file_name']}")
+                        print(f"Chunk: {result['chunk_index']}")
+                        print("-" * 40)
+                        print(result['content'])
+                        print("-" * 80)
+                
+                elif event['event'] == 'token':
+                    # Then stream the LLM reranked analysis as it is generated
+                    if not has_analysis:
+                        print("\nLLM Reranked Analysis:")
+                        print("=" * 80)
+                        has_analysis = True
+                    print(event['data'], end='', flush=True)
+                
+                elif event['event'] == 'error':
+                    # The answer so far is incomplete, or no answer was generated
+                    print(f"\n[LLM error: {event['data']['error']} - {event['data']['message']}]")
+                
+                elif event['event'] == 'done' and has_analysis:
+                    print()
+                    print("=" * 80)
                 
     except Exception as e:
         logging.error(f"Pipeline error: {str(e)}")
@@ -0,0 +1,80 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_NAME = "manifest.json"
+
+def file_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def document_id(file_name: str, chunk_index: int, content: str) -> str:
+    """Return the deterministic document ID for a chunk
+
+    The ID changes whenever the chunk's content changes, so re-indexing an
+    unchanged chunk overwrites the same document instead of duplicating it.
+    """
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{file_name}:{chunk_index}:{content_hash}".encode('utf-8')).hexdigest()
+
+class Manifest:
+    """Local record of which filings are embedded and which documents are indexed
+
+    Stored as JSON in the embeddings directory:
+    {"filings": {file_name: {"file_hash": ..., "chunker": ..., "doc_ids": [...], "indexed_ids": [...]}}}
+    """
+
+    def __init__(self, embeddings_dir: str = "tesla_sec_filings_embeddings"):
+        self.path = os.path.join(embeddings_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.filings: Dict[str, Dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.filings = json.load(f).get("filings", {})
+
+    def save(self) -> None:
+        """Write the manifest atomically"""
+        with self._lock:
+            with open(self.path + ".tmp", 'w') as f:
+                json.dump({"filings": self.filings}, f)
+            os.replace(self.path + ".tmp", self.path)
+
+    def is_embedded(self, file_name: str, current_hash: str, chunker: Optional[str] = None) -> bool:
+        """Check whether a filing was embedded from a PDF with this hash, extracted with this chunker signature"""
+        entry = self.filings.get(file_name)
+        return entry is not None and entry.get("file_hash") == current_hash and entry.get("chunker") == chunker
+
+    def record_embedded(self, file_name: str, current_hash: Optional[str], doc_ids: List[str],
+                        chunker: Optional[str] = None) -> None:
+        """Record the document IDs embedded for a filing and the signature of the chunker used"""
+        with self._lock:
+            entry = self.filings.setdefault(file_name, {})
+            entry["file_hash"] = current_hash
+            entry["chunker"] = chunker
+            entry["doc_ids"] = list(doc_ids)
+
+    def indexed_ids(self, file_name: str) -> List[str]:
+        """Return the document IDs last indexed for a filing"""
+        return self.filings.get(file_name, {}).get("indexed_ids", [])
+
+    def record_indexed(self, file_name: str, doc_ids: Iterable[str]) -> None:
+        """Record the document IDs currently indexed for a filing"""
+        with self._lock:
+            self.filings.setdefault(file_name, {})["indexed_ids"] = sorted(doc_ids)
+
+    def remove(self, file_name: str) -> None:
+        """Forget a filing"""
+        with self._lock:
+            self.filings.pop(file_name, None)
+
+    def reset_indexed(self) -> None:
+        """Forget what is indexed, e.g. after the index was rebuilt"""
+        with self._lock:
+            for entry in self.filings.values():
+                entry.pop("indexed_ids", None)
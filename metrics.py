@@ -0,0 +1,195 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence
+
+# Default latency buckets in seconds, as used by the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(pairs: Sequence[tuple]) -> str:
+    """Format label pairs in the Prometheus text format"""
+    if not pairs:
+        return ""
+    escaped = [
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Metric:
+    """Base for named metrics with a fixed set of label names"""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> tuple:
+        """Return the values of labels in label_names order"""
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+class Counter(_Metric):
+    """Thread-safe monotonically increasing counter with labels"""
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """Add amount to the counter for these labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """Return the current value for these labels"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        """Return the sample lines in the Prometheus text format"""
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(list(zip(self.label_names, key)))} {_format_value(value)}"
+            for key, value in values
+        ]
+
+class Histogram(_Metric):
+    """Thread-safe histogram with cumulative buckets and labels"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        """Record one observation for these labels"""
+        key = self._key(labels)
+        with self._lock:
+            # Observations per bucket (+Inf last) and their sum, per label set
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        """Return the number of observations for these labels"""
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def samples(self) -> List[str]:
+        """Return the sample lines in the Prometheus text format"""
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together on the metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """Return the counter with this name, creating it on first use"""
+        return self._register(Counter, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Return the histogram with this name, creating it on first use"""
+        return self._register(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "search_stage_seconds", "Time spent in each search stage", ("stage",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "search_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")
+)
+LLM_CONTEXT_TOKENS = REGISTRY.histogram(
+    "llm_context_tokens", "Document context tokens sent per LLM prompt",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192)
+)
+LLM_CONTEXT_TOKENS_SAVED = REGISTRY.counter(
+    "llm_context_tokens_saved_total", "Retrieved chunk tokens left out of LLM prompts by merging, deduplication and trimming"
+)
+LLM_GENERATED_TOKENS = REGISTRY.counter(
+    "llm_generated_tokens_total", "Tokens generated by the LLM"
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "api_request_seconds", "API request latency by endpoint and status", ("endpoint", "status")
+)
+
+# Stage timings of the request running in this context, when one is being collected
+_current_timings = contextvars.ContextVar("search_timings", default=None)
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Collect the stage timings recorded in this context into a dict of seconds per stage"""
+    timings = {}
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration into STAGE_SECONDS and the timings being collected, if any"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a search stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup as a hit or a miss"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,86 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_CROSS_ENCODER = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# Models loaded in this process, keyed by kind, name and inference options
+_models: Dict[tuple, object] = {}
+# One lock per key, so loading one model does not block users of another
+_key_locks: Dict[tuple, threading.Lock] = {}
+_lock = threading.Lock()
+
+def _get_or_load(key: tuple, loader: Callable[[], object]):
+    """Return the model registered under key, loading it once if needed"""
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        if key not in _models:
+            start = time.perf_counter()
+            _models[key] = loader()
+            logging.info(f"Loaded {key[0]} model {key[1]} in {time.perf_counter() - start:.2f}s")
+        return _models[key]
+
+def _inference_options() -> tuple:
+    """Read the CPU inference options from the environment
+
+    EMBEDDING_BACKEND is "torch" (default), "onnx" or "openvino";
+    EMBEDDING_MODEL_FILE picks a file of an ONNX/OpenVINO export, e.g.
+    "onnx/model_qint8_avx512_vnni.onnx" for an int8 quantized model; and
+    EMBEDDING_QUANTIZE=1 applies dynamic int8 quantization to a torch model.
+    """
+    return (
+        os.getenv("EMBEDDING_BACKEND", "torch"),
+        os.getenv("EMBEDDING_MODEL_FILE") or None,
+        os.getenv("EMBEDDING_QUANTIZE") == "1"
+    )
+
+def _load(cls_name: str, model_name: str, backend: str, model_file: Optional[str], quantize: bool):
+    # sentence_transformers pulls in torch; import it only when a model is actually needed
+    import sentence_transformers
+    cls = getattr(sentence_transformers, cls_name)
+    kwargs = {}
+    if backend != "torch":
+        kwargs["backend"] = backend
+        if model_file:
+            kwargs["model_kwargs"] = {"file_name": model_file}
+    model = cls(model_name, **kwargs)
+    if quantize and backend == "torch":
+        import torch
+        # Swap Linear layers for int8 ones in place; the cross-encoder's network is its .model
+        torch_model = model if cls_name == "SentenceTransformer" else model.model
+        torch.quantization.quantize_dynamic(torch_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Return the shared SentenceTransformer for model_name, loading it on first use"""
+    options = _inference_options()
+    return _get_or_load(
+        ("embedding", model_name) + options,
+        lambda: _load("SentenceTransformer", model_name, *options)
+    )
+
+def get_cross_encoder(model_name: str = DEFAULT_CROSS_ENCODER):
+    """Return the shared CrossEncoder for model_name, loading it on first use"""
+    options = _inference_options()
+    return _get_or_load(
+        ("cross-encoder", model_name) + options,
+        lambda: _load("CrossEncoder", model_name, *options)
+    )
+
+def register_embedding_model(model, model_name: str = DEFAULT_EMBEDDING_MODEL) -> None:
+    """Use model (anything with SentenceTransformer's encode()) wherever model_name is requested"""
+    with _lock:
+        _models[("embedding", model_name) + _inference_options()] = model
@@ -0,0 +1,61 @@
+import threading
+import numpy as np
+from typing import Dict, List, Sequence, Union
+from models import DEFAULT_CROSS_ENCODER, get_cross_encoder
+
+class CrossEncoderReranker:
+    """Rerank retrieved chunks with a local cross-encoder
+
+    Each (query, chunk) pair is scored jointly by a small CPU model, which
+    orders candidates better than the embedding similarity alone.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, batch_size: int = 32):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # The model is shared by all request threads; score one batch set at a time
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The cross-encoder, loaded on first use"""
+        return get_cross_encoder(self.model_name)
+
+    def rerank(self, query: str, results: List[Dict], top_n: int) -> List[Dict]:
+        """Return the top_n results ordered by cross-encoder score"""
+        return self.rerank_many([query], [results], top_n)[0]
+
+    def rerank_many(self, queries: Sequence[str], result_lists: List[Union[List[Dict], Exception]],
+                    top_n: int) -> List[Union[List[Dict], Exception]]:
+        """Rerank several result lists, scoring all their pairs in one predict call
+
+        Exceptions in result_lists are passed through unchanged. Each kept
+        result's 'score' becomes the cross-encoder score and the original
+        score is kept as 'retrieval_score'.
+        """
+        pairs = [
+            (query, result['content'])
+            for query, results in zip(queries, result_lists)
+            if not isinstance(results, Exception)
+            for result in results
+        ]
+        if not pairs:
+            return list(result_lists)
+
+        with self._lock:
+            scores = np.asarray(self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False))
+
+        reranked = []
+        start = 0
+        for results in result_lists:
+            if isinstance(results, Exception):
+                reranked.append(results)
+                continue
+            list_scores = scores[start:start + len(results)]
+            start += len(results)
+            order = np.argsort(-list_scores, kind='stable')[:top_n]
+            reranked.append([
+                {**results[i], 'score': float(list_scores[i]), 'retrieval_score': results[i]['score']}
+                for i in order
+            ])
+        return reranked
@@ -0,0 +1,582 @@
+import os
+import re
+import math
+import hashlib
+import datetime
+import logging
+import threading
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Union
+from elasticsearch import Elasticsearch
+from embedding_store import list_stores, load_store, store_paths
+from metrics import timed
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+FUSION_METHODS = ("rrf", "weighted")
+DEFAULT_WEIGHTS = {"bm25": 1.0, "vector": 1.0}
+# Fields returned for each retrieved chunk, besides its score
+RESULT_FIELDS = ("content", "file_name", "chunk_index", "page_start", "page_end",
+                 "form_type", "fiscal_year", "fiscal_period", "filing_date")
+# Filters matching any of a list of values (or a single value) of a field
+FILTER_FIELDS = ("file_name", "form_type", "fiscal_year", "fiscal_period")
+# Filters bounding filing_date (inclusive), by range operator
+DATE_FILTERS = {"filed_after": "gte", "filed_before": "lte"}
+QUANTIZATION_METHODS = ("int8", "binary")
+# Candidates rescored with float vectors per requested result, by quantization
+DEFAULT_OVERSAMPLE = {"int8": 3.0, "binary": 10.0}
+# Rows quantized or scored at a time; small blocks keep their temporary float copy in cache
+QUANTIZATION_BLOCK_ROWS = 1024
+
+# Number of set bits in each byte value, for numpy versions without bitwise_count
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def quantize_int8(vectors: np.ndarray) -> tuple:
+    """Quantize vectors to int8 codes with one float32 scale per vector, so vector ~= codes * scale"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Quantize vectors to one sign bit per dimension, packed eight to a byte"""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """Count the set bits of each byte"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits)
+    return _POPCOUNT[bits]
+
+def normalize_filters(filters: Optional[Dict]) -> Optional[Dict]:
+    """Validate search filters and return them with every FILTER_FIELDS value as a list
+
+    Raises ValueError for unknown filters or malformed values. Returns None
+    when there is nothing to filter on.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    normalized = {}
+    for name, value in filters.items():
+        if name in FILTER_FIELDS:
+            values = value if isinstance(value, list) else [value]
+            if not values:
+                raise ValueError(f"Filter {name} needs at least one value")
+            if name == "fiscal_year":
+                if not all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                    raise ValueError("fiscal_year must be a year or a list of years")
+            elif not all(isinstance(v, str) for v in values):
+                raise ValueError(f"{name} must be a string or a list of strings")
+            elif name in ("form_type", "fiscal_period"):
+                values = [v.upper() for v in values]
+            normalized[name] = values
+        elif name in DATE_FILTERS:
+            try:
+                datetime.date.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be a date like 2024-01-31")
+            normalized[name] = value
+        else:
+            raise ValueError(f"Unknown filter {name!r}, expected one of {FILTER_FIELDS + tuple(DATE_FILTERS)}")
+    return normalized or None
+
+def filter_clauses(filters: Optional[Dict]) -> List[Dict]:
+    """Translate normalized filters into Elasticsearch filter clauses"""
+    if not filters:
+        return []
+    clauses = [{"terms": {field: filters[field]}} for field in FILTER_FIELDS if field in filters]
+    bounds = {operator: filters[name] for name, operator in DATE_FILTERS.items() if name in filters}
+    if bounds:
+        clauses.append({"range": {"filing_date": bounds}})
+    return clauses
+
+def fuse_results(bm25_results: List[Dict], vector_results: List[Dict], k: int,
+                 fusion: str = "rrf", weights: Optional[Dict[str, float]] = None,
+                 rank_constant: int = 60) -> List[Dict]:
+    """Fuse BM25 and vector result lists into one ranking of k results
+
+    fusion="rrf" scores each chunk by sum(weight / (rank_constant + rank)) over
+    the lists it appears in. fusion="weighted" min-max normalizes each list's
+    scores to [0, 1] and sums them times the list weight. The fused score
+    replaces each result's 'score'.
+    """
+    if fusion not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method {fusion!r}, expected one of {FUSION_METHODS}")
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+
+    fused = {}
+    chunks = {}
+    for name, results in (("bm25", bm25_results), ("vector", vector_results)):
+        weight = float(weights[name])
+        if fusion == "rrf":
+            contributions = [weight / (rank_constant + rank) for rank in range(1, len(results) + 1)]
+        else:
+            scores = [r['score'] for r in results]
+            low, high = (min(scores), max(scores)) if scores else (0.0, 0.0)
+            contributions = [
+                weight * ((score - low) / (high - low) if high > low else 1.0)
+                for score in scores
+            ]
+        for result, contribution in zip(results, contributions):
+            key = (result['file_name'], result['chunk_index'])
+            chunks.setdefault(key, result)
+            fused[key] = fused.get(key, 0.0) + contribution
+
+    ranked = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [{**chunks[key], 'score': fused[key]} for key in ranked]
+
+class ElasticsearchBackend:
+    """Retrieval backend using Elasticsearch KNN search"""
+
+    def __init__(self, es_client: Elasticsearch, index_name: str = "tesla_filings", num_candidates: int = 100,
+                 rank_window_size: int = 50, rescore_oversample: Optional[float] = None):
+        self.es = es_client
+        self.index_name = index_name
+        self.num_candidates = num_candidates
+        # Hybrid search fuses the top rank_window_size hits of each retriever
+        self.rank_window_size = rank_window_size
+        # With a quantized index (int8_hnsw, bbq_hnsw), rescore k * rescore_oversample
+        # candidates with the float vectors (Elasticsearch 8.18+)
+        self.rescore_oversample = rescore_oversample
+
+    def _knn_query(self, query_vector: np.ndarray, k: int, filters: Optional[Dict] = None) -> Dict:
+        """Construct the KNN query body for a query vector, pre-filtered by filters"""
+        knn = {
+            "field": "embedding",
+            "query_vector": query_vector.tolist(),
+            "k": k,
+            "num_candidates": max(self.num_candidates, k)
+        }
+        if self.rescore_oversample:
+            knn["rescore_vector"] = {"oversample": self.rescore_oversample}
+        if filters:
+            # Filtering inside the KNN search only visits matching documents
+            knn["filter"] = {"bool": {"filter": filter_clauses(filters)}}
+        return {
+            "knn": knn,
+            "_source": list(RESULT_FIELDS)
+        }
+
+    def _bm25_query(self, query_text: str, k: int, filters: Optional[Dict] = None) -> Dict:
+        """Construct the BM25 match query body for a query text, filtered by filters"""
+        query = {"match": {"content": query_text}}
+        if filters:
+            query = {"bool": {"must": query, "filter": filter_clauses(filters)}}
+        return {
+            "query": query,
+            "size": k,
+            "_source": list(RESULT_FIELDS)
+        }
+
+    def search(self, query_vector: np.ndarray, k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        """Return the k nearest chunks matching filters as result dicts"""
+        # Execute search
+        with timed("retrieve"):
+            response = self.es.search(
+                index=self.index_name,
+                body=self._knn_query(query_vector, k, filters)
+            )
+        with timed("shape"):
+            return self._shape_hits(response)
+
+    def search_many(self, query_vectors: List[np.ndarray], k: int,
+                    filters: Optional[Dict] = None) -> List[Union[List[Dict], Exception]]:
+        """Run several KNN searches with the same filters in one msearch request
+
+        Returns one entry per query vector, in order: its result dicts, or
+        the exception describing why that search failed.
+        """
+        searches = []
+        for query_vector in query_vectors:
+            searches.append({"index": self.index_name})
+            searches.append(self._knn_query(query_vector, k, filters))
+
+        with timed("retrieve"):
+            response = self.es.msearch(searches=searches)
+
+        with timed("shape"):
+            results = []
+            for item in response['responses']:
+                if 'error' in item:
+                    results.append(RuntimeError(f"Search failed: {item['error']}"))
+                else:
+                    results.append(self._shape_hits(item))
+            return results
+
+    def hybrid_search(self, query_text: str, query_vector: np.ndarray, k: int,
+                      fusion: str = "rrf", weights: Optional[Dict[str, float]] = None,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        """Return the k best chunks by fused BM25 and KNN ranking"""
+        results = self.hybrid_search_many([query_text], [query_vector], k, fusion, weights, filters)[0]
+        if isinstance(results, Exception):
+            raise results
+        return results
+
+    def hybrid_search_many(self, query_texts: Sequence[str], query_vectors: List[np.ndarray], k: int,
+                           fusion: str = "rrf", weights: Optional[Dict[str, float]] = None,
+                           filters: Optional[Dict] = None) -> List[Union[List[Dict], Exception]]:
+        """Run BM25 and KNN searches for several queries in one msearch request and fuse each pair
+
+        Returns one entry per query, in order, like search_many.
+        """
+        window = max(k, self.rank_window_size)
+        searches = []
+        for query_text, query_vector in zip(query_texts, query_vectors):
+            searches.append({"index": self.index_name})
+            searches.append(self._bm25_query(query_text, window, filters))
+            searches.append({"index": self.index_name})
+            searches.append(self._knn_query(query_vector, window, filters))
+
+        with timed("retrieve"):
+            response = self.es.msearch(searches=searches)
+        items = response['responses']
+
+        with timed("shape"):
+            results = []
+            for bm25_item, knn_item in zip(items[0::2], items[1::2]):
+                failed = [item['error'] for item in (bm25_item, knn_item) if 'error' in item]
+                if failed:
+                    results.append(RuntimeError(f"Search failed: {failed[0]}"))
+                else:
+                    results.append(fuse_results(self._shape_hits(bm25_item), self._shape_hits(knn_item),
+                                                k, fusion, weights))
+            return results
+
+    def _shape_hits(self, response) -> List[Dict]:
+        """Shape search hits into result dicts"""
+        results = []
+        for hit in response['hits']['hits']:
+            # Documents indexed before a field existed lack it
+            result = {field: hit['_source'].get(field) for field in RESULT_FIELDS}
+            result['score'] = hit['_score']
+            results.append(result)
+        return results
+
+    def version(self) -> Optional[str]:
+        """Return the index version stamped in the mapping metadata by the ingestor"""
+        mapping = self.es.indices.get_mapping(index=self.index_name)
+        return mapping[self.index_name]["mappings"].get("_meta", {}).get("index_version")
+
+class BM25Index:
+    """In-memory BM25 index over chunk texts, scored like Elasticsearch's default similarity"""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        postings = {}
+        lengths = []
+        for position, text in enumerate(texts):
+            terms = self.tokenize(text)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append((position, count))
+
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if len(lengths) else 0.0
+        # Each term maps to (positions, term frequencies) arrays
+        self.postings = {
+            term: (np.array([p for p, _ in rows]), np.array([c for _, c in rows], dtype=np.float32))
+            for term, rows in postings.items()
+        }
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Lowercase a text and split it into word tokens"""
+        return re.findall(r'\w+', text.lower())
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def search(self, query_text: str, k: int, mask: Optional[np.ndarray] = None) -> tuple:
+        """Return the positions and BM25 scores of the k best matching texts, among those set in mask if given"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        if not self.average_length:
+            return np.array([], dtype=int), scores[:0]
+        norms = self.k1 * (1 - self.b + self.b * self.lengths / self.average_length)
+        for term in set(self.tokenize(query_text)):
+            if term not in self.postings:
+                continue
+            positions, frequencies = self.postings[term]
+            idf = math.log(1 + (len(self) - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * frequencies * (self.k1 + 1) / (frequencies + norms[positions])
+        if mask is not None:
+            scores[~mask] = 0
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind='stable')]
+        return order, scores[order]
+
+class LocalVectorIndex:
+    """In-process retrieval backend over the local binary embedding stores
+
+    Exact search is a matrix product against each filing's memory-mapped
+    vectors. With approximate=True an HNSW index (requires hnswlib) is
+    built over all vectors instead. With quantization="int8" or "binary",
+    all vectors are scanned as int8 codes or sign bits held in memory, and
+    the best k * oversample candidates are rescored with their float vectors,
+    read from the memory-mapped stores. Hybrid search uses an in-memory
+    BM25Index over the chunk texts, built on first use. Filters are applied
+    as a row mask over metadata columns, also built on first use.
+    """
+
+    def __init__(self, segments: List[tuple], version: Optional[str] = None,
+                 approximate: bool = False, ef: int = 64, rank_window_size: int = 50,
+                 quantization: Optional[str] = None, oversample: Optional[float] = None):
+        if quantization is not None and quantization not in QUANTIZATION_METHODS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATION_METHODS}")
+        if quantization is not None and approximate:
+            raise ValueError("Quantized search is exact over the codes; it cannot be combined with approximate=True")
+        # Each segment is a (vectors, metadata) pair for one filing
+        self.segments = [(vectors, metadata) for vectors, metadata in segments if len(metadata)]
+        self.offsets = np.cumsum([0] + [len(metadata) for _, metadata in self.segments])
+        self._version = version
+        self.hnsw = self._build_hnsw(ef) if approximate else None
+        self.quantization = quantization
+        self.oversample = oversample or DEFAULT_OVERSAMPLE.get(quantization)
+        self._codes, self._scales = self._quantize() if quantization else (None, None)
+        self.rank_window_size = rank_window_size
+        self._bm25 = None
+        self._bm25_lock = threading.Lock()
+        self._columns = None
+        self._columns_lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, embeddings_dir: str = "tesla_sec_filings_embeddings", **kwargs) -> "LocalVectorIndex":
+        """Load all binary stores in embeddings_dir into an index"""
+        stems = list_stores(embeddings_dir)
+        segments = [load_store(embeddings_dir, stem) for stem in stems]
+
+        # Version the index by the newest store and the set of stores, so caches invalidate
+        # after re-embedding and after a filing is removed
+        mtimes = [os.path.getmtime(store_paths(embeddings_dir, stem)[0]) for stem in stems]
+        stores_hash = hashlib.sha256("\n".join(sorted(stems)).encode("utf-8")).hexdigest()[:12]
+        version = f"{datetime.datetime.fromtimestamp(max(mtimes)).isoformat()}+{stores_hash}" if mtimes else None
+
+        index = cls(segments, version=version, **kwargs)
+        logging.info(f"Loaded local vector index with {len(index)} vectors from {len(stems)} filings")
+        return index
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def _build_hnsw(self, ef: int):
+        """Build an HNSW index over all vectors"""
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("Approximate local search requires hnswlib (pip install hnswlib)")
+
+        vectors = np.concatenate([np.asarray(v, dtype=np.float32) for v, _ in self.segments])
+        index = hnswlib.Index(space='cosine', dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+        index.add_items(vectors, np.arange(len(vectors)))
+        index.set_ef(ef)
+        return index
+
+    def _quantize(self) -> tuple:
+        """Quantize all vectors block by block, returning the codes and int8 scales (None for binary)"""
+        codes = []
+        scales = []
+        for vectors, _ in self.segments:
+            for start in range(0, len(vectors), QUANTIZATION_BLOCK_ROWS):
+                block = vectors[start:start + QUANTIZATION_BLOCK_ROWS]
+                if self.quantization == "int8":
+                    block_codes, block_scales = quantize_int8(block)
+                    scales.append(block_scales)
+                else:
+                    block_codes = quantize_binary(block)
+                codes.append(block_codes)
+        if not codes:
+            return None, None
+        return np.concatenate(codes), np.concatenate(scales) if scales else None
+
+    def vector_bytes(self) -> int:
+        """Return the bytes of vector data a search scans: the codes when quantized, else the float stores"""
+        if self._codes is not None:
+            return self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+        return sum(vectors.nbytes for vectors, _ in self.segments)
+
+    def _row(self, position: int) -> Dict:
+        """Return the metadata for a global row position"""
+        segment = int(np.searchsorted(self.offsets, position, side='right')) - 1
+        return self.segments[segment][1][position - self.offsets[segment]]
+
+    def _shape(self, positions, similarities) -> List[Dict]:
+        """Shape rows into result dicts scored like ES cosine similarity"""
+        results = []
+        for position, similarity in zip(positions, similarities):
+            row = self._row(int(position))
+            result = {field: row.get(field) for field in RESULT_FIELDS}
+            result['score'] = (1 + float(similarity)) / 2
+            results.append(result)
+        return results
+
+    def _filter_columns(self) -> Dict[str, np.ndarray]:
+        """Return the filterable metadata fields as arrays over all rows, building them on first use"""
+        with self._columns_lock:
+            if self._columns is None:
+                rows = [row for _, metadata in self.segments for row in metadata]
+                # Missing values become "" or -1, which no filter value matches
+                self._columns = {
+                    field: np.array([row.get(field) or "" for row in rows], dtype=str)
+                    for field in ("file_name", "form_type", "fiscal_period", "filing_date")
+                }
+                self._columns["fiscal_year"] = np.array(
+                    [row.get("fiscal_year") or -1 for row in rows], dtype=np.int64
+                )
+            return self._columns
+
+    def _filter_mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Return a boolean mask of the rows matching normalized filters, or None without filters"""
+        if not filters:
+            return None
+        columns = self._filter_columns()
+        mask = np.ones(len(self), dtype=bool)
+        for field in FILTER_FIELDS:
+            if field in filters:
+                mask &= np.isin(columns[field], filters[field])
+        dates = columns["filing_date"]
+        if "filed_after" in filters:
+            mask &= (dates != "") & (dates >= filters["filed_after"])
+        if "filed_before" in filters:
+            mask &= (dates != "") & (dates <= filters["filed_before"])
+        return mask
+
+    def search(self, query_vector: np.ndarray, k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        """Return the k nearest chunks matching filters as result dicts"""
+        mask = self._filter_mask(filters)
+        k = min(k, len(self) if mask is None else int(mask.sum()))
+        if k == 0:
+            return []
+        with timed("retrieve"):
+            positions, similarities = self._nearest(np.asarray(query_vector, dtype=np.float32), k, mask)
+        with timed("shape"):
+            return self._shape(positions, similarities)
+
+    def _nearest(self, query_vector: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> tuple:
+        """Return the global positions and cosine similarities of the k nearest vectors among those set in mask
+
+        k must not exceed the number of rows in mask.
+        """
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(
+                query_vector, k=k, filter=None if mask is None else lambda label: bool(mask[label])
+            )
+            return labels[0], 1 - distances[0]
+        if self._codes is not None:
+            return self._nearest_quantized(query_vector, k, mask)
+
+        # Exact search: keep the top k of every segment, then merge
+        positions = []
+        similarities = []
+        for (vectors, _), offset in zip(self.segments, self.offsets):
+            scores = vectors @ query_vector
+            if mask is not None:
+                scores = np.where(mask[offset:offset + len(scores)], scores, -np.inf)
+            top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            positions.append(top + offset)
+            similarities.append(scores[top])
+        positions = np.concatenate(positions)
+        similarities = np.concatenate(similarities).astype(np.float32)
+        order = np.argsort(-similarities, kind='stable')[:k]
+        return positions[order], similarities[order]
+
+    def _nearest_quantized(self, query_vector: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> tuple:
+        """Rank all vectors by their quantized codes, then rescore the best candidates with float vectors"""
+        if self.quantization == "int8":
+            scores = np.empty(len(self), dtype=np.float32)
+            for start in range(0, len(self), QUANTIZATION_BLOCK_ROWS):
+                end = start + QUANTIZATION_BLOCK_ROWS
+                scores[start:end] = (self._codes[start:end] @ query_vector) * self._scales[start:end]
+        else:
+            # Fewer differing sign bits means a smaller angle
+            differing = _popcount(self._codes ^ quantize_binary(query_vector[None, :])).sum(axis=1, dtype=np.int32)
+            scores = -differing.astype(np.float32)
+        if mask is not None:
+            scores[~mask] = -np.inf
+
+        allowed = len(self) if mask is None else int(mask.sum())
+        num_candidates = min(allowed, max(k, math.ceil(k * self.oversample)))
+        if num_candidates < len(self):
+            candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+        else:
+            candidates = np.arange(len(self))
+        similarities = self._vectors(candidates) @ query_vector
+        order = np.argsort(-similarities, kind='stable')[:k]
+        return candidates[order], similarities[order]
+
+    def _vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Read the float32 vectors at global row positions from their segments"""
+        segments = np.searchsorted(self.offsets, positions, side='right') - 1
+        vectors = np.empty((len(positions), self.segments[0][0].shape[1]), dtype=np.float32)
+        for segment in np.unique(segments):
+            rows = segments == segment
+            vectors[rows] = self.segments[segment][0][positions[rows] - self.offsets[segment]]
+        return vectors
+
+    def search_many(self, query_vectors: List[np.ndarray], k: int,
+                    filters: Optional[Dict] = None) -> List[Union[List[Dict], Exception]]:
+        """Return the k nearest chunks matching filters for each query vector, in order"""
+        results = []
+        for query_vector in query_vectors:
+            try:
+                results.append(self.search(query_vector, k, filters))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _bm25_index(self) -> BM25Index:
+        """Return the BM25 index over all chunk texts, building it on first use"""
+        with self._bm25_lock:
+            if self._bm25 is None:
+                self._bm25 = BM25Index([row['content'] for _, metadata in self.segments for row in metadata])
+            return self._bm25
+
+    def text_search(self, query_text: str, k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        """Return the k best BM25 matches for a query text among chunks matching filters, as result dicts"""
+        mask = self._filter_mask(filters)
+        with timed("retrieve"):
+            positions, scores = self._bm25_index().search(query_text, k, mask)
+        with timed("shape"):
+            results = self._shape(positions, scores)
+            # _shape maps cosine similarity to [0, 1]; BM25 scores are used as they are
+            for result, score in zip(results, scores):
+                result['score'] = float(score)
+            return results
+
+    def hybrid_search(self, query_text: str, query_vector: np.ndarray, k: int,
+                      fusion: str = "rrf", weights: Optional[Dict[str, float]] = None,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        """Return the k best chunks by fused BM25 and vector ranking"""
+        window = max(k, self.rank_window_size)
+        bm25_results = self.text_search(query_text, window, filters)
+        vector_results = self.search(query_vector, window, filters)
+        with timed("shape"):
+            return fuse_results(bm25_results, vector_results, k, fusion, weights)
+
+    def hybrid_search_many(self, query_texts: Sequence[str], query_vectors: List[np.ndarray], k: int,
+                           fusion: str = "rrf", weights: Optional[Dict[str, float]] = None,
+                           filters: Optional[Dict] = None) -> List[Union[List[Dict], Exception]]:
+        """Return the hybrid results for each query, in order"""
+        results = []
+        for query_text, query_vector in zip(query_texts, query_vectors):
+            try:
+                results.append(self.hybrid_search(query_text, query_vector, k, fusion, weights, filters))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def version(self) -> Optional[str]:
+        """Return the version of the loaded stores"""
+        return self._version
@@ -1,68 +1,230 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import os
+import json
 import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import urljoin
 
-def create_download_directory():
-    download_dir = "tesla_sec_filings"
+DOWNLOAD_STATE_FILE = ".downloads.json"
+# Guards the download state shared by the download threads while it is changed or saved
+_state_lock = threading.Lock()
+
+class RateLimiter:
+    """Global request rate limit shared by all download threads"""
+
+    def __init__(self, rate):
+        # rate is in requests per second; None or 0 disables limiting
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next request is allowed"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def create_session(pool_size=8):
+    """Create a pooled HTTP session with retries on transient errors"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def create_download_directory(download_dir="tesla_sec_filings"):
     if not os.path.exists(download_dir):
         os.makedirs(download_dir)
     return download_dir
 
-def download_pdf(url, filename, download_dir, page_num):
+def load_download_state(download_dir):
+    """Load the ETag/Content-Length recorded for each downloaded file"""
+    path = os.path.join(download_dir, DOWNLOAD_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_download_state(download_dir, state):
+    """Save the recorded ETag/Content-Length of downloaded files"""
+    path = os.path.join(download_dir, DOWNLOAD_STATE_FILE)
+    with _state_lock:
+        with open(path + ".tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+def resume_validator(part_state):
+    """Return the If-Range value for resuming a partial download, or None if it cannot be resumed safely
+
+    Weak ETags cannot be used with If-Range, so Last-Modified is the fallback.
+    """
+    etag = part_state.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return part_state.get('last_modified')
+
+def is_up_to_date(filepath, headers, recorded):
+    """Check a file on disk against the server's ETag and Content-Length"""
+    if not os.path.exists(filepath):
+        return False
+    etag = headers.get('ETag')
+    if etag and recorded.get('etag'):
+        return etag == recorded['etag']
+    length = headers.get('Content-Length')
+    return length is not None and int(length) == os.path.getsize(filepath)
+
+def download_pdf(url, filename, download_dir, page_num, session=None, rate_limiter=None, state=None):
+    session = session or requests
+    rate_limiter = rate_limiter or RateLimiter(None)
+    state = state if state is not None else {}
+
+    # Add page number to filename
+    name, ext = os.path.splitext(filename)
+    new_filename = f"{name}_page{page_num}{ext}"
+    filepath = os.path.join(download_dir, new_filename)
+    part_path = filepath + ".part"
+    recorded = state.get(new_filename, {})
+
     try:
-        response = requests.get(url, stream=True)
+        # Skip files that are already on disk and unchanged on the server
+        if os.path.exists(filepath):
+            rate_limiter.wait()
+            head = session.head(url, allow_redirects=True, timeout=30)
+            head.raise_for_status()
+            if is_up_to_date(filepath, head.headers, recorded):
+                print(f"Already downloaded: {new_filename}")
+                return filepath
+
+        # Resume a partial download where it left off, but only from the same version of the
+        # file: If-Range makes the server send the whole file if it has changed since
+        headers = {}
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = resume_validator(recorded.get('part', {}))
+        if offset and validator:
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = validator
+
+        rate_limiter.wait()
+        response = session.get(url, stream=True, headers=headers, timeout=60)
+        if response.status_code == 416:
+            # The partial file is not a prefix of the current file; start over
+            os.remove(part_path)
+            with _state_lock:
+                state.get(new_filename, {}).pop('part', None)
+            return download_pdf(url, filename, download_dir, page_num, session, rate_limiter, state)
         response.raise_for_status()
-        
-        # Add page number to filename
-        name, ext = os.path.splitext(filename)
-        new_filename = f"{name}_page{page_num}{ext}"
-        
-        filepath = os.path.join(download_dir, new_filename)
-        with open(filepath, 'wb') as f:
+
+        # 206 means the server honoured the range from our offset; otherwise write the whole file
+        resumed = (response.status_code == 206 and 'Range' in headers
+                   and response.headers.get('Content-Range', '').startswith(f"bytes {offset}-"))
+        if not resumed:
+            if response.status_code == 206:
+                response.close()
+                raise ValueError(f"Unexpected partial response {response.headers.get('Content-Range')!r}")
+            # Record which version of the file the .part holds before writing any of it
+            with _state_lock:
+                state[new_filename] = {**recorded, 'part': {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }}
+            save_download_state(download_dir, state)
+        mode = 'ab' if resumed else 'wb'
+        with open(part_path, mode) as f:
             for chunk in response.iter_content(chunk_size=8192):
                 if chunk:
                     f.write(chunk)
+        os.replace(part_path, filepath)
+
+        with _state_lock:
+            state[new_filename] = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'content_length': os.path.getsize(filepath)
+            }
         print(f"Successfully downloaded: {new_filename}")
-        return True
+        return filepath
     except Exception as e:
         print(f"Error downloading {filename}: {str(e)}")
-        return False
+        return None
+
+def find_filing_links(url, base_url, session, rate_limiter):
+    """Return the PDF URLs listed on one listing page"""
+    rate_limiter.wait()
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    # Find all PDF links
+    filing_links = soup.find_all('a', href=lambda x: x and x.endswith('.pdf'))
+    return [urljoin(base_url, link['href']) for link in filing_links]
 
-def scrape_tesla_sec_filings():
-    base_url = "https://ir.tesla.com/sec-filings"
-    download_dir = create_download_directory()
-    
-    for page in range(1, 30):  # 131 pages total
+def iter_tesla_sec_filings(base_url="https://ir.tesla.com/sec-filings", download_dir="tesla_sec_filings",
+                           pages=range(1, 30), workers=4, rate_limit=2.0):
+    """Download SEC filings concurrently, yielding each file path as soon as it is on disk
+
+    Listing pages are fetched by workers threads and each page's filings
+    start downloading, in another workers threads, as soon as that page is
+    listed. All threads share one pooled session and a global limit of
+    rate_limit requests per second. Files already on disk are skipped when
+    their ETag or Content-Length still match, and partial downloads resume.
+    """
+    download_dir = create_download_directory(download_dir)
+    session = create_session(pool_size=2 * workers)
+    rate_limiter = RateLimiter(rate_limit)
+    state = load_download_state(download_dir)
+
+    def page_links(page):
         print(f"Processing page {page}")
-        
         if page == 1:
             url = base_url
         else:
             url = f"{base_url}#list_id=tcl-list-1&page={page}"
-            
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find all PDF links
-            filing_links = soup.find_all('a', href=lambda x: x and x.endswith('.pdf'))
-            
-            for link in filing_links:
-                pdf_url = urljoin(base_url, link['href'])
-                filename = pdf_url.split('/')[-1]
-                
-                # Download the PDF with page number
-                download_pdf(pdf_url, filename, download_dir, page)
-                
-                # Add a small delay to avoid overwhelming the server
-                time.sleep(1)
-                
+            return page, find_filing_links(url, base_url, session, rate_limiter)
         except Exception as e:
             print(f"Error processing page {page}: {str(e)}")
-            continue
-        
-        # Add a delay between pages
-        time.sleep(2)
+            return page, []
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as listing, ThreadPoolExecutor(max_workers=workers) as downloads:
+            listed = {listing.submit(page_links, page) for page in pages}
+            pending = set(listed)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in listed:
+                        page, links = future.result()
+                        for pdf_url in links:
+                            filename = pdf_url.split('/')[-1]
+
+                            # Download the PDF with page number
+                            pending.add(downloads.submit(
+                                download_pdf, pdf_url, filename, download_dir, page, session, rate_limiter, state
+                            ))
+                    else:
+                        filepath = future.result()
+                        if filepath:
+                            yield filepath
+    finally:
+        save_download_state(download_dir, state)
+        session.close()
+
+def scrape_tesla_sec_filings(base_url="https://ir.tesla.com/sec-filings", download_dir="tesla_sec_filings",
+                             pages=range(1, 30), workers=4, rate_limit=2.0):
+    """Download all SEC filings, see iter_tesla_sec_filings"""
+    downloaded = list(iter_tesla_sec_filings(base_url, download_dir, pages, workers, rate_limit))
+    print(f"{len(downloaded)} filings on disk")
+    return downloaded
@@ -1,10 +1,16 @@
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from elasticsearch import Elasticsearch
-from huggingface_hub import InferenceClient
 import logging
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from cache import LRUCache, SemanticCache, make_key, normalize_query, query_literals
+from context import ContextBuilder, TokenCounter, format_documents
+from models import get_embedding_model
+from metrics import LLM_CONTEXT_TOKENS, LLM_CONTEXT_TOKENS_SAVED, LLM_GENERATED_TOKENS, record_cache, record_stage, timed
+from retrieval import ElasticsearchBackend, RETRIEVAL_MODES, normalize_filters
 
 # Configure logging
 logging.basicConfig(
@@ -13,22 +19,191 @@ logging.basicConfig(
 )
 
 class SearchEngine:
-    def __init__(self, es_client: Elasticsearch, model_name: str = 'all-MiniLM-L6-v2'):
+    def __init__(self, es_client: Elasticsearch, model_name: str = 'all-MiniLM-L6-v2',
+                 query_cache_size: int = 1024, query_cache_ttl: Optional[float] = None,
+                 llm_client=None, llm_cache=None, index_version_ttl: float = 30.0,
+                 llm_concurrency: int = 4, llm_queue_timeout: Optional[float] = 30.0,
+                 llm_max_waiters: Optional[int] = None,
+                 backend=None, retrieval_mode: str = "vector", fusion: str = "rrf",
+                 fusion_weights: Optional[Dict[str, float]] = None, reranker=None,
+                 rerank_candidates: int = 50, model=None, context_builder: Optional[ContextBuilder] = None,
+                 max_context_tokens: int = 2048, semantic_cache: Optional[SemanticCache] = None):
         self.es = es_client
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        # Any encoder with SentenceTransformer's encode() can be passed in as model;
+        # otherwise the shared model is loaded on first use
+        self._model = model
         self.index_name = "tesla_filings"
-        # Initialize Mixtral client
-        self.llm_client = InferenceClient(token=os.getenv("HF_TOKEN"))
+        # Retrieval backend: ES KNN by default, or e.g. retrieval.LocalVectorIndex
+        self.backend = backend or ElasticsearchBackend(es_client, self.index_name)
+        # Default retrieval: "vector" KNN only, or "hybrid" BM25 + KNN fused by "rrf" or "weighted"
+        self.retrieval_mode = retrieval_mode
+        self.fusion = fusion
+        self.fusion_weights = fusion_weights
+        # Optional local reranker (e.g. rerank.CrossEncoderReranker): retrieve rerank_candidates
+        # chunks, then keep the k it scores highest
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        # Cache query embeddings so repeated questions skip encoding
+        self.query_cache = LRUCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        # Mixtral client, created on first use unless one is passed in
+        self._llm_client = llm_client
+        self.llm_model = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+        self.llm_params = {"max_new_tokens": 512, "temperature": 0.1}
+        # Fit retrieved chunks into max_context_tokens of the LLM's tokens, merged and deduplicated
+        self.context_builder = context_builder or ContextBuilder(
+            TokenCounter(self.llm_model), max_tokens=max_context_tokens
+        )
+        # Bound concurrent LLM calls; vector-only searches never take this semaphore
+        self.llm_concurrency = llm_concurrency
+        self.llm_semaphore = threading.BoundedSemaphore(llm_concurrency)
+        self.llm_queue_timeout = llm_queue_timeout
+        # Requests waiting for a slot hold a server thread each; beyond llm_max_waiters
+        # (unbounded if None) answer with vector results at once instead of queueing
+        self.llm_max_waiters = llm_max_waiters
+        self._llm_waiters = 0
+        self._llm_waiters_lock = threading.Lock()
+        # Cache LLM answers per query and retrieved chunk set (any LRUCache-like backend)
+        self.llm_cache = llm_cache if llm_cache is not None else LRUCache(maxsize=256)
+        # Optional cache of whole search responses keyed by query embedding, so paraphrases of a
+        # recent query skip retrieval and the LLM; cleared when the index version changes
+        self.semantic_cache = semantic_cache
+        self.index_version_ttl = index_version_ttl
+        self._index_version = None
+        self._index_version_checked = 0.0
+
+    @property
+    def model(self):
+        """The query encoder"""
+        return self._model or get_embedding_model(self.model_name)
+
+    @property
+    def llm_client(self):
+        """The LLM inference client"""
+        if self._llm_client is None:
+            # huggingface_hub is only imported once an LLM answer is needed
+            from huggingface_hub import InferenceClient
+            self._llm_client = InferenceClient(token=os.getenv("HF_TOKEN"))
+        return self._llm_client
+
+    def warm_up(self) -> float:
+        """Load the models and tokenizer searches use, returning the seconds it took"""
+        start = time.perf_counter()
+        self.model.encode("warm up", normalize_embeddings=True)
+        self.context_builder.token_counter.count("warm up")
+        if self.reranker is not None:
+            self.reranker.rerank("warm up", [{'content': "warm up", 'score': 0.0}], 1)
+        return time.perf_counter() - start
+
+    def index_version(self) -> Optional[str]:
+        """Return the backend's index version, re-read at most every index_version_ttl seconds"""
+        now = time.monotonic()
+        if now - self._index_version_checked >= self.index_version_ttl:
+            try:
+                version = self.backend.version()
+                if version != self._index_version and self._index_version is not None and self.semantic_cache is not None:
+                    logging.info("Index version changed, clearing the semantic cache")
+                    self.semantic_cache.clear()
+                self._index_version = version
+            except Exception as e:
+                logging.error(f"Error reading index version: {str(e)}")
+            self._index_version_checked = now
+        return self._index_version
+
+    def invalidate_caches(self) -> None:
+        """Drop cached LLM answers and search responses, e.g. after the index has been re-ingested"""
+        self.llm_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+        self._index_version_checked = 0.0
+
+    def _llm_cache_key(self, query: str, results: List[Dict]) -> str:
+        """Build the LLM cache key from the query, the ordered chunk set, the model and the index version"""
+        return make_key(
+            normalize_query(query),
+            [(r["file_name"], r["chunk_index"]) for r in results],
+            self.llm_model,
+            self.llm_params,
+            self.context_builder.max_tokens,
+            self.index_version()
+        )
+
+    def _semantic_scope(self, query: str, k: int, with_llm: bool, mode: Optional[str], fusion: Optional[str],
+                        weights: Optional[Dict[str, float]], rerank: Optional[bool], filters: Optional[Dict]) -> str:
+        """Build the key of the query literals and search options a semantic cache entry is valid for
+
+        Queries that differ in a year, quarter or amount never share an entry,
+        however similar their embeddings.
+        """
+        mode, fusion, weights = self._retrieval_options(mode, fusion, weights)
+        return make_key(
+            query_literals(query), k, with_llm, mode, fusion, weights, self._use_reranker(rerank), normalize_filters(filters),
+            self.model_name, self.llm_model, self.llm_params, self.index_version()
+        )
+
+    def _semantic_lookup(self, query_embedding, scope: str) -> Optional[Dict]:
+        """Return the cached response of a query similar to this one, marked with its query and similarity"""
+        with timed("semantic_cache"):
+            cached, similarity = self.semantic_cache.lookup(query_embedding, scope)
+        record_cache("semantic_answer", cached is not None)
+        if cached is None:
+            return None
+        return {
+            'vector_results': cached['vector_results'],
+            'llm_analysis': cached['llm_analysis'],
+            'llm_status': 'ok' if cached['llm_analysis'] else None,
+            'semantic_cache': {'query': cached['query'], 'similarity': round(similarity, 4)}
+        }
+
+    def _encode_query(self, query: str):
+        """Encode a query, reusing cached embeddings for repeated queries"""
+        with timed("encode"):
+            key = (self.model_name, normalize_query(query))
+            embedding = self.query_cache.get(key)
+            record_cache("query_embedding", embedding is not None)
+            if embedding is None:
+                embedding = self.model.encode(query, normalize_embeddings=True)
+                embedding.setflags(write=False)
+                self.query_cache.put(key, embedding)
+            return embedding
+
+    def _encode_queries(self, queries: List[str]) -> List:
+        """Encode several queries, batching every cache miss into a single encode call"""
+        with timed("encode"):
+            keys = [(self.model_name, normalize_query(query)) for query in queries]
+            embeddings = [self.query_cache.get(key) for key in keys]
+            for embedding in embeddings:
+                record_cache("query_embedding", embedding is not None)
+            
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                encoded = self.model.encode([queries[i] for i in missing], normalize_embeddings=True)
+                for i, embedding in zip(missing, encoded):
+                    embedding.setflags(write=False)
+                    self.query_cache.put(keys[i], embedding)
+                    embeddings[i] = embedding
+            return embeddings
 
-    def _rank_results_with_llm(self, query: str, results: List[Dict]) -> str:
-        """Use Mixtral to rank and select most relevant result"""
-        prompt = f"""Given the user query: '{query}'
+    def _build_prompt(self, query: str, results: List[Dict]) -> str:
+        """Build the Mixtral prompt for a query and its retrieved chunks, within the context token budget"""
+        passages, stats = self.context_builder.build(results)
+        LLM_CONTEXT_TOKENS.observe(stats['tokens_sent'])
+        LLM_CONTEXT_TOKENS_SAVED.inc(stats['tokens_saved'])
+        logging.info(
+            f"LLM context: {stats['tokens_sent']} tokens sent, {stats['tokens_saved']} saved "
+            f"({stats['merged']} merged, {stats['duplicates']} duplicates, "
+            f"{stats['truncated']} truncated, {stats['dropped']} dropped)"
+        )
+        
+        documents = format_documents(passages)
+        separator = '-' * 80
+        return f"""Given the user query: '{query}'
         
         And these document chunks from Tesla's SEC filings:
         
-        {'-' * 80}
-        {'\n\n'.join([f'Document {i+1}:\n{r["content"]}' for i, r in enumerate(results)])}
-        {'-' * 80}
+        {separator}
+        {documents}
+        {separator}
         
         First, analyze which document chunk is most relevant to answering the query.
         Then, provide a clear, concise answer based on that document.
@@ -36,69 +211,299 @@ class SearchEngine:
         Most Relevant Document: <document number>
         Answer: <your answer based on the document>
         """
+
+    def _acquire_llm_slot(self) -> bool:
+        """Wait for a free LLM slot, unless llm_max_waiters requests are already waiting
+
+        Returns whether a slot was acquired; the caller must release it.
+        """
+        with timed("llm_queue"):
+            if self.llm_semaphore.acquire(blocking=False):
+                return True
+            with self._llm_waiters_lock:
+                if self.llm_max_waiters is not None and self._llm_waiters >= self.llm_max_waiters:
+                    logging.warning("LLM queue is full, returning vector results only")
+                    return False
+                self._llm_waiters += 1
+            try:
+                acquired = self.llm_semaphore.acquire(timeout=self.llm_queue_timeout)
+            finally:
+                with self._llm_waiters_lock:
+                    self._llm_waiters -= 1
+        if not acquired:
+            logging.warning("Timed out waiting for a free LLM slot, returning vector results only")
+        return acquired
+
+    def _rank_results_with_llm(self, query: str, results: List[Dict]) -> Tuple[Optional[str], str]:
+        """Use Mixtral to rank and select most relevant result, reusing cached answers
+
+        Returns (answer, status): status is "ok", "skipped" when no LLM slot was
+        free, or "failed" when generation raised or returned nothing.
+        """
+        key = self._llm_cache_key(query, results)
+        cached = self.llm_cache.get(key)
+        record_cache("llm_answer", cached is not None)
+        if cached is not None:
+            return cached, "ok"
+        
+        with timed("prompt"):
+            prompt = self._build_prompt(query, results)
+        
+        if not self._acquire_llm_slot():
+            return None, "skipped"
         
         try:
-            response = self.llm_client.text_generation(
-                prompt,
-                model="mistralai/Mixtral-8x7B-Instruct-v0.1",
-                max_new_tokens=512,
-                temperature=0.1
-            )
-            return response
+            with timed("llm"):
+                output = self.llm_client.text_generation(
+                    prompt,
+                    model=self.llm_model,
+                    details=True,
+                    **self.llm_params
+                )
+            # With details=True the client returns the text along with generation details
+            response = getattr(output, 'generated_text', output)
+            details = getattr(output, 'details', None)
+            if details is not None and details.generated_tokens:
+                LLM_GENERATED_TOKENS.inc(details.generated_tokens)
+            if response:
+                self.llm_cache.put(key, response)
+            return response or None, "ok" if response else "failed"
             
         except Exception as e:
             logging.error(f"Error in LLM ranking: {str(e)}")
-            return None
+            return None, "failed"
+        finally:
+            self.llm_semaphore.release()
+
+    def _stream_results_with_llm(self, query: str, results: List[Dict],
+                                 on_complete: Optional[Callable[[str], None]] = None,
+                                 on_error: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+        """Stream Mixtral's answer token by token, caching the full answer when it completes
+
+        on_complete is called with the full answer once it has been generated or read from the cache.
+        on_error is called with ("skipped", message) when no LLM slot was free, or with
+        ("failed", message) if generation fails part way; the tokens streamed so far are
+        then never cached.
+        """
+        key = self._llm_cache_key(query, results)
+        cached = self.llm_cache.get(key)
+        record_cache("llm_answer", cached is not None)
+        if cached is not None:
+            yield cached
+            if on_complete is not None:
+                on_complete(cached)
+            return
+        
+        with timed("prompt"):
+            prompt = self._build_prompt(query, results)
+        
+        if not self._acquire_llm_slot():
+            if on_error is not None:
+                on_error("skipped", "No free LLM slot, returning vector results only")
+            return
+        
+        try:
+            tokens = []
+            start = time.perf_counter()
+            for token in self.llm_client.text_generation(
+                prompt,
+                model=self.llm_model,
+                stream=True,
+                **self.llm_params
+            ):
+                if not tokens:
+                    record_stage("llm_first_token", time.perf_counter() - start)
+                tokens.append(token)
+                yield token
+            record_stage("llm", time.perf_counter() - start)
+            LLM_GENERATED_TOKENS.inc(len(tokens))
+            if tokens:
+                self.llm_cache.put(key, ''.join(tokens))
+                if on_complete is not None:
+                    on_complete(''.join(tokens))
+                
+        except Exception as e:
+            logging.error(f"Error in LLM ranking: {str(e)}")
+            if on_error is not None:
+                on_error("failed", str(e))
+        finally:
+            self.llm_semaphore.release()
+
+    def _retrieval_options(self, mode: Optional[str], fusion: Optional[str],
+                           weights: Optional[Dict[str, float]]) -> tuple:
+        """Fill in the engine defaults for per-request retrieval options"""
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        weights = weights if weights is not None else self.fusion_weights
+        return mode, fusion or self.fusion, weights
+
+    def _use_reranker(self, rerank: Optional[bool]) -> bool:
+        """Decide whether to rerank; by default whenever a reranker is configured"""
+        if rerank is None:
+            return self.reranker is not None
+        if rerank and self.reranker is None:
+            raise ValueError("Reranking requested but no reranker is configured")
+        return rerank
+
+    def _retrieve(self, query: str, k: int, mode: Optional[str] = None, fusion: Optional[str] = None,
+                  weights: Optional[Dict[str, float]] = None, rerank: Optional[bool] = None,
+                  filters: Optional[Dict] = None, query_embedding=None) -> List[Dict]:
+        """Retrieve the k best chunks for a query from the backend, reranking a wider candidate set if enabled"""
+        mode, fusion, weights = self._retrieval_options(mode, fusion, weights)
+        rerank = self._use_reranker(rerank)
+        filters = normalize_filters(filters)
+        depth = max(k, self.rerank_candidates) if rerank else k
+        # Generate embedding for the query
+        if query_embedding is None:
+            query_embedding = self._encode_query(query)
+        if mode == "hybrid":
+            results = self.backend.hybrid_search(query, query_embedding, depth, fusion, weights, filters)
+        else:
+            results = self.backend.search(query_embedding, depth, filters)
+        if rerank:
+            with timed("rerank"):
+                results = self.reranker.rerank(query, results, k)
+        return results
 
-    def search(self, query: str, k: int = 5) -> Dict:
+    def search(self, query: str, k: int = 5, with_llm: bool = True, mode: Optional[str] = None,
+               fusion: Optional[str] = None, weights: Optional[Dict[str, float]] = None,
+               rerank: Optional[bool] = None, filters: Optional[Dict] = None, use_cache: bool = True) -> Dict:
         """
         Search for similar documents using KNN search and LLM ranking
+        With with_llm=False only the vector results are returned
+        mode, fusion and weights override the engine's retrieval defaults for this search,
+        e.g. mode="hybrid", fusion="weighted", weights={"bm25": 0.3, "vector": 0.7}
+        rerank=False skips the configured reranker for this search
+        filters restricts the search to matching chunks, e.g. {"form_type": "10-K", "fiscal_year": 2023}
+        or {"form_type": "8-K", "filed_after": "2024-07-01", "filed_before": "2024-09-30"}
+        With a semantic cache, the response to a similar earlier query with the same options is
+        returned along with a "semantic_cache" entry naming that query and its similarity;
+        use_cache=False skips the lookup and stores a fresh response
         """
         try:
-            # Generate embedding for the query
-            query_embedding = self.model.encode(query, normalize_embeddings=True)
-            
-            # Construct KNN query
-            knn_query = {
-                "knn": {
-                    "field": "embedding",
-                    "query_vector": query_embedding.tolist(),
-                    "k": k,
-                    "num_candidates": 100
-                },
-                "_source": ["content", "file_name", "chunk_index"]
-            }
-            
-            # Execute search
-            response = self.es.search(
-                index=self.index_name,
-                body=knn_query
-            )
-            
-            # Process results
-            results = []
-            for hit in response['hits']['hits']:
-                result = {
-                    'content': hit['_source']['content'],
-                    'file_name': hit['_source']['file_name'],
-                    'chunk_index': hit['_source']['chunk_index'],
-                    'score': hit['_score']
-                }
-                results.append(result)
+            query_embedding = self._encode_query(query)
+            if self.semantic_cache is not None:
+                scope = self._semantic_scope(query, k, with_llm, mode, fusion, weights, rerank, filters)
+                if use_cache:
+                    cached = self._semantic_lookup(query_embedding, scope)
+                    if cached is not None:
+                        return cached
+            results = self._retrieve(query, k, mode, fusion, weights, rerank, filters, query_embedding)
             
             # Use LLM to rank and explain results
             if results:
-                llm_response = self._rank_results_with_llm(query, results)
+                llm_response, llm_status = self._rank_results_with_llm(query, results) if with_llm else (None, None)
+                # Answers that failed or were skipped are not cached
+                if self.semantic_cache is not None and (llm_response or not with_llm):
+                    self.semantic_cache.put(query_embedding, {
+                        'query': query, 'vector_results': results, 'llm_analysis': llm_response
+                    }, scope)
                 return {
                     'vector_results': results,
-                    'llm_analysis': llm_response
+                    'llm_analysis': llm_response,
+                    'llm_status': llm_status
                 }
             
-            return {'vector_results': [], 'llm_analysis': None}
+            return {'vector_results': [], 'llm_analysis': None, 'llm_status': None}
             
         except Exception as e:
             logging.error(f"Error during search: {str(e)}")
-            return {'vector_results': [], 'llm_analysis': None}
+            return {'vector_results': [], 'llm_analysis': None, 'llm_status': None}
+
+    def search_many(self, queries: List[str], k: int = 5, with_llm: bool = True, mode: Optional[str] = None,
+                    fusion: Optional[str] = None, weights: Optional[Dict[str, float]] = None,
+                    rerank: Optional[bool] = None, filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        Search for several queries at once
+        Queries are encoded in one batch and searched in one backend round trip,
+        then LLM answers are generated with at most llm_concurrency calls in flight.
+        filters apply to every query.
+        Results are returned in input order; a failed query gets {"error": "..."}.
+        Each result's llm_status is set as in search(), e.g. "skipped" when the LLM was too busy
+        """
+        try:
+            mode, fusion, weights = self._retrieval_options(mode, fusion, weights)
+            rerank = self._use_reranker(rerank)
+            filters = normalize_filters(filters)
+            depth = max(k, self.rerank_candidates) if rerank else k
+            embeddings = self._encode_queries(queries)
+            if mode == "hybrid":
+                retrieved = self.backend.hybrid_search_many(queries, embeddings, depth, fusion, weights, filters)
+            else:
+                retrieved = self.backend.search_many(embeddings, depth, filters)
+            if rerank:
+                # Score every query's candidates in one batched predict call
+                with timed("rerank"):
+                    retrieved = self.reranker.rerank_many(queries, retrieved, k)
+        except Exception as e:
+            logging.error(f"Error during batch search: {str(e)}")
+            return [{'error': str(e)} for _ in queries]
+        
+        def answer(query, results):
+            if isinstance(results, Exception):
+                logging.error(f"Error during search: {str(results)}")
+                return {'error': str(results)}
+            llm_response, llm_status = self._rank_results_with_llm(query, results) if with_llm and results else (None, None)
+            return {'vector_results': results, 'llm_analysis': llm_response, 'llm_status': llm_status}
+        
+        with ThreadPoolExecutor(max_workers=self.llm_concurrency) as executor:
+            return list(executor.map(answer, queries, retrieved))
+
+    def search_stream(self, query: str, k: int = 5, mode: Optional[str] = None,
+                      fusion: Optional[str] = None, weights: Optional[Dict[str, float]] = None,
+                      rerank: Optional[bool] = None, filters: Optional[Dict] = None,
+                      use_cache: bool = True) -> Iterator[Dict]:
+        """
+        Search like search(), but yield events as they become available:
+        {"event": "vector_results", "data": [...]} as soon as the KNN search returns,
+        then {"event": "token", "data": "..."} for each LLM token,
+        then {"event": "done", "data": {"llm_analysis": "...", "llm_status": "ok"}}
+        A semantic cache hit yields its whole answer as one token event.
+        If no LLM slot is free or the LLM fails part way, {"event": "error", "data": {"error": ..., "message": ...}}
+        is yielded before a done event whose llm_analysis is None and llm_status is "skipped" or "failed"
+        """
+        scope = None
+        try:
+            query_embedding = self._encode_query(query)
+            if self.semantic_cache is not None:
+                scope = self._semantic_scope(query, k, True, mode, fusion, weights, rerank, filters)
+                cached = self._semantic_lookup(query_embedding, scope) if use_cache else None
+                if cached is not None:
+                    yield {'event': 'vector_results', 'data': cached['vector_results']}
+                    yield {'event': 'token', 'data': cached['llm_analysis']}
+                    yield {'event': 'done', 'data': {'llm_analysis': cached['llm_analysis'],
+                                                     'llm_status': cached['llm_status'],
+                                                     'semantic_cache': cached['semantic_cache']}}
+                    return
+            results = self._retrieve(query, k, mode, fusion, weights, rerank, filters, query_embedding)
+        except Exception as e:
+            logging.error(f"Error during search: {str(e)}")
+            results = []
+        
+        yield {'event': 'vector_results', 'data': results}
+        
+        def cache_answer(answer):
+            self.semantic_cache.put(query_embedding, {
+                'query': query, 'vector_results': results, 'llm_analysis': answer
+            }, scope)
+        
+        tokens = []
+        errors = []
+        if results:
+            for token in self._stream_results_with_llm(query, results, cache_answer if scope is not None else None,
+                                                       lambda status, message: errors.append((status, message))):
+                tokens.append(token)
+                yield {'event': 'token', 'data': token}
+        
+        llm_status = ('ok' if tokens else 'failed') if results else None
+        if errors:
+            llm_status, message = errors[0]
+            error = 'LLM busy' if llm_status == 'skipped' else 'LLM generation failed'
+            yield {'event': 'error', 'data': {'error': error, 'message': message}}
+            tokens = []
+        
+        yield {'event': 'done', 'data': {'llm_analysis': ''.join(tokens) if tokens else None, 'llm_status': llm_status}}
 
 def create_es_client() -> Optional[Elasticsearch]:
     """Create Elasticsearch client"""
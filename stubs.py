@@ -0,0 +1,414 @@
+"""Offline stand-ins for Elasticsearch, the HF inference client and the embedding model
+
+Used by the benchmark and load test harnesses to exercise the real ingest and
+search code without network access.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import datetime
+import threading
+import numpy as np
+from urllib.parse import parse_qs, urlsplit
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Sequence
+from elasticsearch import Elasticsearch
+from elastic_transport import ApiResponseMeta, BaseNode, ConnectionError, HttpHeaders
+from elastic_transport._node._base import NodeApiResponse
+from retrieval import BM25Index
+
+class StubIndex:
+    """In-memory documents of one index, with exact cosine KNN and BM25 match search"""
+
+    def __init__(self, mappings: Optional[Dict] = None, settings: Optional[Dict] = None):
+        self.mappings = mappings or {}
+        self.settings = {"refresh_interval": "1s", "number_of_replicas": "1", **(settings or {})}
+        self.meta = {}
+        self.docs: Dict[str, Dict] = {}
+        # Searchable view of docs, rebuilt on the first search after a change
+        self._searchable = None
+        self._lock = threading.Lock()
+
+    def put(self, doc_id: str, source: Dict) -> None:
+        with self._lock:
+            self.docs[doc_id] = source
+            self._searchable = None
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            self._searchable = None
+            return self.docs.pop(doc_id, None) is not None
+
+    def searchable(self) -> tuple:
+        """Return (ids, sources, normalized vectors, BM25 index) for the current documents"""
+        with self._lock:
+            if self._searchable is None:
+                ids = list(self.docs)
+                sources = [self.docs[i] for i in ids]
+                vectors = np.array([source.get("embedding", []) for source in sources], dtype=np.float32)
+                if len(vectors):
+                    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                bm25 = BM25Index([source.get("content", "") for source in sources])
+                self._searchable = (ids, sources, vectors, bm25)
+            return self._searchable
+
+    def filter_mask(self, clauses: Sequence[Dict]) -> Optional[np.ndarray]:
+        """Return which documents match all term, terms, range and bool filter clauses, or None for no clauses"""
+        if not clauses:
+            return None
+        _, sources, _, _ = self.searchable()
+        return np.array([all(_matches(source, clause) for clause in clauses) for source in sources], dtype=bool)
+
+    def knn(self, query_vector: Sequence[float], k: int, mask: Optional[np.ndarray] = None) -> List[tuple]:
+        """Return (doc_id, source, score) of the k nearest documents in mask, scored like ES cosine similarity"""
+        ids, sources, vectors, _ = self.searchable()
+        if not len(vectors):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        similarities = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+        top = np.argsort(-similarities, kind='stable')
+        if mask is not None:
+            top = top[mask[top]]
+        return [(ids[i], sources[i], (1 + float(similarities[i])) / 2) for i in top[:k]]
+
+    def match(self, text: str, size: int, mask: Optional[np.ndarray] = None) -> List[tuple]:
+        """Return (doc_id, source, score) of the best BM25 matches in mask"""
+        ids, sources, _, bm25 = self.searchable()
+        positions, scores = bm25.search(text, size, mask)
+        return [(ids[i], sources[i], float(score)) for i, score in zip(positions, scores)]
+
+def _matches(source: Dict, clause: Dict) -> bool:
+    """Evaluate one filter clause against a document source"""
+    (kind, spec), = clause.items()
+    if kind == "bool":
+        return all(_matches(source, inner) for inner in spec.get("filter", []) + spec.get("must", []))
+    (field, condition), = spec.items()
+    value = source.get(field)
+    if kind == "term":
+        return value == (condition["value"] if isinstance(condition, dict) else condition)
+    if kind == "terms":
+        return value in condition
+    if kind == "range":
+        if value is None:
+            return False
+        checks = {"gte": lambda b: value >= b, "gt": lambda b: value > b, "lte": lambda b: value <= b, "lt": lambda b: value < b}
+        return all(checks[operator](bound) for operator, bound in condition.items() if operator in checks)
+    raise ValueError(f"Unsupported filter clause {kind!r}")
+
+class StubCluster:
+    """State shared by every connection of a stub Elasticsearch client"""
+
+    def __init__(self, latency: float = 0.0):
+        # Simulated network round trip per request, in seconds
+        self.latency = latency
+        self.indices: Dict[str, StubIndex] = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        # Fault injection: the next connection_errors requests fail with a ConnectionError,
+        # and bulk writes of the _ids in reject_ids are rejected once with a 429
+        self.connection_errors = 0
+        self.reject_ids = set()
+
+    def handle(self, method: str, path: str, body: Optional[bytes], params: Optional[Dict] = None) -> tuple:
+        """Route one REST request, returning (status, response body)"""
+        params = params or {}
+        parts = [p for p in path.split('/') if p]
+        endpoint = parts[-1] if parts else ""
+        with self.lock:
+            self.requests += 1
+        # Searches run concurrently; index level changes are serialized
+        if endpoint == "_msearch":
+            lines = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+            responses = [
+                self._search(header.get("index", parts[0] if len(parts) > 1 else None), search)
+                for header, search in zip(lines[0::2], lines[1::2])
+            ]
+            return 200, {"took": 1, "responses": [{**response, "status": status} for status, response in responses]}
+        if endpoint == "_search":
+            return self._search(parts[0] if len(parts) > 1 else None, json.loads(body) if body else {})
+
+        with self.lock:
+            if endpoint == "_bulk":
+                return self._bulk(body)
+            name = parts[0] if parts else None
+            if len(parts) == 1:
+                if method == "HEAD":
+                    return (200 if name in self.indices else 404), {}
+                if method == "PUT":
+                    if name in self.indices:
+                        return 400, {"error": {"type": "resource_already_exists_exception"}, "status": 400}
+                    request = json.loads(body) if body else {}
+                    self.indices[name] = StubIndex(request.get("mappings"), request.get("settings"))
+                    return 200, {"acknowledged": True, "index": name}
+                if method == "DELETE":
+                    if self.indices.pop(name, None) is None and params.get("ignore_unavailable") != "true":
+                        return 404, {"error": {"type": "index_not_found_exception"}, "status": 404}
+                    return 200, {"acknowledged": True}
+
+            if name not in self.indices:
+                return 404, {"error": {"type": "index_not_found_exception", "index": name}, "status": 404}
+            index = self.indices[name]
+            if endpoint == "_settings":
+                if method == "GET":
+                    return 200, {name: {"settings": {"index": dict(index.settings)}}}
+                request = json.loads(body)
+                index.settings.update({k: str(v) for k, v in request.get("index", request).items()})
+                return 200, {"acknowledged": True}
+            if endpoint == "_mapping":
+                if method == "GET":
+                    return 200, {name: {"mappings": {**index.mappings, "_meta": dict(index.meta)}}}
+                index.meta = json.loads(body).get("_meta", index.meta)
+                return 200, {"acknowledged": True}
+            if endpoint == "_refresh":
+                return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+            if len(parts) == 3 and parts[1] == "_doc" and method in ("PUT", "POST"):
+                index.put(parts[2], json.loads(body))
+                return 201, {"_index": name, "_id": parts[2], "result": "created"}
+        return 400, {"error": {"type": "unsupported", "reason": f"{method} {path}"}, "status": 400}
+
+    def _bulk(self, body: bytes) -> tuple:
+        lines = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        items = []
+        i = 0
+        while i < len(lines):
+            (action, meta), = lines[i].items()
+            i += 1
+            index = self.indices.setdefault(meta["_index"], StubIndex())
+            if meta.get("_id") in self.reject_ids:
+                self.reject_ids.discard(meta["_id"])
+                if action != "delete":
+                    i += 1
+                items.append({action: {"_id": meta["_id"], "status": 429,
+                                       "error": {"type": "es_rejected_execution_exception"}}})
+            elif action == "delete":
+                found = index.delete(meta["_id"])
+                items.append({action: {"_id": meta["_id"], "status": 200 if found else 404}})
+            else:
+                doc_id = meta.get("_id") or hashlib.sha1(json.dumps(lines[i]).encode()).hexdigest()
+                index.put(doc_id, lines[i])
+                i += 1
+                items.append({action: {"_id": doc_id, "status": 201}})
+        errors = any("error" in result for item in items for result in item.values())
+        return 200, {"took": 1, "errors": errors, "items": items}
+
+    def _search(self, name: str, request: Dict) -> tuple:
+        index = self.indices.get(name)
+        if index is None:
+            return 404, {"error": {"type": "index_not_found_exception", "index": name}, "status": 404}
+
+        query = request.get("query", {})
+        if "knn" in request:
+            knn = request["knn"]
+            mask = index.filter_mask([knn["filter"]] if "filter" in knn else [])
+            hits = index.knn(knn["query_vector"], knn["k"], mask)[:request.get("size", knn["k"])]
+        elif "match" in query or "match" in query.get("bool", {}).get("must", {}):
+            mask = index.filter_mask(query["bool"].get("filter", []) if "bool" in query else [])
+            (_, text), = (query["bool"]["must"] if "bool" in query else query)["match"].items()
+            hits = index.match(text if isinstance(text, str) else text["query"], request.get("size", 10), mask)
+        else:
+            ids, sources, _, _ = index.searchable()
+            hits = [(doc_id, source, 1.0) for doc_id, source in zip(ids, sources)][:request.get("size", 10)]
+
+        fields = request.get("_source")
+        return 200, {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(hits), "relation": "eq"},
+                "max_score": hits[0][2] if hits else None,
+                "hits": [
+                    {
+                        "_index": name,
+                        "_id": doc_id,
+                        "_score": score,
+                        "_source": {
+                            key: value for key, value in source.items()
+                            if not isinstance(fields, list) or key in fields
+                        }
+                    }
+                    for doc_id, source, score in hits
+                ]
+            }
+        }
+
+class StubNode(BaseNode):
+    """Transport node that answers requests from a StubCluster instead of the network"""
+    _CLIENT_META_HTTP_CLIENT = ("stub", "1")
+    cluster: StubCluster = None
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        with self.cluster.lock:
+            if self.cluster.connection_errors:
+                self.cluster.connection_errors -= 1
+                raise ConnectionError("Stub connection refused")
+        if self.cluster.latency:
+            time.sleep(self.cluster.latency)
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        status, response = self.cluster.handle(method, url.path, body, params)
+        meta = ApiResponseMeta(
+            status, "1.1",
+            HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"}),
+            0.0, self.config
+        )
+        return NodeApiResponse(meta, json.dumps(response).encode())
+
+def create_stub_es_client(cluster: Optional[StubCluster] = None, latency: float = 0.0,
+                          connections_per_node: int = 10, max_retries: int = 3) -> Elasticsearch:
+    """Create an Elasticsearch client backed by an in-memory StubCluster"""
+    cluster = cluster or StubCluster(latency=latency)
+    node_class = type("BoundStubNode", (StubNode,), {"cluster": cluster})
+    return Elasticsearch("http://stub:9200", node_class=node_class, connections_per_node=connections_per_node,
+                         max_retries=max_retries)
+
+class StubInferenceClient:
+    """Stand-in for huggingface_hub.InferenceClient.text_generation
+
+    Answers are deterministic and generated at tokens_per_second after a
+    first-token latency, so LLM-bound paths can be timed offline.
+    """
+
+    def __init__(self, latency: float = 0.0, tokens_per_second: Optional[float] = None,
+                 answer_tokens: int = 32):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _tokens(self, prompt: str, max_new_tokens: int) -> List[str]:
+        match = re.search(r'Document (\d+)', prompt)
+        document = match.group(1) if match else "1"
+        words = f"Most Relevant Document: {document}\nAnswer: ".split(" ")
+        words += [f"token{i}" for i in range(self.answer_tokens)]
+        return [word + " " for word in words][:max_new_tokens]
+
+    def _stream(self, tokens: List[str]) -> Iterator[str]:
+        for token in tokens:
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield token
+
+    def text_generation(self, prompt: str, model: Optional[str] = None, stream: bool = False,
+                        details: bool = False, max_new_tokens: int = 512, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        tokens = self._tokens(prompt, max_new_tokens)
+        if stream:
+            return self._stream(tokens)
+        text = ''.join(self._stream(tokens))
+        if details:
+            return SimpleNamespace(generated_text=text, details=SimpleNamespace(generated_tokens=len(tokens)))
+        return text
+
+class HashingEncoder:
+    """Deterministic SentenceTransformer stand-in using the hashing trick
+
+    Words are hashed into dims buckets with a signed count, so texts sharing
+    words get similar vectors. Needs no model download.
+    """
+
+    def __init__(self, dims: int = 384):
+        self.dims = dims
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dims
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in re.findall(r'\w+', text.lower()):
+            digest = int(hashlib.md5(word.encode()).hexdigest()[:8], 16)
+            vector[digest % self.dims] += 1.0 if digest & (1 << 31) else -1.0
+        return vector
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        vectors = np.array([self._encode_one(text) for text in ([sentences] if single else sentences)],
+                           dtype=np.float32).reshape(-1, self.dims)
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+# Vocabulary for synthetic filings, loosely modelled on 10-K/10-Q language
+FILING_TERMS = [
+    "automotive", "revenue", "regulatory", "credits", "energy", "generation", "storage", "deliveries",
+    "gross", "margin", "operating", "expenses", "research", "development", "capital", "expenditures",
+    "cash", "flows", "leasing", "services", "inventory", "warranty", "reserves", "Gigafactory",
+    "Model", "production", "vehicles", "net", "income", "quarter", "fiscal", "year", "ended",
+    "compared", "increase", "decrease", "primarily", "due", "to", "the", "and", "of", "in", "our",
+]
+
+def synthetic_pages(num_pages: int, words_per_page: int, rng: random.Random) -> List[str]:
+    """Generate filing-like page texts with figures and line-item terms"""
+    pages = []
+    for _ in range(num_pages):
+        words = []
+        while len(words) < words_per_page:
+            words.extend(rng.choices(FILING_TERMS, k=rng.randint(6, 14)))
+            words.append(f"${rng.randint(1, 99999):,} million.")
+        pages.append(' '.join(words[:words_per_page]))
+    return pages
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def write_pdf(path: str, pages: Sequence[str], line_chars: int = 90) -> None:
+    """Write a minimal text PDF with one page per string"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines = re.findall(r'.{1,%d}(?:\s|$)' % line_chars, text) or [""]
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL\n" + "\n".join(f"({_pdf_escape(line.strip())}) '" for line in lines) + "\nET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(output)
+
+def synthetic_cover(index: int) -> tuple:
+    """Return the cover and signature lines of the index-th synthetic filing
+
+    Filings cycle through three quarterly reports and an annual report per
+    year from 2019, each signed a month after its period ends.
+    """
+    quarter = index % 4 + 1
+    year = 2019 + index // 4
+    period_end = datetime.date(year, quarter * 3, 30 if quarter in (2, 3) else 31)
+    form, period = ("10-K", "fiscal year") if quarter == 4 else ("10-Q", "quarterly period")
+    signed = period_end + datetime.timedelta(days=30)
+    return (
+        f"UNITED STATES SECURITIES AND EXCHANGE COMMISSION FORM {form} "
+        f"For the {period} ended {period_end:%B} {period_end.day}, {year}",
+        f"SIGNATURES Date: {signed:%B} {signed.day}, {signed.year}"
+    )
+
+def write_synthetic_filings(directory: str, num_filings: int = 20, pages_per_filing: int = 10,
+                            words_per_page: int = 400, seed: int = 0) -> List[str]:
+    """Write a reproducible corpus of synthetic filing PDFs and return their paths"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(num_filings):
+        path = f"{directory}/tsla-synthetic-{i:04d}_page{i // 10 + 1}.pdf"
+        pages = synthetic_pages(pages_per_filing, words_per_page, rng)
+        cover, signature = synthetic_cover(i)
+        pages[0] = f"{cover} {pages[0]}"
+        pages[-1] = f"{pages[-1]} {signature}"
+        write_pdf(path, pages)
+        paths.append(path)
+    return paths
@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context import ContextBuilder, TokenCounter
+from retrieval import LocalVectorIndex
+from search import SearchEngine
+from stubs import HashingEncoder, StubInferenceClient
+
+TEXTS = [
+    "Total revenues grew to $96,773 million in 2023",
+    "Automotive gross margin declined on lower average selling prices",
+    "Energy generation and storage revenue increased",
+    "Capital expenditures for new factories and Supercharger stations",
+]
+
+@pytest.fixture
+def make_engine():
+    """Build a SearchEngine over a few chunks in a LocalVectorIndex, with a stub LLM"""
+    def make(**kwargs):
+        encoder = HashingEncoder()
+        vectors = encoder.encode(TEXTS, normalize_embeddings=True)
+        metadata = [{"content": text, "file_name": "tsla-10k-2023.pdf", "chunk_index": i}
+                    for i, text in enumerate(TEXTS)]
+        # No model name, so prompts are sized without downloading a tokenizer
+        options = dict(backend=LocalVectorIndex([(vectors, metadata)], version="v1"), model=encoder,
+                       llm_client=StubInferenceClient(), index_version_ttl=0,
+                       context_builder=ContextBuilder(TokenCounter()))
+        return SearchEngine(None, **{**options, **kwargs})
+    return make
+
+@pytest.fixture
+def engine(make_engine):
+    return make_engine()
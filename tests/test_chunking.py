@@ -0,0 +1,122 @@
+import textwrap
+import pytest
+from chunking import Chunker
+from context import TokenCounter
+
+class WordCounter(TokenCounter):
+    """Count one token per word, so chunk sizes can be checked exactly"""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+SENTENCE_WORDS = 8
+
+def sentence(i: int) -> str:
+    return f"Segment {i} revenue increased against the prior year."
+
+def paragraph(start: int, count: int) -> str:
+    return textwrap.fill(' '.join(sentence(i) for i in range(start, start + count)), 70)
+
+TABLE_ROWS = [
+    "Automotive sales 67,210 71,462 78,509",
+    "Energy generation and storage 6,035 3,909 2,789",
+    "Services and other 8,319 6,091 3,802",
+]
+
+PAGES = [
+    "ITEM 7. MANAGEMENT'S DISCUSSION AND ANALYSIS\n\n" + paragraph(0, 12) + "\n\n" + paragraph(12, 6),
+    paragraph(18, 4) + "\n" + "\n".join(TABLE_ROWS) + "\n\n" + paragraph(22, 10),
+    "ITEM 8. FINANCIAL STATEMENTS\n\n" + paragraph(32, 9),
+]
+
+def make_chunker(chunk_tokens=60, overlap_tokens=20):
+    return Chunker(chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens, token_counter=WordCounter())
+
+def span_text(pages, chunk):
+    """The page text between a chunk's offsets"""
+    parts = []
+    for page in range(chunk["page_start"], chunk["page_end"] + 1):
+        text = pages[page - 1]
+        start = chunk["char_start"] if page == chunk["page_start"] else 0
+        end = chunk["char_end"] if page == chunk["page_end"] else len(text)
+        parts.append(text[start:end])
+    return ' '.join(parts)
+
+def shared_words(first: str, second: str) -> int:
+    """Number of words the second chunk repeats from the end of the first"""
+    a, b = first.split(), second.split()
+    return next((n for n in range(min(len(a), len(b)), 0, -1) if a[-n:] == b[:n]), 0)
+
+def test_chunks_fit_chunk_tokens():
+    chunks = list(make_chunker().iter_chunks(PAGES))
+    assert len(chunks) > 3
+    assert all(0 < len(chunk["content"].split()) <= 60 for chunk in chunks)
+
+def test_overlap_is_about_overlap_tokens():
+    chunks = list(make_chunker().iter_chunks(PAGES))
+    overlaps = [
+        shared_words(previous["content"], chunk["content"])
+        for previous, chunk in zip(chunks, chunks[1:])
+        if not chunk["content"].startswith("ITEM")
+    ]
+    assert overlaps
+    # Whole trailing sentences are carried over, up to overlap_tokens
+    assert all(20 - SENTENCE_WORDS < overlap <= 20 for overlap in overlaps)
+
+def test_sections_start_without_overlap():
+    chunks = list(make_chunker().iter_chunks(PAGES))
+    headings = [i for i, chunk in enumerate(chunks) if chunk["content"].startswith("ITEM")]
+    assert [chunks[i]["content"].split(".")[0] for i in headings] == ["ITEM 7", "ITEM 8"]
+    assert all(shared_words(chunks[i - 1]["content"], chunks[i]["content"]) == 0 for i in headings[1:])
+
+def test_offsets_round_trip_without_content_loss():
+    chunks = list(make_chunker().iter_chunks(PAGES))
+    for chunk in chunks:
+        assert span_text(PAGES, chunk).split() == chunk["content"].split()
+
+    covered = [set() for _ in PAGES]
+    for chunk in chunks:
+        for page in range(chunk["page_start"], chunk["page_end"] + 1):
+            start = chunk["char_start"] if page == chunk["page_start"] else 0
+            end = chunk["char_end"] if page == chunk["page_end"] else len(PAGES[page - 1])
+            covered[page - 1].update(range(start, end))
+    for text, offsets in zip(PAGES, covered):
+        assert all(i in offsets for i, c in enumerate(text) if not c.isspace())
+
+def test_table_rows_are_never_split():
+    # Small chunks put a boundary next to every row
+    chunks = list(make_chunker(chunk_tokens=12, overlap_tokens=4).iter_chunks(PAGES))
+    for row in TABLE_ROWS:
+        start = PAGES[1].index(row)
+        end = start + len(row)
+        assert any(row in chunk["content"] for chunk in chunks)
+        for chunk in chunks:
+            for page, offset in ((chunk["page_start"], chunk["char_start"]), (chunk["page_end"], chunk["char_end"])):
+                assert not (page == 2 and start < offset < end)
+
+def test_oversized_units_fall_back_to_split_long(monkeypatch):
+    calls = []
+    split_long = Chunker._split_long
+    def spy(self, unit, first_budget):
+        calls.append(unit)
+        return split_long(self, unit, first_budget)
+    monkeypatch.setattr(Chunker, "_split_long", spy)
+
+    words = [f"Word{i}" for i in range(150)]
+    pages = ["Short opening sentence here. " + ' '.join(words) + "."]
+    chunks = list(make_chunker().iter_chunks(pages))
+
+    assert len(calls) == 1 and calls[0].tokens == 150
+    assert all(len(chunk["content"].split()) <= 60 for chunk in chunks)
+    assert all(shared_words(a["content"], b["content"]) > 0 for a, b in zip(chunks, chunks[1:]))
+    # Every word survives, in order
+    seen = []
+    for chunk in chunks:
+        seen.extend(word.rstrip(".") for word in chunk["content"].split() if word.startswith("Word"))
+    assert list(dict.fromkeys(seen)) == words
+    for chunk in chunks:
+        assert span_text(pages, chunk).split() == chunk["content"].split()
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        make_chunker(chunk_tokens=20, overlap_tokens=20)
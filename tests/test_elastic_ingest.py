@@ -0,0 +1,140 @@
+import os
+import pytest
+import elastic_ingest
+import embeddings
+import models
+from chunking import Chunker
+from context import TokenCounter
+from elastic_ingest import ElasticsearchIngestor
+from embedding_store import store_exists
+from manifest import MANIFEST_NAME, Manifest
+from stubs import HashingEncoder, StubCluster, create_stub_es_client, write_synthetic_filings
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record bulk retry backoffs instead of sleeping"""
+    calls = []
+    monkeypatch.setattr(elastic_ingest.time, "sleep", calls.append)
+    return calls
+
+def documents(count):
+    return [{"doc_id": f"doc-{i}", "content": f"chunk {i}", "file_name": "tsla-10k.pdf", "chunk_index": i}
+            for i in range(count)]
+
+def test_bulk_retries_transport_and_item_failures(sleeps):
+    cluster = StubCluster()
+    # No client-level retries, so the connection error reaches parallel_bulk
+    ingestor = ElasticsearchIngestor(create_stub_es_client(cluster, max_retries=0))
+    ingestor.create_index()
+    cluster.connection_errors = 1
+    cluster.reject_ids = {"doc-17"}
+
+    indexed = ingestor.bulk_index_documents(documents(40), chunk_size=10, thread_count=2)
+
+    assert len(indexed) == 40
+    assert sorted(cluster.indices["tesla_filings"].docs) == sorted(f"doc-{i}" for i in range(40))
+    assert sleeps == [4]
+
+def test_bulk_gives_up_after_max_retries(sleeps):
+    cluster = StubCluster()
+    ingestor = ElasticsearchIngestor(create_stub_es_client(cluster, max_retries=0))
+    ingestor.create_index()
+    cluster.connection_errors = 100
+
+    assert ingestor.bulk_index_documents(documents(5), max_retries=2) == []
+    assert sleeps == [4, 8]
+
+class CountingCluster(StubCluster):
+    """Stub cluster that counts bulk requests"""
+
+    def __init__(self):
+        super().__init__()
+        self.bulk_requests = 0
+
+    def _bulk(self, body):
+        self.bulk_requests += 1
+        return super()._bulk(body)
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Synthetic filings in a working directory, embedded with a hashing encoder"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(models, "_models", {})
+    encoder = HashingEncoder()
+    models.register_embedding_model(encoder)
+    monkeypatch.setattr(embeddings, "chunker", Chunker(chunk_tokens=120, overlap_tokens=20,
+                                                       token_counter=TokenCounter()))
+    os.makedirs("tesla_sec_filings")
+    paths = write_synthetic_filings("tesla_sec_filings", num_filings=3, pages_per_filing=2, words_per_page=200)
+    return [os.path.basename(path) for path in paths]
+
+def indexed_by_file(cluster):
+    docs = {}
+    for doc_id, source in cluster.indices["tesla_filings"].docs.items():
+        docs.setdefault(source["file_name"], set()).add(doc_id)
+    return docs
+
+def store_mtimes():
+    return {name: os.path.getmtime(os.path.join("tesla_sec_filings_embeddings", name))
+            for name in os.listdir("tesla_sec_filings_embeddings") if name != MANIFEST_NAME}
+
+def stored_ids(file_name):
+    return set(Manifest("tesla_sec_filings_embeddings").filings[file_name]["doc_ids"])
+
+def test_incremental_ingest(workspace, sleeps):
+    cluster = CountingCluster()
+    ingestor = ElasticsearchIngestor(create_stub_es_client(cluster))
+    def run():
+        embeddings.process_and_store_documents()
+        ingestor.ingest_embeddings()
+
+    run()
+    first = indexed_by_file(cluster)
+    assert set(first) == set(workspace)
+    assert all(first[name] == stored_ids(name) for name in workspace)
+    version = cluster.indices["tesla_filings"].meta["index_version"]
+
+    # Unchanged filings are neither re-embedded nor re-sent
+    requests = cluster.bulk_requests
+    stores = store_mtimes()
+    run()
+    assert store_mtimes() == stores
+    assert cluster.bulk_requests == requests
+    assert indexed_by_file(cluster) == first
+    assert cluster.indices["tesla_filings"].meta["index_version"] == version
+
+    # A modified PDF replaces its documents and leaves the others alone
+    changed, removed, kept = workspace
+    write_synthetic_filings("tesla_sec_filings", num_filings=1, pages_per_filing=2, words_per_page=200, seed=7)
+    run()
+    second = indexed_by_file(cluster)
+    assert second[changed] == stored_ids(changed) != first[changed]
+    assert second[removed] == first[removed] and second[kept] == first[kept]
+
+    # A deleted PDF has its store, its documents and its manifest entry removed
+    os.remove(os.path.join("tesla_sec_filings", removed))
+    run()
+    third = indexed_by_file(cluster)
+    assert removed not in third
+    assert not store_exists("tesla_sec_filings_embeddings", os.path.splitext(removed)[0])
+    assert third[kept] == first[kept]
+    assert removed not in Manifest("tesla_sec_filings_embeddings").filings
+
+def test_extraction_change_reprocesses_filings(workspace, sleeps, monkeypatch):
+    cluster = StubCluster()
+    ingestor = ElasticsearchIngestor(create_stub_es_client(cluster))
+    embeddings.process_and_store_documents()
+    ingestor.ingest_embeddings()
+    first = indexed_by_file(cluster)
+
+    # A different chunker changes the extraction signature, so every filing is re-chunked
+    monkeypatch.setattr(embeddings, "chunker", Chunker(chunk_tokens=60, overlap_tokens=10,
+                                                       token_counter=TokenCounter()))
+    embeddings.process_and_store_documents()
+    ingestor.ingest_embeddings()
+    second = indexed_by_file(cluster)
+    manifest = Manifest("tesla_sec_filings_embeddings")
+    for name in workspace:
+        assert manifest.filings[name]["chunker"] == embeddings.extraction_signature()
+        assert second[name] == stored_ids(name)
+        assert len(second[name]) > len(first[name])
@@ -0,0 +1,55 @@
+from filing_metadata import FilingMetadataParser
+
+def parse(file_name, pages):
+    parser = FilingMetadataParser(file_name)
+    for page in pages:
+        parser.feed(page)
+    return parser.result()
+
+def test_annual_report():
+    pages = [
+        "UNITED STATES SECURITIES AND EXCHANGE COMMISSION FORM 10-K "
+        "For the fiscal year ended December 31, 2023",
+        "Table of Contents ... Signatures 120",
+        "Revenue grew in 2023.",
+        "SIGNATURES Pursuant to the requirements of Section 13 ... Tesla, Inc. Date: January 26, 2024",
+    ]
+    assert parse("tsla-20231231.pdf", pages) == {
+        "form_type": "10-K", "fiscal_year": 2023, "fiscal_period": "FY",
+        "period_end": "2023-12-31", "filing_date": "2024-01-26"
+    }
+
+def test_quarterly_report_amendment():
+    pages = ["FORM 10-Q/A For the quarterly period ended September 30, 2023",
+             "SIGNATURES\nTesla, Inc.\nDate: October 23, 2023"]
+    result = parse("tsla-20230930.pdf", pages)
+    assert (result["form_type"], result["fiscal_year"], result["fiscal_period"]) == ("10-Q/A", 2023, "Q3")
+    assert result["filing_date"] == "2023-10-23"
+
+def test_current_report_uses_report_date():
+    pages = ["FORM 8-K Date of Report (Date of earliest event reported): January 24, 2024",
+             "SIGNATURE Tesla, Inc. Date: January 25, 2024"]
+    result = parse("tsla-8k.pdf", pages)
+    assert (result["form_type"], result["fiscal_year"], result["fiscal_period"]) == ("8-K", 2024, "Q1")
+    assert result["filing_date"] == "2024-01-24"
+
+def test_signature_date_ignores_cover_letters_and_exhibits():
+    pages = [
+        "Cover letter to the SEC. Date: March 3, 2020",
+        "FORM 10-K For the fiscal year ended December 31, 2023",
+        "SIGNATURES Pursuant to the requirements of Section 13 ...",
+        "Elon Musk, Chief Executive Officer Date: January 26, 2024",
+        "Exhibit 10.1 Supply agreement. Date: June 1, 2015",
+    ]
+    assert parse("tsla-20231231.pdf", pages)["filing_date"] == "2024-01-26"
+
+def test_signature_heading_without_a_nearby_date():
+    # An uppercase SIGNATURES in the front matter opens no block once its pages have passed
+    pages = ["FORM 10-K INDEX ... SIGNATURES", "Business overview", "Risk factors",
+             "Exhibit 4.1 Indenture. Date: May 1, 2017"]
+    assert parse("tsla-10k.pdf", pages)["filing_date"] is None
+
+def test_file_name_date_fallback():
+    result = parse("tsla-20221231.pdf", ["No cover page text"])
+    assert result["period_end"] == "2022-12-31"
+    assert (result["form_type"], result["fiscal_year"], result["fiscal_period"]) == (None, 2022, None)
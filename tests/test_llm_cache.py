@@ -0,0 +1,40 @@
+from metrics import CACHE_REQUESTS
+
+def cache_hits():
+    return CACHE_REQUESTS.value(cache="llm_answer", result="hit")
+
+def test_repeated_query_is_answered_from_cache(engine):
+    hits = cache_hits()
+    first = engine.search("Tesla total revenues", k=2)
+    second = engine.search("  tesla TOTAL revenues ", k=2)
+    assert first["llm_analysis"]
+    assert second["llm_analysis"] == first["llm_analysis"]
+    assert engine.llm_client.calls == 1
+    assert cache_hits() == hits + 1
+
+def test_different_query_or_results_miss(engine):
+    engine.search("Tesla total revenues", k=2)
+    engine.search("Tesla energy storage", k=2)
+    engine.search("Tesla total revenues", k=3)
+    assert engine.llm_client.calls == 3
+
+def test_index_version_change_invalidates(engine):
+    engine.search("Tesla total revenues", k=2)
+    engine.backend._version = "v2"
+    engine.search("Tesla total revenues", k=2)
+    assert engine.llm_client.calls == 2
+    engine.search("Tesla total revenues", k=2)
+    assert engine.llm_client.calls == 2
+
+def test_invalidate_caches_forces_a_new_answer(engine):
+    engine.search("Tesla total revenues", k=2)
+    engine.invalidate_caches()
+    engine.search("Tesla total revenues", k=2)
+    assert engine.llm_client.calls == 2
+
+def test_streamed_answer_is_cached(engine):
+    events = list(engine.search_stream("Tesla total revenues", k=2))
+    answer = events[-1]["data"]["llm_analysis"]
+    assert answer
+    assert engine.search("Tesla total revenues", k=2)["llm_analysis"] == answer
+    assert engine.llm_client.calls == 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from retrieval import LocalVectorIndex
+
+K = 10
+
+def clustered_vectors(rng, count, dims=64, clusters=40):
+    """Unit vectors in Gaussian clusters, like embedded chunks of related filings"""
+    centers = rng.normal(size=(clusters, dims))
+    vectors = centers[rng.integers(0, clusters, count)] + rng.normal(scale=0.8, size=(count, dims))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, 3000 + 50)
+    vectors, queries = vectors[:3000], vectors[3000:]
+    # Several filings, so rescoring has to read across segment boundaries
+    segments = [
+        (vectors[start:start + 700], [{"content": "", "file_name": f"filing-{start}", "chunk_index": i}
+                                      for i in range(len(vectors[start:start + 700]))])
+        for start in range(0, 3000, 700)
+    ]
+    exact = LocalVectorIndex(segments)
+    return segments, queries, [exact.search(query, K) for query in queries]
+
+def keys(results):
+    return [(result["file_name"], result["chunk_index"]) for result in results]
+
+@pytest.mark.parametrize("quantization, min_recall", [("int8", 0.98), ("binary", 0.9)])
+def test_rescored_top_k_matches_float(corpus, quantization, min_recall):
+    segments, queries, truth = corpus
+    index = LocalVectorIndex(segments, quantization=quantization)
+    recalls = []
+    for query, expected in zip(queries, truth):
+        found = index.search(query, K)
+        assert len(found) == K
+        recalls.append(len(set(keys(found)) & set(keys(expected))) / K)
+        # Candidates are rescored with their float vectors, so shared hits carry the exact scores
+        exact_scores = {key: result["score"] for key, result in zip(keys(expected), expected)}
+        for key, result in zip(keys(found), found):
+            if key in exact_scores:
+                assert result["score"] == pytest.approx(exact_scores[key], abs=1e-5)
+        assert [result["score"] for result in found] == sorted((result["score"] for result in found), reverse=True)
+    assert np.mean(recalls) >= min_recall
+
+def test_oversample_covering_corpus_is_exact(corpus):
+    segments, queries, truth = corpus
+    index = LocalVectorIndex(segments, quantization="binary", oversample=3000 / K)
+    for query, expected in zip(queries[:5], truth[:5]):
+        assert keys(index.search(query, K)) == keys(expected)
+
+def test_unknown_quantization_is_rejected(corpus):
+    with pytest.raises(ValueError):
+        LocalVectorIndex(corpus[0], quantization="int4")
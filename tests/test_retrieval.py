@@ -0,0 +1,48 @@
+import pytest
+import api
+from retrieval import filter_clauses, normalize_filters
+
+def test_normalize_filters():
+    assert normalize_filters(None) is None
+    assert normalize_filters({}) is None
+    assert normalize_filters({"form_type": "10-k", "fiscal_year": [2022, 2023], "fiscal_period": "q1",
+                              "filed_after": "2023-01-01"}) == {
+        "form_type": ["10-K"], "fiscal_year": [2022, 2023], "fiscal_period": ["Q1"], "filed_after": "2023-01-01"
+    }
+
+@pytest.mark.parametrize("filters", [
+    "10-K",
+    {"form": "10-K"},
+    {"form_type": []},
+    {"form_type": 10},
+    {"fiscal_year": "2023"},
+    {"fiscal_year": True},
+    {"filed_after": "January 2023"},
+    {"filed_before": 20230101},
+])
+def test_normalize_filters_rejects_bad_filters(filters):
+    with pytest.raises(ValueError):
+        normalize_filters(filters)
+
+def test_filter_clauses():
+    assert filter_clauses(None) == []
+    filters = normalize_filters({"fiscal_year": 2023, "form_type": "10-Q",
+                                 "filed_after": "2023-04-01", "filed_before": "2023-12-31"})
+    assert filter_clauses(filters) == [
+        {"terms": {"form_type": ["10-Q"]}},
+        {"terms": {"fiscal_year": [2023]}},
+        {"range": {"filing_date": {"gte": "2023-04-01", "lte": "2023-12-31"}}},
+    ]
+
+@pytest.mark.parametrize("path, body", [
+    ("/search", {"query": "Tesla revenue"}),
+    ("/search/batch", {"queries": ["Tesla revenue"]}),
+    ("/search/stream", {"query": "Tesla revenue"}),
+])
+def test_bad_filters_return_400(make_engine, monkeypatch, path, body):
+    engine = make_engine()
+    monkeypatch.setattr(api, "search_engine", engine)
+    response = api.app.test_client().post(path, json={**body, "filters": {"fiscal_year": "2023"}})
+    assert response.status_code == 400
+    assert "fiscal_year" in response.get_json()["error"]
+    assert engine.llm_client.calls == 0
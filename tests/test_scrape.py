@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from scrape import create_session, download_pdf, iter_tesla_sec_filings, load_download_state
+
+class FilingHandler(BaseHTTPRequestHandler):
+    """Serves a listing page and PDFs with ETags, Range and If-Range like ir.tesla.com"""
+    files = {}        # path -> (body, etag)
+    truncate = {}     # path -> bytes to send before dropping the connection, once
+    listing_delay = 0.0
+    log = []          # (method, path, headers, time)
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head):
+        self.log.append((self.command, self.path, dict(self.headers), time.monotonic()))
+        if self.path == "/sec-filings":
+            listings = sum(1 for method, path, _, _ in self.log if path == "/sec-filings")
+            if listings > 1:
+                time.sleep(self.listing_delay)
+            body = "".join(f'<a href="{path}">filing</a>' for path in self.files).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        body, etag = self.files[self.path]
+        start, status = 0, 200
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range", etag) == etag:
+            start, status = int(byte_range[len("bytes="):].split("-")[0]), 206
+        payload = body[start:]
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.end_headers()
+        if head:
+            return
+        cut = self.truncate.pop(self.path, None)
+        self.wfile.write(payload if cut is None else payload[:cut])
+        self.wfile.flush()
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (FilingHandler,), {"files": {}, "truncate": {}, "log": []})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def gets(handler, path):
+    return [headers for method, p, headers, _ in handler.log if method == "GET" and p == path]
+
+def download(url, directory, state):
+    return download_pdf(url, "tsla-10k.pdf", str(directory), 1, create_session(), state=state)
+
+def test_skips_unchanged_file(server, tmp_path):
+    handler, base = server
+    handler.files["/tsla-10k.pdf"] = (b"%PDF-1.4 annual report", '"v1"')
+    state = {}
+    path = download(base + "/tsla-10k.pdf", tmp_path, state)
+    assert open(path, "rb").read() == b"%PDF-1.4 annual report"
+
+    assert download(base + "/tsla-10k.pdf", tmp_path, state) == path
+    assert len(gets(handler, "/tsla-10k.pdf")) == 1
+
+def test_redownloads_changed_file(server, tmp_path):
+    handler, base = server
+    handler.files["/tsla-10k.pdf"] = (b"old report", '"v1"')
+    state = {}
+    download(base + "/tsla-10k.pdf", tmp_path, state)
+    handler.files["/tsla-10k.pdf"] = (b"amended report", '"v2"')
+
+    path = download(base + "/tsla-10k.pdf", tmp_path, state)
+    assert open(path, "rb").read() == b"amended report"
+
+def test_resumes_interrupted_download_with_if_range(server, tmp_path):
+    handler, base = server
+    body = bytes(range(256)) * 100
+    handler.files["/tsla-10k.pdf"] = (body, '"v1"')
+    handler.truncate["/tsla-10k.pdf"] = 10000
+    state = {}
+    assert download(base + "/tsla-10k.pdf", tmp_path, state) is None
+    # The version the partial file holds is recorded before any of it is written
+    assert load_download_state(str(tmp_path))["tsla-10k_page1.pdf"]["part"]["etag"] == '"v1"'
+    offset = os.path.getsize(tmp_path / "tsla-10k_page1.pdf.part")
+    assert offset > 0
+
+    path = download(base + "/tsla-10k.pdf", tmp_path, state)
+    assert open(path, "rb").read() == body
+    resumed = gets(handler, "/tsla-10k.pdf")[-1]
+    assert resumed["Range"] == f"bytes={offset}-"
+    assert resumed["If-Range"] == '"v1"'
+    assert "part" not in state["tsla-10k_page1.pdf"]
+
+def test_restarts_when_file_changed_during_interruption(server, tmp_path):
+    handler, base = server
+    handler.files["/tsla-10k.pdf"] = (b"a" * 50000, '"v1"')
+    handler.truncate["/tsla-10k.pdf"] = 20000
+    state = {}
+    assert download(base + "/tsla-10k.pdf", tmp_path, state) is None
+    assert os.path.getsize(tmp_path / "tsla-10k_page1.pdf.part") > 0
+    handler.files["/tsla-10k.pdf"] = (b"b" * 60000, '"v2"')
+
+    path = download(base + "/tsla-10k.pdf", tmp_path, state)
+    assert open(path, "rb").read() == b"b" * 60000
+
+def test_partial_file_without_validator_is_not_resumed(server, tmp_path):
+    handler, base = server
+    handler.files["/tsla-10k.pdf"] = (b"fresh contents", '"v1"')
+    with open(tmp_path / "tsla-10k_page1.pdf.part", "wb") as f:
+        f.write(b"stale bytes")
+
+    path = download(base + "/tsla-10k.pdf", tmp_path, {})
+    assert open(path, "rb").read() == b"fresh contents"
+    assert "Range" not in gets(handler, "/tsla-10k.pdf")[-1]
+
+def test_downloads_start_before_all_pages_are_listed(server, tmp_path):
+    handler, base = server
+    handler.files["/tsla-10k.pdf"] = (b"report", '"v1"')
+    handler.listing_delay = 0.5
+    started = time.monotonic()
+    first = None
+    paths = []
+    for path in iter_tesla_sec_filings(base + "/sec-filings", str(tmp_path), pages=range(1, 4),
+                                       workers=1, rate_limit=None):
+        first = first or time.monotonic() - started
+        paths.append(os.path.basename(path))
+
+    assert sorted(paths) == ["tsla-10k_page1.pdf", "tsla-10k_page2.pdf", "tsla-10k_page3.pdf"]
+    # Page 1's filing is on disk while pages 2 and 3 are still being listed
+    assert first < 0.5 < time.monotonic() - started
@@ -0,0 +1,74 @@
+import json
+import pytest
+import api
+from stubs import StubInferenceClient
+
+class FailingClient(StubInferenceClient):
+    """Stub LLM that fails after a few streamed tokens, or at once without streaming"""
+
+    def text_generation(self, prompt, stream=False, **kwargs):
+        if not stream:
+            raise RuntimeError("connection reset")
+        tokens = super().text_generation(prompt, stream=True, **kwargs)
+        def generate():
+            for i, token in enumerate(tokens):
+                if i == 3:
+                    raise RuntimeError("connection reset")
+                yield token
+        return generate()
+
+@pytest.fixture
+def busy_engine(make_engine):
+    """An engine whose only LLM slot is taken and which lets no request wait for it"""
+    engine = make_engine(llm_concurrency=1, llm_max_waiters=0)
+    engine.llm_semaphore.acquire()
+    yield engine
+    engine.llm_semaphore.release()
+
+@pytest.fixture
+def client(monkeypatch):
+    def use(engine):
+        monkeypatch.setattr(api, "search_engine", engine)
+        return api.app.test_client()
+    return use
+
+def stream_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_llm_status(make_engine):
+    assert make_engine().search("Tesla total revenues", k=2)["llm_status"] == "ok"
+    assert make_engine().search("Tesla total revenues", k=2, with_llm=False)["llm_status"] is None
+    assert make_engine(llm_client=FailingClient()).search("Tesla total revenues", k=2)["llm_status"] == "failed"
+
+def test_shed_search_reports_skipped(busy_engine, client):
+    response = client(busy_engine).post('/search', json={'query': 'Tesla total revenues'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['vector_results']
+    assert body['llm_analysis'] is None
+    assert body['llm_status'] == 'skipped'
+    assert busy_engine.llm_client.calls == 0
+
+def test_shed_stream_sends_error_event(busy_engine, client):
+    events = stream_events(client(busy_engine).post('/search/stream', json={'query': 'Tesla total revenues'}))
+    assert [event for event, _ in events] == ['vector_results', 'error', 'done']
+    assert events[1][1]['error'] == 'LLM busy'
+    assert events[2][1] == {'llm_analysis': None, 'llm_status': 'skipped'}
+
+def test_failed_stream_is_not_cached(make_engine, client):
+    engine = make_engine(llm_client=FailingClient())
+    events = stream_events(client(engine).post('/search/stream', json={'query': 'Tesla total revenues'}))
+    assert [event for event, _ in events][-2:] == ['error', 'done']
+    assert events[-1][1] == {'llm_analysis': None, 'llm_status': 'failed'}
+    assert len(engine.llm_cache) == 0
+
+def test_shed_batch_entries_report_skipped(busy_engine, client):
+    response = client(busy_engine).post('/search/batch', json={'queries': ['Tesla total revenues', 7]})
+    first, second = response.get_json()['results']
+    assert first['llm_analysis'] is None
+    assert first['llm_status'] == 'skipped'
+    assert 'error' in second
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from cache import SemanticCache, query_literals
+from embedding_store import remove_store, save_store, store_paths
+from retrieval import LocalVectorIndex
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def cached_engine(make_engine):
+    # A low threshold, so only the query literals keep these queries apart
+    return make_engine(semantic_cache=SemanticCache(maxsize=16, threshold=0.5))
+
+def test_query_literals():
+    assert query_literals("Tesla revenue 2023") == ("2023",)
+    assert query_literals("Q3 deliveries, Sept. 2022 vs September") == ("2022", "q3", "sep")
+    assert query_literals("capex of $1,000.5 million.") == ("1000.5",)
+    assert query_literals("maybe the market moved") == ()
+
+def test_queries_differing_in_a_number_do_not_share_an_entry(cached_engine):
+    first = cached_engine.search("Tesla revenue 2022", k=2)
+    second = cached_engine.search("Tesla revenue 2023", k=2)
+    assert "semantic_cache" not in second
+    assert cached_engine.llm_client.calls == 2
+    assert second["vector_results"] and first["llm_analysis"]
+
+    paraphrase = cached_engine.search("tesla revenue in 2023", k=2)
+    assert paraphrase["semantic_cache"]["query"] == "Tesla revenue 2023"
+    assert cached_engine.llm_client.calls == 2
+
+def test_queries_differing_in_a_quarter_do_not_share_an_entry(cached_engine):
+    cached_engine.search("Tesla deliveries Q1", k=2)
+    assert "semantic_cache" not in cached_engine.search("Tesla deliveries Q2", k=2)
+
+def test_semantic_cache_is_off_by_default(make_engine, tmp_path):
+    assert make_engine().semantic_cache is None
+
+    def api_semantic_cache(**env):
+        environ = {key: value for key, value in os.environ.items() if not key.startswith("SEMANTIC_CACHE")}
+        return subprocess.run(
+            [sys.executable, "-c", "import api; print(type(api.semantic_cache).__name__)"],
+            cwd=tmp_path, env={**environ, "PYTHONPATH": REPO, **env},
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    assert api_semantic_cache() == "NoneType"
+    assert api_semantic_cache(SEMANTIC_CACHE_SIZE="16") == "SemanticCache"
+
+def test_store_version_changes_when_a_filing_is_removed(tmp_path):
+    vectors = np.eye(3, 8, dtype=np.float32)
+    for stem in ("tsla-2022", "tsla-2023"):
+        save_store(str(tmp_path), stem, vectors, [{"content": "", "file_name": f"{stem}.pdf", "chunk_index": i}
+                                                  for i in range(3)])
+    before = LocalVectorIndex.from_store(str(tmp_path)).version()
+    assert LocalVectorIndex.from_store(str(tmp_path)).version() == before
+
+    # The newest store is untouched, so only the set of stores tells the versions apart
+    os.utime(store_paths(str(tmp_path), "tsla-2022")[0], (0, 0))
+    before = LocalVectorIndex.from_store(str(tmp_path)).version()
+    remove_store(str(tmp_path), "tsla-2022")
+    assert LocalVectorIndex.from_store(str(tmp_path)).version() != before